@@ -0,0 +1,209 @@
+"""
+Startup-Time Benchmark
+========================
+Measures how long each entry point takes to start on a cheap code path
+(--help, --list-devices) and which modules it imports on the way, using
+`python -X importtime`.
+
+Each entry point has a regression budget:
+  - wall-clock startup must stay under --budget seconds (default: 1.0)
+  - none of the heavy libraries (librosa, pandas, matplotlib, TensorFlow,
+    SciPy, soundfile) may be imported; scripts load them lazily through
+    scripts/_lazy.py on the code paths that need them
+  - with --baseline, startup may not exceed the saved time by more than
+    --tolerance (default: 25%)
+
+Usage:
+    python benchmark_startup.py
+    python benchmark_startup.py --repeat 5 --top 10
+    python benchmark_startup.py --save_baseline results/startup_baseline.json
+    python benchmark_startup.py --baseline results/startup_baseline.json
+
+Exits with status 1 when any entry point is over budget.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+
+# (entry point, arguments) measured on their cheapest path
+ENTRY_POINTS = [
+    ("run_pipeline.py", ["--help"]),
+    ("scripts/01_segment_audio.py", ["--help"]),
+    ("scripts/02_classify_segments.py", ["--help"]),
+    ("scripts/03_extract_esc50_noise.py", ["--help"]),
+    ("scripts/04_build_dataset.py", ["--help"]),
+    ("scripts/05_train_and_evaluate.py", ["--help"]),
+    ("scripts/06_analyze_results.py", ["--help"]),
+    ("scripts/07_tune_thresholds.py", ["--help"]),
+    ("scripts/08_visualize_all.py", ["--help"]),
+    ("scripts/09_live_recognition.py", ["--help"]),
+    ("scripts/09_live_recognition.py", ["--list-devices"]),
+]
+
+HEAVY_MODULES = ("librosa", "pandas", "matplotlib", "tensorflow", "scipy",
+                 "soundfile", "sklearn")
+
+DEFAULT_BUDGET_S = 1.0
+DEFAULT_TOLERANCE = 0.25
+
+
+def parse_importtime(stderr: str) -> list:
+    """
+    (module, self_us, cumulative_us, depth) for each `-X importtime` line.
+
+    depth 0 is a top-level import; nested imports are indented by two
+    spaces per level in the module column.
+    """
+    records = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        module = fields[2].rstrip()
+        depth = (len(module) - len(module.lstrip(" "))) // 2 - 1
+        try:
+            records.append((module.strip(), int(fields[0]), int(fields[1]),
+                            max(depth, 0)))
+        except ValueError:
+            continue
+    return records
+
+
+def measure(script: str, argv: list, repeat: int = 3) -> dict:
+    """
+    Start one entry point `repeat` times.
+
+    Returns:
+        dict with keys: entry, ok, wall_s (median), import_s (cumulative of
+        top-level imports, last run), top (top-level imports by cost),
+        heavy (heavy modules that were imported), error
+    """
+    cmd = [sys.executable, "-X", "importtime", str(PROJECT_ROOT / script)] + argv
+    walls = []
+    result = {"entry": f"{script} {' '.join(argv)}".strip(), "ok": True,
+              "error": None}
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        proc = subprocess.run(cmd, cwd=PROJECT_ROOT, capture_output=True,
+                              text=True)
+        walls.append(time.perf_counter() - t0)
+        if proc.returncode != 0:
+            result["ok"] = False
+            result["error"] = (proc.stderr.strip().splitlines() or ["?"])[-1]
+            break
+
+    records = parse_importtime(proc.stderr)
+    top_level = [(name, cum) for name, _, cum, depth in records if depth == 0]
+    result["wall_s"] = statistics.median(walls)
+    result["import_s"] = sum(cum for _, cum in top_level) / 1e6
+    result["top"] = sorted(top_level, key=lambda r: r[1], reverse=True)
+    loaded = {name.split(".")[0] for name, _, _, _ in records}
+    result["heavy"] = sorted(loaded & set(HEAVY_MODULES))
+    return result
+
+
+def check_budget(result: dict, budget_s: float, baseline: dict = None,
+                 tolerance: float = DEFAULT_TOLERANCE) -> list:
+    """Budget violations for one measured entry point (empty if none)."""
+    problems = []
+    if not result["ok"]:
+        problems.append(f"failed: {result['error']}")
+        return problems
+    if result["wall_s"] > budget_s:
+        problems.append(f"{result['wall_s']:.2f}s > budget {budget_s:.2f}s")
+    if result["heavy"]:
+        problems.append(f"imports heavy modules: {', '.join(result['heavy'])}")
+    if baseline and result["entry"] in baseline:
+        limit = baseline[result["entry"]] * (1 + tolerance)
+        if result["wall_s"] > limit:
+            problems.append(f"{result['wall_s']:.2f}s > baseline "
+                            f"{baseline[result['entry']]:.2f}s +{tolerance:.0%}")
+    return problems
+
+
+def run_benchmark(repeat: int = 3, top: int = 5,
+                  budget_s: float = DEFAULT_BUDGET_S,
+                  baseline_path: Path = None, save_baseline: Path = None,
+                  tolerance: float = DEFAULT_TOLERANCE) -> bool:
+    """Measure every entry point, print the report, return True if all pass."""
+    print("=" * 70)
+    print("STARTUP BENCHMARK (python -X importtime)")
+    print(f"  Repeats: {repeat} | Budget: {budget_s:.2f}s | "
+          f"Heavy modules: {', '.join(HEAVY_MODULES)}")
+    print("=" * 70)
+
+    baseline = None
+    if baseline_path is not None:
+        baseline = json.loads(Path(baseline_path).read_text())
+
+    results = []
+    failures = 0
+    for script, argv in ENTRY_POINTS:
+        result = measure(script, argv, repeat)
+        results.append(result)
+        problems = check_budget(result, budget_s, baseline, tolerance)
+        failures += bool(problems)
+
+        status = "OK" if not problems else "OVER BUDGET"
+        print(f"\n  {result['entry']}")
+        print(f"    wall {result.get('wall_s', 0):6.3f}s | "
+              f"imports {result.get('import_s', 0):6.3f}s | {status}")
+        for name, cum in result.get("top", [])[:top]:
+            print(f"      {cum / 1000:8.1f} ms  {name}")
+        for problem in problems:
+            print(f"    [FAIL] {problem}")
+
+    if save_baseline is not None:
+        save_baseline = Path(save_baseline)
+        save_baseline.parent.mkdir(parents=True, exist_ok=True)
+        save_baseline.write_text(json.dumps(
+            {r["entry"]: round(r["wall_s"], 4) for r in results if r["ok"]},
+            indent=2))
+        print(f"\n  Baseline saved: {save_baseline}")
+
+    print(f"\n{'=' * 70}")
+    print(f"  {len(results) - failures}/{len(results)} entry points within budget")
+    print(f"{'=' * 70}")
+    return failures == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure script startup time and heavy imports."
+    )
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per entry point; the median is reported (default: 3)")
+    parser.add_argument("--top", type=int, default=5,
+                        help="Slowest top-level imports shown per entry point (default: 5)")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_S,
+                        help=f"Max startup seconds per entry point (default: {DEFAULT_BUDGET_S})")
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="JSON of previous startup times to compare against")
+    parser.add_argument("--save_baseline", type=str, default=None,
+                        help="Write this run's startup times as a baseline JSON")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed slowdown vs. --baseline (default: 0.25 = 25%%)")
+    args = parser.parse_args()
+
+    ok = run_benchmark(
+        repeat=args.repeat,
+        top=args.top,
+        budget_s=args.budget,
+        baseline_path=Path(args.baseline) if args.baseline else None,
+        save_baseline=Path(args.save_baseline) if args.save_baseline else None,
+        tolerance=args.tolerance,
+    )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
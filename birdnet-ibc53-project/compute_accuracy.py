@@ -1,58 +1,106 @@
-import os
-import pandas as pd
-import glob
-from collections import defaultdict
+"""
+File-Level Top-1 Accuracy
+===========================
+For every experiment, each recording's predicted species is the majority
+vote over its per-segment top-1 detections (highest confidence per
+start/end window). Ground truth is the species folder of the result CSV,
+or of the recording itself for experiment-level detections.csv files.
+
+Each experiment is read in one layout only, like the original script's
+<species>/*.BirdNET.results.csv: detections.csv when the in-process engine
+wrote it, otherwise the per-recording BirdNET CSVs. Results are never
+counted from both.
+
+Works on the consolidated detections table from scripts/_detections.py:
+one groupby on (recording, start, end) picks the segment top-1s and one
+on (recording, species) does the vote, per experiment.
+
+Usage:
+    python compute_accuracy.py
+    python compute_accuracy.py --results_dir results --experiments Exp1_NoNoise Exp2_WithNoise
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from configs.config import RESULTS_DIR
+from scripts._detections import load_experiment_detections
 
-RESULTS_DIR = "/Users/adityas/Desktop/FALCON_DL/FALCON_DL/birdnet-ibc53-project/results"
 EXPERIMENTS = ["baseline", "Exp1_NoNoise", "Exp2_WithNoise", "Exp3_FewShot_10", "Exp3_FewShot_25", "Exp3_FewShot_50"]
 
-def analyze_experiment(exp_name):
-    exp_dir = os.path.join(RESULTS_DIR, exp_name)
-    species_dirs = [d for d in os.listdir(exp_dir) if os.path.isdir(os.path.join(exp_dir, d))]
+
+def recording_ids(detections) -> np.ndarray:
+    """
+    One integer id per recording.
+
+    Per-recording CSVs (<species>/<file>.csv) are their own recording;
+    rows of an experiment-level CSV are told apart by their filepath.
+    """
+    source = detections["source_file"].cat
+    nested = np.array(["/" in str(c) for c in source.categories], dtype=bool)
+    source_codes = source.codes.to_numpy().astype(np.int64)
+    path_codes = detections["filepath"].cat.codes.to_numpy().astype(np.int64)
+    return np.where(nested[source_codes], source_codes,
+                    len(source.categories) + 1 + path_codes)
+
+
+def file_predictions(detections):
+    """
+    (recording, true_species, predicted_species) per recording.
+
+    Ties keep the old per-file semantics: idxmax picks the first row of
+    a window, and the vote picks the species whose top-1 came first.
+    """
+    det = detections.assign(recording=recording_ids(detections))
+
+    # Segment top-1: highest-confidence row per (recording, start, end)
+    top1_idx = det.groupby(["recording", "start", "end"], sort=True)["confidence"].idxmax()
+    top1 = det.loc[top1_idx.to_numpy(), ["recording", "true_species", "scientific_name"]]
+    top1 = top1.assign(order=np.arange(len(top1)))
+
+    # File-level: species with most top-1 windows, earliest first on ties
+    votes = top1.groupby(["recording", "scientific_name"], observed=True).agg(
+        true_species=("true_species", "first"),
+        count=("order", "size"),
+        first=("order", "min"),
+    ).reset_index()
+    votes = votes.sort_values(["recording", "count", "first"],
+                              ascending=[True, False, True], kind="stable")
+    winners = votes.drop_duplicates("recording")
+    return winners.rename(columns={"scientific_name": "predicted_species"})[
+        ["recording", "true_species", "predicted_species"]]
+
+
+def analyze_experiment(exp_dir: Path, use_cache: bool = True) -> dict:
+    detections = load_experiment_detections(exp_dir, use_cache=use_cache)
+    species_dirs = [d.name for d in exp_dir.iterdir() if d.is_dir()]
+
+    true_species = detections["true_species"].astype(str).to_numpy()
+    predicted = detections["scientific_name"].astype(str).to_numpy()
+    confidence = detections["confidence"].to_numpy()
+    correct_mask = predicted == true_species
+    mean_correct_conf = float(confidence[correct_mask].mean()) if correct_mask.any() else 0.0
+    mean_incorrect_conf = float(confidence[~correct_mask].mean()) if (~correct_mask).any() else 0.0
+
+    files = file_predictions(detections)
+    files_true = files["true_species"].astype(str)
+    files_hit = files_true.to_numpy() == files["predicted_species"].astype(str).to_numpy()
+    per_species = (
+        files.assign(hit=files_hit, true_species=files_true)
+        .groupby("true_species")["hit"].agg(["sum", "size"])
+    )
 
     species_results = {}
-    all_correct_conf = []
-    all_incorrect_conf = []
-    total_detections = 0
-
-    for species in sorted(species_dirs):
-        sp_dir = os.path.join(exp_dir, species)
-        csv_files = glob.glob(os.path.join(sp_dir, "*.BirdNET.results.csv"))
-
-        files_correct = 0
-        files_total = 0
-
-        for csv_file in csv_files:
-            try:
-                df = pd.read_csv(csv_file)
-            except:
-                continue
-            if df.empty:
-                continue
-
-            total_detections += len(df)
-
-            # Confidence tracking
-            correct_mask = df["Scientific name"] == species
-            correct_confs = df.loc[correct_mask, "Confidence"].tolist()
-            incorrect_confs = df.loc[~correct_mask, "Confidence"].tolist()
-            all_correct_conf.extend(correct_confs)
-            all_incorrect_conf.extend(incorrect_confs)
-
-            # Top-1 per segment: keep highest confidence per segment
-            df_top1 = df.loc[df.groupby(["Start (s)", "End (s)"])["Confidence"].idxmax()]
-
-            # File-level: species with most top-1 detections
-            species_counts = df_top1["Scientific name"].value_counts()
-            predicted_species = species_counts.index[0]
-
-            files_total += 1
-            if predicted_species == species:
-                files_correct += 1
-
-        if files_total > 0:
-            acc = files_correct / files_total
-            species_results[species] = (files_correct, files_total, acc)
+    for species in sorted(set(species_dirs) | set(per_species.index)):
+        if species in per_species.index:
+            correct, total = (int(v) for v in per_species.loc[species])
+            species_results[species] = (correct, total, correct / total)
         else:
             species_results[species] = (0, 0, 0.0)
 
@@ -61,9 +109,6 @@ def analyze_experiment(exp_name):
     total_files = sum(v[1] for v in species_results.values())
     overall_acc = total_correct / total_files if total_files > 0 else 0.0
 
-    mean_correct_conf = sum(all_correct_conf) / len(all_correct_conf) if all_correct_conf else 0.0
-    mean_incorrect_conf = sum(all_incorrect_conf) / len(all_incorrect_conf) if all_incorrect_conf else 0.0
-
     species_above_50 = [s for s, v in species_results.items() if v[2] > 0.5]
 
     # Best/worst
@@ -75,7 +120,7 @@ def analyze_experiment(exp_name):
         "overall_acc": overall_acc,
         "total_correct": total_correct,
         "total_files": total_files,
-        "total_detections": total_detections,
+        "total_detections": len(detections),
         "mean_correct_conf": mean_correct_conf,
         "mean_incorrect_conf": mean_incorrect_conf,
         "num_species_above_50": len(species_above_50),
@@ -85,45 +130,74 @@ def analyze_experiment(exp_name):
         "species_results": species_results,
     }
 
-# Run all experiments
-print("=" * 120)
-print(f"{'Experiment':<22} {'Overall Acc':>11} {'Correct/Total':>14} {'Detections':>11} {'Conf(correct)':>14} {'Conf(incorrect)':>16} {'Sp>50%':>7}")
-print("=" * 120)
-
-all_results = {}
-for exp in EXPERIMENTS:
-    r = analyze_experiment(exp)
-    all_results[exp] = r
-    print(f"{exp:<22} {r['overall_acc']:>10.1%} {r['total_correct']:>6}/{r['total_files']:<6} {r['total_detections']:>11,} {r['mean_correct_conf']:>14.4f} {r['mean_incorrect_conf']:>16.4f} {r['num_species_above_50']:>4}/{r['total_species']}")
-
-print("=" * 120)
-
-# Per-species detail
-print("\n\nPER-SPECIES ACCURACY (all experiments side by side):")
-print("-" * 140)
-header = f"{'Species':<35}"
-for exp in EXPERIMENTS:
-    short = exp.replace("Exp3_FewShot_", "FS").replace("Exp1_NoNoise", "Exp1").replace("Exp2_WithNoise", "Exp2")
-    header += f" {short:>12}"
-print(header)
-print("-" * 140)
-
-all_species = sorted(all_results["baseline"]["species_results"].keys())
-for sp in all_species:
-    row = f"{sp:<35}"
-    for exp in EXPERIMENTS:
-        sr = all_results[exp]["species_results"].get(sp)
-        if sr and sr[1] > 0:
-            row += f" {sr[2]:>11.0%}"
-        else:
-            row += f" {'N/A':>11}"
-    print(row)
-
-# Best and worst per experiment
-print("\n\nBEST & WORST SPECIES PER EXPERIMENT:")
-print("-" * 100)
-for exp in EXPERIMENTS:
-    r = all_results[exp]
-    print(f"\n{exp}:")
-    print(f"  Best:  ", ", ".join(f"{s} ({v[2]:.0%})" for s, v in r["best_3"]))
-    print(f"  Worst: ", ", ".join(f"{s} ({v[2]:.0%})" for s, v in r["worst_3"]))
+
+def print_report(all_results: dict):
+    experiments = list(all_results)
+
+    print("=" * 120)
+    print(f"{'Experiment':<22} {'Overall Acc':>11} {'Correct/Total':>14} {'Detections':>11} {'Conf(correct)':>14} {'Conf(incorrect)':>16} {'Sp>50%':>7}")
+    print("=" * 120)
+    for exp, r in all_results.items():
+        print(f"{exp:<22} {r['overall_acc']:>10.1%} {r['total_correct']:>6}/{r['total_files']:<6} {r['total_detections']:>11,} {r['mean_correct_conf']:>14.4f} {r['mean_incorrect_conf']:>16.4f} {r['num_species_above_50']:>4}/{r['total_species']}")
+    print("=" * 120)
+
+    # Per-species detail
+    print("\n\nPER-SPECIES ACCURACY (all experiments side by side):")
+    print("-" * 140)
+    header = f"{'Species':<35}"
+    for exp in experiments:
+        short = exp.replace("Exp3_FewShot_", "FS").replace("Exp1_NoNoise", "Exp1").replace("Exp2_WithNoise", "Exp2")
+        header += f" {short:>12}"
+    print(header)
+    print("-" * 140)
+
+    all_species = sorted(all_results[experiments[0]]["species_results"].keys())
+    for sp in all_species:
+        row = f"{sp:<35}"
+        for exp in experiments:
+            sr = all_results[exp]["species_results"].get(sp)
+            if sr and sr[1] > 0:
+                row += f" {sr[2]:>11.0%}"
+            else:
+                row += f" {'N/A':>11}"
+        print(row)
+
+    # Best and worst per experiment
+    print("\n\nBEST & WORST SPECIES PER EXPERIMENT:")
+    print("-" * 100)
+    for exp, r in all_results.items():
+        print(f"\n{exp}:")
+        print(f"  Best:  ", ", ".join(f"{s} ({v[2]:.0%})" for s, v in r["best_3"]))
+        print(f"  Worst: ", ", ".join(f"{s} ({v[2]:.0%})" for s, v in r["worst_3"]))
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(
+        description="File-level top-1 accuracy for every experiment."
+    )
+    parser.add_argument("--results_dir", type=str, default=str(RESULTS_DIR),
+                        help="Path to results directory")
+    parser.add_argument("--experiments", nargs="+", default=EXPERIMENTS,
+                        help="Experiment folders to score, in report order")
+    parser.add_argument("--no_cache", action="store_true",
+                        help="Re-read every result CSV instead of the consolidated "
+                             "detections.parquet per experiment")
+    args = parser.parse_args(argv)
+
+    results_dir = Path(args.results_dir)
+    all_results = {}
+    for exp in args.experiments:
+        exp_dir = results_dir / exp
+        if not exp_dir.is_dir():
+            print(f"[WARN] Skipping {exp}: {exp_dir} not found")
+            continue
+        all_results[exp] = analyze_experiment(exp_dir, use_cache=not args.no_cache)
+
+    if not all_results:
+        print(f"[ERROR] No experiment results found in {results_dir}")
+        sys.exit(1)
+    print_report(all_results)
+
+
+if __name__ == "__main__":
+    main()
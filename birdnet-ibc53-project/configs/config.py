@@ -30,12 +30,17 @@ PROCESSED_DIR = DATA_DIR / "processed"                   # Full noise-aware data
 PROCESSED_NO_NOISE_DIR = DATA_DIR / "processed_no_noise" # 30 species only (Experiment 1)
 SEGMENTS_DIR = DATA_DIR / "segments"                     # Intermediate segmented audio
 MYSTERY_DIR = DATA_DIR / "mystery_processed"             # Mystery mystery folder processing output
+MANIFESTS_DIR = DATA_DIR / "manifests"                   # Dataset variant manifests (script 04)
+AUDIO_CACHE_DIR = DATA_DIR / "cache" / "audio"           # Decoded 48 kHz audio (.npy, memory-mapped)
+AUDIO_CACHE_MAX_BYTES = 20 * 1024 ** 3                   # Least recently used entries evicted above this
 
 # ============================================================
 # MODEL & RESULTS PATHS
 # ============================================================
 MODELS_DIR = PROJECT_ROOT / "models"
 RESULTS_DIR = PROJECT_ROOT / "results"
+FEATURE_CACHE_PATH = RESULTS_DIR / "feature_cache.sqlite"  # Stage 2 / tuning feature store
+PIPELINE_STATE_PATH = RESULTS_DIR / "pipeline_state.json"  # run_pipeline.py stage fingerprints
 
 # ============================================================
 # AUDIO PARAMETERS
@@ -168,7 +173,7 @@ def ensure_dirs():
     dirs = [
         DATA_DIR, IBC53_RAW_DIR, ESC50_DIR,
         PROCESSED_DIR, PROCESSED_NO_NOISE_DIR,
-        SEGMENTS_DIR, MYSTERY_DIR,
+        SEGMENTS_DIR, MYSTERY_DIR, MANIFESTS_DIR,
         MODELS_DIR, RESULTS_DIR, LOG_DIR,
     ]
     for d in dirs:
@@ -8,6 +8,9 @@ Usage:
     python run_pipeline.py --stage 1          # Run only Stage 1 (segmentation)
     python run_pipeline.py --stage 1-4        # Run Stages 1 through 4
     python run_pipeline.py --stage 5 --experiment exp2  # Run only Exp 2
+    python run_pipeline.py --stage 1-4 --fuse 1-2       # Stages 1+2 in one decode pass
+    python run_pipeline.py --force            # Rerun even up-to-date stages
+    python run_pipeline.py --isolate          # One subprocess per stage
 
 Stages:
     1. Audio Segmentation       (01_segment_audio.py)
@@ -17,17 +20,205 @@ Stages:
     5. Training & Evaluation    (05_train_and_evaluate.py)
     6. Results Analysis         (06_analyze_results.py)
     7. Threshold Tuning         (07_tune_thresholds.py)  [optional, run separately]
+
+With --fuse 1-2, Stages 1 and 2 run as a single pass of 01_segment_audio.py
+--classify: every recording is decoded once, windows are classified in memory
+and only bird/noise segments are written to disk.
+
+Stages are incremental. After a stage succeeds, its fingerprint is stored in
+results/pipeline_state.json. The fingerprint covers the script and helper
+hashes, the configs/config.py values it reads, its arguments and the
+mtime/size of its input files. A listing of the files the stage wrote is
+stored with it. A stage is skipped only when its fingerprint matches and
+its outputs are unchanged, so deleting or editing data/segments,
+data/processed, a results folder, etc. reruns the stage that made them.
+A stage that reruns also reruns its downstream stages. With --isolate,
+independent stages (2 and 3) run concurrently.
+
+Stages run in-process by default: each stage module is imported once and its
+main() called directly, so librosa, pandas and TensorFlow are loaded a single
+time. In-process stages run one at a time on the main thread, so their
+output never interleaves and Stage 1's worker pool forks from a
+single-threaded process. --isolate runs every stage as a separate Python
+subprocess instead, and only then are --parallel_stages stages concurrent.
 """
 
 import argparse
+import hashlib
+import importlib
+import json
 import subprocess
 import sys
 import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
 
 PROJECT_ROOT = Path(__file__).resolve().parent
 SCRIPTS_DIR = PROJECT_ROOT / "scripts"
 
+sys.path.insert(0, str(PROJECT_ROOT))
+from configs import config
+from configs.config import (
+    IBC53_RAW_DIR, ESC50_AUDIO_DIR, ESC50_META_CSV, SEGMENTS_DIR, PROCESSED_DIR,
+    PROCESSED_NO_NOISE_DIR, DATA_DIR, RESULTS_DIR, NOISE_FOLDER_NAME,
+    MANIFESTS_DIR, PIPELINE_STATE_PATH,
+)
+
+
+CLASSIFICATIONS_CSV = RESULTS_DIR / "segment_classifications.csv"
+
+# Stage graph. Each stage lists:
+#   deps:   stages whose outputs it reads
+#   code:   files whose contents define its behaviour (script + helpers)
+#   config: configs/config.py names that affect its output
+#   inputs: (directory, glob, excluded top-level folders) file sets it reads
+#   outputs: file sets it writes, in the same form
+STAGES = {
+    1: {
+        "script": "01_segment_audio.py",
+        "description": "Audio Segmentation (3-second chunks)",
+        "deps": [],
+        "code": ["01_segment_audio.py", "_classify_lib.py", "_audio_cache.py"],
+        "config": ["SAMPLE_RATE", "SEGMENT_LENGTH", "MIN_SEGMENT_RATIO",
+                   "SPECIES_NAMES", "MYSTERY_FOLDER_NAME"],
+        "inputs": [(IBC53_RAW_DIR, "**/*", ())],
+        "outputs": [(SEGMENTS_DIR, "**/*.wav", ())],
+    },
+    2: {
+        "script": "02_classify_segments.py",
+        "description": "Energy-Based Noise Detection",
+        "deps": [1],
+        "code": ["02_classify_segments.py", "_classify_lib.py", "_feature_cache.py"],
+        "config": ["SAMPLE_RATE", "SILENCE_RMS_THRESHOLD",
+                   "NOISE_FLATNESS_THRESHOLD", "NOISE_ZCR_THRESHOLD"],
+        "inputs": [(SEGMENTS_DIR, "**/*.wav", ())],
+        "outputs": [(RESULTS_DIR, "segment_classifications.*", ())],
+    },
+    3: {
+        "script": "03_extract_esc50_noise.py",
+        "description": "ESC-50 Noise Extraction",
+        "deps": [],
+        "code": ["03_extract_esc50_noise.py"],
+        "config": ["ESC50_NOISE_CATEGORIES", "NOISE_FOLDER_NAME"],
+        "inputs": [(ESC50_AUDIO_DIR, "*.wav", ()),
+                   (ESC50_META_CSV.parent, ESC50_META_CSV.name, ())],
+        "outputs": [(PROCESSED_DIR / NOISE_FOLDER_NAME, "esc50_*.wav", ())],
+    },
+    4: {
+        "script": "04_build_dataset.py",
+        "description": "Build BirdNET-Compatible Dataset",
+        "deps": [2, 3],
+        "code": ["04_build_dataset.py", "_classify_lib.py"],
+        "config": ["SPECIES_NAMES", "NOISE_FOLDER_NAME", "MYSTERY_FOLDER_NAME"],
+        "inputs": [(RESULTS_DIR, "segment_classifications.*", ()),
+                   (SEGMENTS_DIR, "**/*.wav", ()),
+                   (PROCESSED_DIR / NOISE_FOLDER_NAME, "esc50_*.wav", ())],
+        "outputs": [(PROCESSED_DIR, "**/*", ()),
+                    (PROCESSED_NO_NOISE_DIR, "**/*", ()),
+                    (DATA_DIR / "fewshot_subsets", "**/*", ()),
+                    (MANIFESTS_DIR, "*", ())],
+    },
+    5: {
+        "script": "05_train_and_evaluate.py",
+        "description": "BirdNET Training & Evaluation",
+        "deps": [4],
+        "code": ["05_train_and_evaluate.py", "_inference_lib.py", "_audio_cache.py"],
+        "config": ["EXPERIMENTS", "MIN_CONFIDENCE", "SAMPLE_RATE", "SEGMENT_LENGTH"],
+        "inputs": [(PROCESSED_DIR, "**/*", ()),
+                   (PROCESSED_NO_NOISE_DIR, "**/*", ()),
+                   (DATA_DIR / "fewshot_subsets", "**/*", ()),
+                   (IBC53_RAW_DIR, "**/*", ())],
+        # Result CSVs of every experiment (Stage 6 only adds Parquet caches)
+        "outputs": [(RESULTS_DIR, "*/**/*.csv", ("analysis", "tuning"))],
+    },
+    6: {
+        "script": "06_analyze_results.py",
+        "description": "Results Analysis & Comparison",
+        "deps": [5],
+        "code": ["06_analyze_results.py", "_detections.py"],
+        "config": ["SPECIES_NAMES", "NOISE_FOLDER_NAME", "MIN_CONFIDENCE"],
+        "inputs": [(RESULTS_DIR, "*/**/*.csv", ("analysis", "tuning"))],
+        "outputs": [(RESULTS_DIR / "analysis", "**/*", ())],
+    },
+}
+
+
+# ============================================================
+# Fingerprints
+# ============================================================
+
+def file_listing(root: Path, pattern: str, exclude: tuple = ()) -> list:
+    """[relative path, mtime_ns, size] for every file matching pattern."""
+    if not root.is_dir():
+        return []
+    listing = []
+    for f in root.glob(pattern):
+        rel = f.relative_to(root)
+        if rel.parts[0] in exclude or not f.is_file():
+            continue
+        st = f.stat()
+        listing.append([rel.as_posix(), st.st_mtime_ns, st.st_size])
+    return sorted(listing)
+
+
+def stage_fingerprint(stage: dict, args: list) -> str:
+    """
+    SHA-256 over everything that determines a stage's output: the code it
+    runs, the config values it reads, its arguments and the stat of every
+    input file.
+    """
+    h = hashlib.sha256()
+    for name in stage["code"]:
+        path = SCRIPTS_DIR / name
+        h.update(name.encode())
+        h.update(path.read_bytes() if path.is_file() else b"")
+    h.update(json.dumps({
+        "config": {k: getattr(config, k, None) for k in stage["config"]},
+        "args": args,
+    }, sort_keys=True, default=str).encode())
+    h.update(listing_digest(stage["inputs"]).encode())
+    return h.hexdigest()
+
+
+def listing_digest(file_sets: list) -> str:
+    """SHA-256 over the file_listing() of each (root, pattern, exclude) set."""
+    h = hashlib.sha256()
+    for root, pattern, exclude in file_sets:
+        h.update(f"{root}|{pattern}".encode())
+        h.update(json.dumps(file_listing(root, pattern, exclude)).encode())
+    return h.hexdigest()
+
+
+def is_up_to_date(n: int, stage: dict, recorded, fingerprint: str) -> bool:
+    """
+    True when recorded (the state entry of stage n's last successful run)
+    has this fingerprint and the stage's outputs are still as it left them.
+    """
+    if not isinstance(recorded, dict) or recorded.get("fingerprint") != fingerprint:
+        return False
+    if recorded.get("outputs") != listing_digest(stage["outputs"]):
+        print(f"\n[STALE] Stage {n}: outputs missing or changed since its last run")
+        return False
+    return True
+
+
+def load_state(path: Path = PIPELINE_STATE_PATH) -> dict:
+    """
+    {stage key: {"fingerprint", "outputs"}} of the last successful run of
+    each stage.
+    """
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state: dict, path: Path = PIPELINE_STATE_PATH):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, indent=2, sort_keys=True))
+    tmp.replace(path)
+
 
 def run_stage(script_name: str, extra_args: list = None, description: str = ""):
     """Run a pipeline script."""
@@ -50,6 +241,38 @@ def run_stage(script_name: str, extra_args: list = None, description: str = ""):
     return True
 
 
+def run_stage_inprocess(script_name: str, extra_args: list = None,
+                        description: str = ""):
+    """
+    Run a pipeline script inside this interpreter.
+
+    The stage module is imported once (later stages reuse already-loaded
+    librosa, pandas, TensorFlow, ...) and its main(argv) is called, which
+    parses the same arguments as the command line and calls the stage's
+    run_* entry function.
+    """
+    print(f"\n{'#' * 70}")
+    print(f"# STAGE: {description}")
+    print(f"# Script: {script_name} (in-process)")
+    print(f"{'#' * 70}\n")
+
+    try:
+        module = importlib.import_module(f"scripts.{Path(script_name).stem}")
+        module.main(list(extra_args or []))
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            print(f"\n[ERROR] Stage failed: {description}")
+            print(f"  Script: {script_name}")
+            print(f"  Exit code: {e.code}")
+            return False
+    except Exception as e:
+        print(f"\n[ERROR] Stage failed: {description}")
+        print(f"  Script: {script_name}")
+        print(f"  {type(e).__name__}: {e}")
+        return False
+    return True
+
+
 def parse_stage_range(stage_str: str) -> list:
     """Parse stage argument like '1', '1-4', '2-6'."""
     if "-" in stage_str:
@@ -59,6 +282,135 @@ def parse_stage_range(stage_str: str) -> list:
         return [int(stage_str)]
 
 
+def stage_args(args) -> dict:
+    """
+    Command-line arguments per stage, split into those that change the
+    stage's output (fingerprinted) and pure performance knobs (not).
+
+    Returns:
+        {stage: (args, perf_args)}
+    """
+    stage_5 = ["--experiment", args.experiment]
+    if args.autotune:
+        stage_5.append("--autotune")
+    perf_5 = ["--max_parallel", str(args.max_parallel)]
+    if args.threads_per_job:
+        perf_5 += ["--threads_per_job", str(args.threads_per_job)]
+
+    stage_4 = ["--link-mode", args.link_mode]
+    if args.build_fewshot:
+        stage_4.append("--build_fewshot")
+
+    return {
+        1: ([], ["--workers", str(args.workers)]),
+        2: ([], []),
+        3: ([], []),
+        4: (stage_4, []),
+        5: (stage_5, perf_5),
+        6: ([], []),
+    }
+
+
+def plan_stages(stages: list, fuse_1_2: bool = False) -> dict:
+    """
+    The stage graph restricted to the selected stages.
+
+    Dependencies on unselected stages are dropped (their outputs are taken
+    as given). With fuse_1_2, stage 1 runs 01_segment_audio.py --classify
+    and absorbs stage 2: its config and code, and its dependents.
+    """
+    plan = {n: dict(STAGES[n]) for n in stages if n in STAGES}
+    if fuse_1_2:
+        fused = plan[1]
+        fused["description"] = "Fused Segmentation + Noise Detection (single pass)"
+        fused["code"] = sorted(set(STAGES[1]["code"]) | set(STAGES[2]["code"]))
+        fused["config"] = STAGES[1]["config"] + STAGES[2]["config"]
+        fused["outputs"] = STAGES[1]["outputs"] + STAGES[2]["outputs"]
+        fused["fused"] = True
+        del plan[2]
+    for n, stage in plan.items():
+        deps = [1 if (fuse_1_2 and d == 2) else d for d in stage["deps"]]
+        stage["deps"] = sorted({d for d in deps if d in plan and d != n})
+    return plan
+
+
+def run_dag(plan: dict, args_by_stage: dict, state: dict,
+            force: bool = False, max_parallel: int = 2,
+            runner=run_stage) -> dict:
+    """
+    Run the planned stages in dependency order, skipping up-to-date ones.
+
+    A stage runs when forced, when its fingerprint differs from the one
+    recorded after its last successful run, when its outputs were deleted
+    or changed since then, or when one of its dependencies ran in this
+    invocation. Stages whose dependencies are all settled run concurrently
+    (up to max_parallel); dependents of a failed stage are not started.
+    runner is run_stage (subprocess per stage) or run_stage_inprocess;
+    with max_parallel=1 stages run inline on the calling thread.
+
+    Returns:
+        {stage: True (ran OK), False (failed or blocked) or "skipped"}
+    """
+    results = {}
+    ran = set()
+    remaining = dict(plan)
+
+    pool = ThreadPoolExecutor(max_workers=max_parallel) if max_parallel > 1 else None
+    try:
+        running = {}
+        while remaining or running:
+            for n in sorted(remaining):
+                stage = remaining[n]
+                if any(d in remaining or d in running.values() for d in stage["deps"]):
+                    continue
+                del remaining[n]
+                if any(results.get(d) is False for d in stage["deps"]):
+                    print(f"\n[SKIP] Stage {n}: upstream stage failed")
+                    results[n] = False
+                    continue
+
+                args, perf_args = args_by_stage[n]
+                if stage.get("fused"):
+                    args = args + ["--classify"]
+                fingerprint = stage_fingerprint(stage, args)
+                key = "1-2" if stage.get("fused") else str(n)
+                upstream_ran = any(d in ran for d in stage["deps"])
+                if (not force and not upstream_ran
+                        and is_up_to_date(n, stage, state.get(key), fingerprint)):
+                    print(f"\n[UP TO DATE] Stage {n}: {stage['description']}")
+                    results[n] = "skipped"
+                    continue
+                stage["fingerprint"] = fingerprint
+                stage["key"] = key
+                if pool is None:
+                    future = Future()
+                    future.set_result(runner(stage["script"], args + perf_args,
+                                             stage["description"]))
+                else:
+                    future = pool.submit(runner, stage["script"], args + perf_args,
+                                         stage["description"])
+                running[future] = n
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                n = running.pop(future)
+                ok = future.result()
+                results[n] = ok
+                ran.add(n)
+                if ok:
+                    state[plan[n]["key"]] = {
+                        "fingerprint": plan[n]["fingerprint"],
+                        "outputs": listing_digest(plan[n]["outputs"]),
+                    }
+                    save_state(state)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return results
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Run the BirdNET + IBC53 pipeline (all stages or specific ones)."
@@ -72,9 +424,31 @@ def main():
                         help="Use keras-tuner in Stage 5")
     parser.add_argument("--build_fewshot", action="store_true",
                         help="Build few-shot subsets in Stage 4")
+    parser.add_argument("--fuse", type=str, default=None, choices=["1-2"],
+                        help="Fuse stages into one pass: '1-2' segments and "
+                             "classifies without re-reading segment WAVs")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes for Stage 1 (default: 1)")
+    parser.add_argument("--link-mode", dest="link_mode", type=str, default="copy",
+                        choices=["copy", "hardlink", "symlink", "reflink"],
+                        help="How Stage 4 places segments in dataset variants")
+    parser.add_argument("--max_parallel", type=int, default=1,
+                        help="Experiments run concurrently in Stage 5 (default: 1)")
+    parser.add_argument("--threads_per_job", type=int, default=None,
+                        help="CPU threads per Stage 5 experiment")
+    parser.add_argument("--isolate", action="store_true",
+                        help="Run each stage in its own Python subprocess "
+                             "instead of in this interpreter")
+    parser.add_argument("--force", action="store_true",
+                        help="Rerun the selected stages even if up to date")
+    parser.add_argument("--parallel_stages", type=int, default=2,
+                        help="With --isolate: independent stages run "
+                             "concurrently, e.g. 2 and 3 (default: 2). "
+                             "In-process stages always run one at a time")
     args = parser.parse_args()
 
     stages = parse_stage_range(args.stage)
+    fuse_1_2 = args.fuse == "1-2" and 1 in stages and 2 in stages
 
     print("=" * 70)
     print("BirdNET + IBC53: NOISE-AWARE BIRD AUDIO CLASSIFICATION PIPELINE")
@@ -82,57 +456,21 @@ def main():
     print("=" * 70)
 
     start_time = time.time()
-    results = {}
-
-    if 1 in stages:
-        results[1] = run_stage(
-            "01_segment_audio.py",
-            description="Audio Segmentation (3-second chunks)"
-        )
-
-    if 2 in stages:
-        results[2] = run_stage(
-            "02_classify_segments.py",
-            description="Energy-Based Noise Detection"
-        )
-
-    if 3 in stages:
-        results[3] = run_stage(
-            "03_extract_esc50_noise.py",
-            description="ESC-50 Noise Extraction"
-        )
-
-    if 4 in stages:
-        extra = []
-        if args.build_fewshot:
-            extra.append("--build_fewshot")
-        results[4] = run_stage(
-            "04_build_dataset.py",
-            extra_args=extra if extra else None,
-            description="Build BirdNET-Compatible Dataset"
-        )
-
-    if 5 in stages:
-        extra = ["--experiment", args.experiment]
-        if args.autotune:
-            extra.append("--autotune")
-        results[5] = run_stage(
-            "05_train_and_evaluate.py",
-            extra_args=extra,
-            description="BirdNET Training & Evaluation"
-        )
-
-    if 6 in stages:
-        results[6] = run_stage(
-            "06_analyze_results.py",
-            description="Results Analysis & Comparison"
-        )
+    plan = plan_stages(stages, fuse_1_2)
+    state = load_state()
+    results = run_dag(plan, stage_args(args), state, force=args.force,
+                      max_parallel=args.parallel_stages if args.isolate else 1,
+                      runner=run_stage if args.isolate else run_stage_inprocess)
+    if fuse_1_2 and 1 in results:
+        results[2] = results[1]
+    results = dict(sorted(results.items()))
 
     elapsed = time.time() - start_time
 
     print(f"\n{'=' * 70}")
     print(f"PIPELINE COMPLETE")
-    print(f"  Stages run: {list(results.keys())}")
+    print(f"  Stages run: {[n for n, r in results.items() if r != 'skipped']}")
+    print(f"  Up to date: {[n for n, r in results.items() if r == 'skipped']}")
     print(f"  Results:    {results}")
     print(f"  Total time: {elapsed:.1f}s ({elapsed/60:.1f} min)")
     print(f"{'=' * 70}")
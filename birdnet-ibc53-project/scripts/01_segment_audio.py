@@ -7,28 +7,69 @@ Takes raw IBC53 audio recordings (10-30s each) and splits them into
 Usage:
     python scripts/01_segment_audio.py
     python scripts/01_segment_audio.py --input_dir data/ibc53 --output_dir data/segments
+    python scripts/01_segment_audio.py --workers 8
+    python scripts/01_segment_audio.py --classify   # fused Stage 1+2
+    python scripts/01_segment_audio.py --classify --resume   # continue an interrupted fused run
+    python scripts/01_segment_audio.py --no_cache   # decode without the audio cache
 
 Pipeline Position: FIRST step in the CST pipeline.
 Output: Segmented WAV files organized by species folder.
+
+Fused mode (--classify) also does Stage 2 in the same pass: each recording is
+decoded once, features are computed on the in-memory windows, and only bird
+and noise segments are written to disk (silence rows are still listed in the
+classifications CSV, but their WAVs are never materialized, and silence WAVs
+left in the output folder by an earlier unfused run are deleted). Rows are
+streamed to the classifications file one species folder at a time, in the
+same order as Stage 2, and checkpointed after each folder.
+
+Decoded recordings are kept in data/cache/audio (see scripts/_audio_cache.py),
+so re-runs and later stages skip the decoder and resampler. The cache is
+pruned at the end of each run: entries for deleted or edited recordings are
+dropped, then the least recently used down to AUDIO_CACHE_MAX_BYTES.
 """
 
 import argparse
+import os
 import sys
 import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-import librosa
 import numpy as np
-import soundfile as sf
 
 # Add project root to path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 from configs.config import (
     IBC53_RAW_DIR, SEGMENTS_DIR, SAMPLE_RATE,
     SEGMENT_LENGTH, SEGMENT_SAMPLES, MIN_SEGMENT_RATIO,
-    SPECIES_NAMES, MYSTERY_FOLDER_NAME, VERBOSE, ensure_dirs,
+    SPECIES_NAMES, MYSTERY_FOLDER_NAME, RESULTS_DIR,
+    SILENCE_RMS_THRESHOLD, NOISE_FLATNESS_THRESHOLD, NOISE_ZCR_THRESHOLD,
+    AUDIO_CACHE_DIR, VERBOSE, ensure_dirs,
+)
+from scripts._audio_cache import load_audio, prune_audio_cache
+from scripts._lazy import lazy_import
+from scripts._classify_lib import (
+    extract_features_from_array, classify_segment,
+    classification_row, ClassificationWriter,
 )
 
+librosa = lazy_import("librosa")
+sf = lazy_import("soundfile")
+
+
+def quantize_pcm16(segment: np.ndarray) -> np.ndarray:
+    """
+    Float samples in [-1, 1] to the int16 values a 16-bit WAV stores.
+
+    Reproduces libsndfile's float -> PCM_16 conversion (round to 32-bit,
+    clip, keep the top 16 bits), so the WAVs are byte-identical to writing
+    the float segment with sf.write(..., subtype="PCM_16").
+    """
+    pcm32 = np.clip(np.rint(segment.astype(np.float64) * 2.0 ** 31), -2 ** 31, 2 ** 31 - 1)
+    return (pcm32.astype(np.int64) >> 16).astype(np.int16)
+
 
 def segment_single_file(input_path: Path, output_dir: Path,
                          sr: int = SAMPLE_RATE,
@@ -45,11 +86,35 @@ def segment_single_file(input_path: Path, output_dir: Path,
     Returns:
         Number of segments created.
     """
+    return _segment_file_task(input_path, output_dir, sr, segment_length)["segments"]
+
+
+def _segment_file_task(input_path: Path, output_dir: Path,
+                       sr: int = SAMPLE_RATE,
+                       segment_length: float = SEGMENT_LENGTH,
+                       thresholds: tuple = None,
+                       audio_cache: Path = None) -> dict:
+    """
+    Segment one file and report what it cost. Runs inside pool workers.
+
+    When thresholds (silence_rms, noise_flatness, noise_zcr) are given, each
+    window is classified in memory and silence windows are not written.
+    With audio_cache set, the decoded recording is read from (or added to)
+    that decoded-audio cache.
+
+    Returns:
+        dict with keys: worker (pid), segments, audio_seconds, elapsed_s,
+        rows (classification rows; empty unless thresholds are given)
+    """
+    start_time = time.perf_counter()
+    task = {"worker": os.getpid(), "segments": 0, "audio_seconds": 0.0, "rows": []}
+
     try:
-        y, _ = librosa.load(str(input_path), sr=sr, mono=True)
+        y = load_audio(input_path, sr=sr, cache_dir=audio_cache)
     except Exception as e:
         print(f"  [ERROR] Failed to load {input_path.name}: {e}")
-        return 0
+        task["elapsed_s"] = time.perf_counter() - start_time
+        return task
 
     segment_samples = int(segment_length * sr)
     min_samples = int(segment_samples * MIN_SEGMENT_RATIO)
@@ -69,43 +134,161 @@ def segment_single_file(input_path: Path, output_dir: Path,
         # Write segment
         filename = f"{input_path.stem}_seg{segments_created:04d}.wav"
         out_path = output_dir / filename
-        sf.write(str(out_path), segment, sr)
         segments_created += 1
+        pcm = quantize_pcm16(segment)
 
-    return segments_created
+        if thresholds is None:
+            sf.write(str(out_path), pcm, sr, subtype="PCM_16")
+            continue
 
+        # Features see exactly the samples Stage 2 would read back from the WAV
+        features = extract_features_from_array(pcm.astype(np.float32) / 32768, sr)
+        label = classify_segment(features, *thresholds)
+        task["rows"].append(
+            classification_row(output_dir.name, out_path, features, label)
+        )
+        if label != "silence":  # silence is never needed downstream
+            sf.write(str(out_path), pcm, sr, subtype="PCM_16")
+        else:
+            # An earlier unfused run may have written it; drop it so the
+            # folder matches the classifications file
+            out_path.unlink(missing_ok=True)
+
+    task["segments"] = segments_created
+    task["audio_seconds"] = len(y) / sr
+    task["elapsed_s"] = time.perf_counter() - start_time
+    return task
+
+
+def list_audio_files(folder: Path) -> list:
+    """Sorted audio files directly inside a folder."""
+    return sorted(
+        [f for f in folder.iterdir()
+         if f.suffix.lower() in (".wav", ".mp3", ".flac", ".ogg")]
+    )
 
-def segment_species_folder(species_dir: Path, output_base: Path) -> dict:
+
+def segment_species_folder(species_dir: Path, output_base: Path,
+                           executor: ProcessPoolExecutor = None,
+                           worker_stats: dict = None,
+                           thresholds: tuple = None,
+                           audio_cache: Path = None) -> dict:
     """
     Segment all audio files in a single species folder.
 
+    Args:
+        species_dir: Folder of source recordings for one species.
+        output_base: Root output directory (a subfolder per species is created).
+        executor: Optional process pool; files run inline when omitted.
+        worker_stats: Optional dict updated with per-worker throughput.
+        thresholds: Optional (silence_rms, noise_flatness, noise_zcr) to
+                    classify windows in the same pass (fused mode).
+        audio_cache: Optional decoded-audio cache directory.
+
     Returns:
-        dict with stats: {files_processed, segments_created, errors}
+        dict with stats: {files_processed, segments_created, errors, rows,
+        labels (bird/noise/silence counts)}
     """
-    species_name = species_dir.name
-    output_dir = output_base / species_name
+    return _collect_folder_stats(
+        _submit_folder(species_dir, output_base, executor, thresholds, audio_cache),
+        worker_stats,
+    )
+
+
+def _submit_folder(species_dir: Path, output_base: Path,
+                   executor: ProcessPoolExecutor = None,
+                   thresholds: tuple = None,
+                   audio_cache: Path = None) -> list:
+    """Queue every file of a folder. Returns futures (or finished task dicts)."""
+    output_dir = output_base / species_dir.name
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    audio_files = sorted(
-        [f for f in species_dir.iterdir()
-         if f.suffix.lower() in (".wav", ".mp3", ".flac", ".ogg")]
-    )
+    pending = []
+    for audio_file in list_audio_files(species_dir):
+        if executor is None:
+            pending.append(_segment_file_task(
+                audio_file, output_dir, thresholds=thresholds,
+                audio_cache=audio_cache))
+        else:
+            pending.append(executor.submit(
+                _segment_file_task, audio_file, output_dir,
+                thresholds=thresholds, audio_cache=audio_cache))
+    return pending
 
-    stats = {"files_processed": 0, "segments_created": 0, "errors": 0}
 
-    for audio_file in audio_files:
-        n_segments = segment_single_file(audio_file, output_dir)
-        if n_segments > 0:
+def _collect_folder_stats(pending: list, worker_stats: dict = None,
+                          writer: ClassificationWriter = None) -> dict:
+    """
+    Wait for a folder's tasks and fold them into per-folder stats.
+
+    With a writer, classification rows are streamed to it as each file's
+    task finishes instead of being returned in stats["rows"].
+    """
+    stats = {"files_processed": 0, "segments_created": 0, "errors": 0, "rows": [],
+             "labels": {"bird": 0, "noise": 0, "silence": 0}}
+
+    for item in pending:
+        task = item if isinstance(item, dict) else item.result()
+        for row in task["rows"]:
+            stats["labels"][row["classification"]] += 1
+            if writer is None:
+                stats["rows"].append(row)
+            else:
+                writer.write(row)
+        if task["segments"] > 0:
             stats["files_processed"] += 1
-            stats["segments_created"] += n_segments
+            stats["segments_created"] += task["segments"]
         else:
             stats["errors"] += 1
 
+        if worker_stats is not None:
+            w = worker_stats[task["worker"]]
+            w["files"] += 1
+            w["audio_seconds"] += task["audio_seconds"]
+            w["busy_s"] += task["elapsed_s"]
+
     return stats
 
 
+def _add_completed_folder(total_stats: dict, writer: ClassificationWriter,
+                          folder_dir: Path):
+    """Fold a folder finished by an earlier (resumed) fused run into the totals."""
+    labels = writer.completed[folder_dir.name]
+    errors = writer.completed_errors.get(folder_dir.name, 0)
+    for label, n in labels.items():
+        total_stats[label] += n
+    total_stats["segments_created"] += sum(labels.values())
+    total_stats["files_processed"] += len(list_audio_files(folder_dir)) - errors
+    total_stats["errors"] += errors
+
+
+def print_worker_throughput(worker_stats: dict, elapsed: float):
+    """Print files/s and audio-seconds/s for each worker process."""
+    print(f"\n  Per-worker throughput ({len(worker_stats)} worker(s)):")
+    print(f"  {'Worker':>8} {'Files':>6} {'Audio (s)':>10} {'Busy (s)':>9} "
+          f"{'Files/s':>8} {'Audio-s/s':>10}")
+    for idx, (pid, w) in enumerate(sorted(worker_stats.items()), 1):
+        busy = max(w["busy_s"], 1e-9)
+        print(f"  {idx:>8d} {w['files']:>6d} {w['audio_seconds']:>10.1f} "
+              f"{w['busy_s']:>9.1f} {w['files'] / busy:>8.2f} "
+              f"{w['audio_seconds'] / busy:>10.1f}")
+
+    total_files = sum(w["files"] for w in worker_stats.values())
+    total_audio = sum(w["audio_seconds"] for w in worker_stats.values())
+    wall = max(elapsed, 1e-9)
+    print(f"  {'Overall':>8} {total_files:>6d} {total_audio:>10.1f} "
+          f"{elapsed:>9.1f} {total_files / wall:>8.2f} {total_audio / wall:>10.1f}")
+
+
 def run_segmentation(input_dir: Path, output_dir: Path,
-                     include_mystery: bool = True):
+                     include_mystery: bool = True,
+                     workers: int = 1,
+                     classify_csv: Path = None,
+                     silence_rms: float = SILENCE_RMS_THRESHOLD,
+                     noise_flatness: float = NOISE_FLATNESS_THRESHOLD,
+                     noise_zcr: float = NOISE_ZCR_THRESHOLD,
+                     audio_cache: Path = AUDIO_CACHE_DIR,
+                     resume: bool = False):
     """
     Run segmentation on all selected species + optionally the Mystery folder.
 
@@ -113,20 +296,52 @@ def run_segmentation(input_dir: Path, output_dir: Path,
         input_dir: Root IBC53 directory containing species folders.
         output_dir: Root output directory for segmented audio.
         include_mystery: Whether to also segment the Mystery mystery folder.
+        workers: Number of worker processes. Files from every folder are
+                 fanned out across the pool; stats are still reported per
+                 folder, in the usual order (by folder name in fused
+                 mode, matching Stage 2).
+        classify_csv: If set, run fused Stage 1+2: classify windows in memory,
+                      skip writing silence, and stream this classifications
+                      file (.csv or .parquet) one species folder at a time.
+        silence_rms, noise_flatness, noise_zcr: Stage 2 thresholds (fused mode).
+        audio_cache: Decoded-audio cache directory (None decodes every file).
+        resume: Fused mode only: skip species folders already completed in an
+                existing classifications file (per its checkpoint).
     """
     print("=" * 60)
     print("STAGE 1: Audio Segmentation")
     print(f"Input:  {input_dir}")
     print(f"Output: {output_dir}")
     print(f"Segment length: {SEGMENT_LENGTH}s @ {SAMPLE_RATE}Hz")
+    print(f"Workers: {workers}")
+    print(f"Audio cache: {audio_cache if audio_cache is not None else 'off'}")
+    if classify_csv is not None:
+        print(f"Fused classification -> {classify_csv}")
+        print(f"Thresholds: silence_rms={silence_rms}, "
+              f"noise_flatness={noise_flatness}, noise_zcr={noise_zcr}")
     print("=" * 60)
 
     output_dir.mkdir(parents=True, exist_ok=True)
     start_time = time.time()
     total_stats = {"files_processed": 0, "segments_created": 0, "errors": 0}
-
-    # --- Process 30 selected species ---
-    folders_found = 0
+    worker_stats = defaultdict(lambda: {"files": 0, "audio_seconds": 0.0, "busy_s": 0.0})
+    thresholds = None
+    writer = None
+    if classify_csv is not None:
+        thresholds = (silence_rms, noise_flatness, noise_zcr)
+        for label in ("bird", "noise", "silence"):
+            total_stats[label] = 0
+        writer = ClassificationWriter(
+            classify_csv, resume=resume,
+            params={"input_dir": str(input_dir), "output_dir": str(output_dir),
+                    "silence_rms": silence_rms, "noise_flatness": noise_flatness,
+                    "noise_zcr": noise_zcr},
+        )
+        if writer.completed:
+            print(f"  Resuming: {len(writer.completed)} species folder(s) already done")
+
+    # --- Resolve the 30 selected species folders ---
+    species_dirs = []
     for species_name in SPECIES_NAMES:
         species_dir = input_dir / species_name
         if not species_dir.is_dir():
@@ -138,31 +353,67 @@ def run_segmentation(input_dir: Path, output_dir: Path,
             else:
                 print(f"  [WARN] Species folder not found: {species_name}")
                 continue
+        species_dirs.append((species_name, species_dir))
+    folders_found = len(species_dirs)
+
+    mystery_dir = input_dir / MYSTERY_FOLDER_NAME
+    process_mystery = include_mystery and mystery_dir.is_dir()
+    if include_mystery and not process_mystery:
+        print(f"  [WARN] Mystery mystery folder not found at {mystery_dir}")
+
+    # (label, source folder, 1-based species index or None for Mystery)
+    folders = [(name, d, idx) for idx, (name, d) in enumerate(species_dirs, 1)]
+    if process_mystery:
+        folders.append((MYSTERY_FOLDER_NAME, mystery_dir, None))
+    if writer is not None:
+        # Same ordering as Stage 2: output folders sorted by name
+        folders.sort(key=lambda f: f[1].name)
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        # Queue everything up front so the pool never idles between folders
+        pending = []
+        for _, folder_dir, _ in folders:
+            if writer is not None and folder_dir.name in writer.completed:
+                pending.append(None)
+            else:
+                pending.append(_submit_folder(folder_dir, output_dir, executor,
+                                              thresholds, audio_cache))
+
+        for (name, folder_dir, idx), folder_pending in zip(folders, pending):
+            if folder_pending is None:
+                _add_completed_folder(total_stats, writer, folder_dir)
+                if VERBOSE:
+                    print(f"  {name:40s} | (done, skipped)")
+                continue
 
-        folders_found += 1
-        stats = segment_species_folder(species_dir, output_dir)
-        total_stats["files_processed"] += stats["files_processed"]
-        total_stats["segments_created"] += stats["segments_created"]
-        total_stats["errors"] += stats["errors"]
-
-        if VERBOSE:
-            print(f"  [{folders_found:2d}/30] {species_name:40s} "
-                  f"| {stats['files_processed']:3d} files -> "
-                  f"{stats['segments_created']:4d} segments")
-
-    # --- Process Mystery mystery folder ---
-    if include_mystery:
-        mystery_dir = input_dir / MYSTERY_FOLDER_NAME
-        if mystery_dir.is_dir():
-            print(f"\n  Processing Mystery mystery folder...")
-            stats = segment_species_folder(mystery_dir, output_dir)
+            if idx is None:
+                print(f"\n  Processing Mystery mystery folder...")
+            stats = _collect_folder_stats(folder_pending, worker_stats, writer)
+            if writer is not None:
+                writer.complete_folder(folder_dir.name, stats["labels"],
+                                       errors=stats["errors"])
+                for label, n in stats["labels"].items():
+                    total_stats[label] += n
             total_stats["files_processed"] += stats["files_processed"]
             total_stats["segments_created"] += stats["segments_created"]
             total_stats["errors"] += stats["errors"]
-            print(f"  Mystery mystery: {stats['files_processed']} files -> "
-                  f"{stats['segments_created']} segments")
-        else:
-            print(f"  [WARN] Mystery mystery folder not found at {mystery_dir}")
+
+            if idx is None:
+                print(f"  Mystery mystery: {stats['files_processed']} files -> "
+                      f"{stats['segments_created']} segments")
+            elif VERBOSE:
+                print(f"  [{idx:2d}/30] {name:40s} "
+                      f"| {stats['files_processed']:3d} files -> "
+                      f"{stats['segments_created']:4d} segments")
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    if writer is not None:
+        writer.close()
+    if audio_cache is not None:
+        prune_audio_cache(audio_cache)
 
     elapsed = time.time() - start_time
     print(f"\n{'=' * 60}")
@@ -171,13 +422,20 @@ def run_segmentation(input_dir: Path, output_dir: Path,
     print(f"  Files processed:       {total_stats['files_processed']}")
     print(f"  Segments created:      {total_stats['segments_created']}")
     print(f"  Errors:                {total_stats['errors']}")
+    if classify_csv is not None:
+        n = max(total_stats["segments_created"], 1)
+        for label in ("bird", "noise", "silence"):
+            print(f"  {label.capitalize() + ':':22s} {total_stats[label]:5d} "
+                  f"({100 * total_stats[label] / n:.1f}%)")
+        print(f"  Classifications saved: {classify_csv}")
     print(f"  Time elapsed:          {elapsed:.1f}s")
+    print_worker_throughput(worker_stats, elapsed)
     print(f"{'=' * 60}")
 
     return total_stats
 
 
-def main():
+def main(argv: list = None):
     parser = argparse.ArgumentParser(
         description="Segment IBC53 audio into 3-second chunks for BirdNET."
     )
@@ -187,13 +445,42 @@ def main():
                         help="Path to output segmented audio directory")
     parser.add_argument("--no_mystery", action="store_true",
                         help="Skip the Mystery mystery folder")
-    args = parser.parse_args()
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes for decoding/segmenting (default: 1)")
+    parser.add_argument("--classify", action="store_true",
+                        help="Fused Stage 1+2: classify windows in memory and "
+                             "write the classifications CSV in the same pass")
+    parser.add_argument("--output_csv", type=str,
+                        default=str(RESULTS_DIR / "segment_classifications.csv"),
+                        help="Classifications written in --classify mode "
+                             "(.csv, or .parquet for columnar output)")
+    parser.add_argument("--silence_rms", type=float, default=SILENCE_RMS_THRESHOLD,
+                        help=f"RMS threshold for silence (default: {SILENCE_RMS_THRESHOLD})")
+    parser.add_argument("--noise_flatness", type=float, default=NOISE_FLATNESS_THRESHOLD,
+                        help=f"Spectral flatness threshold for noise (default: {NOISE_FLATNESS_THRESHOLD})")
+    parser.add_argument("--noise_zcr", type=float, default=NOISE_ZCR_THRESHOLD,
+                        help=f"ZCR threshold for noise (default: {NOISE_ZCR_THRESHOLD})")
+    parser.add_argument("--audio_cache", type=str, default=str(AUDIO_CACHE_DIR),
+                        help="Decoded-audio cache directory")
+    parser.add_argument("--no_cache", action="store_true",
+                        help="Decode every recording instead of using the audio cache")
+    parser.add_argument("--resume", action="store_true",
+                        help="With --classify: skip species already completed in "
+                             "an existing --output_csv and continue from its checkpoint")
+    args = parser.parse_args(argv)
 
     ensure_dirs()
     run_segmentation(
         input_dir=Path(args.input_dir),
         output_dir=Path(args.output_dir),
         include_mystery=not args.no_mystery,
+        workers=max(1, args.workers),
+        classify_csv=Path(args.output_csv) if args.classify else None,
+        silence_rms=args.silence_rms,
+        noise_flatness=args.noise_flatness,
+        noise_zcr=args.noise_zcr,
+        audio_cache=None if args.no_cache else Path(args.audio_cache),
+        resume=args.resume,
     )
 
 
@@ -12,109 +12,52 @@ This is the CORE of the CST contribution (Paper 1).
 Usage:
     python scripts/02_classify_segments.py
     python scripts/02_classify_segments.py --input_dir data/segments --output_csv results/segment_classifications.csv
+    python scripts/02_classify_segments.py --no_cache    # recompute every segment
+    python scripts/02_classify_segments.py --output_format parquet
+    python scripts/02_classify_segments.py --resume      # continue an interrupted run
 
 Pipeline Position: SECOND step — runs after 01_segment_audio.py
-Output: CSV with per-segment features and classifications.
+Output: CSV (or Parquet) with per-segment features and classifications.
 """
 
 import argparse
-import csv
 import sys
 import time
 from pathlib import Path
 from typing import Optional
 
-import librosa
-import numpy as np
-
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 from configs.config import (
-    SEGMENTS_DIR, RESULTS_DIR, SAMPLE_RATE,
+    SEGMENTS_DIR, RESULTS_DIR, FEATURE_CACHE_PATH,
     SILENCE_RMS_THRESHOLD, NOISE_FLATNESS_THRESHOLD,
     NOISE_ZCR_THRESHOLD, VERBOSE, ensure_dirs,
 )
-
-
-def extract_features(audio_path: Path, sr: int = SAMPLE_RATE) -> Optional[dict]:
-    """
-    Extract signal processing features from a single audio segment.
-
-    Args:
-        audio_path: Path to the 3-second WAV file.
-        sr: Sample rate to load at.
-
-    Returns:
-        dict with keys: rms, spectral_flatness, zcr, duration_s
-        or None if loading fails.
-    """
-    try:
-        y, _ = librosa.load(str(audio_path), sr=sr, mono=True)
-    except Exception as e:
-        print(f"  [ERROR] Failed to load {audio_path.name}: {e}")
-        return None
-
-    # Feature 1: RMS Energy — overall volume
-    rms = float(np.sqrt(np.mean(y ** 2)))
-
-    # Feature 2: Spectral Flatness — tonal (near 0) vs noise-like (near 1)
-    flatness_frames = librosa.feature.spectral_flatness(y=y)
-    spectral_flatness = float(np.mean(flatness_frames))
-
-    # Feature 3: Zero Crossing Rate — signal structure
-    zcr_frames = librosa.feature.zero_crossing_rate(y)
-    zcr = float(np.mean(zcr_frames))
-
-    return {
-        "rms": rms,
-        "spectral_flatness": spectral_flatness,
-        "zcr": zcr,
-        "duration_s": len(y) / sr,
-    }
-
-
-def classify_segment(features: dict,
-                     silence_rms: float = SILENCE_RMS_THRESHOLD,
-                     noise_flatness: float = NOISE_FLATNESS_THRESHOLD,
-                     noise_zcr: float = NOISE_ZCR_THRESHOLD) -> str:
-    """
-    Classify a segment as 'bird', 'noise', or 'silence' based on features.
-
-    Decision Logic:
-        1. If RMS energy < silence_rms → 'silence'
-        2. If spectral_flatness > noise_flatness AND zcr > noise_zcr → 'noise'
-        3. Otherwise → 'bird'
-
-    Args:
-        features: dict from extract_features().
-        silence_rms: RMS threshold below which = silence.
-        noise_flatness: Spectral flatness threshold above which = noise-like.
-        noise_zcr: ZCR threshold above which (combined with flatness) = noise.
-
-    Returns:
-        Classification label: 'bird', 'noise', or 'silence'.
-
-    WARNING: The default thresholds are STARTING POINTS. You MUST tune
-    them by listening to ~50-100 segments. This tuning is part of the
-    research contribution.
-    """
-    if features["rms"] < silence_rms:
-        return "silence"
-    elif features["spectral_flatness"] > noise_flatness and features["zcr"] > noise_zcr:
-        return "noise"
-    else:
-        return "bird"
+from scripts._classify_lib import (
+    ClassificationWriter, classification_row, classify_segment, iter_features,
+)
+from scripts._feature_cache import FeatureCache
 
 
 def classify_all_segments(input_dir: Path, output_csv: Path,
                           silence_rms: float = SILENCE_RMS_THRESHOLD,
                           noise_flatness: float = NOISE_FLATNESS_THRESHOLD,
-                          noise_zcr: float = NOISE_ZCR_THRESHOLD) -> dict:
+                          noise_zcr: float = NOISE_ZCR_THRESHOLD,
+                          feature_cache: Optional[Path] = FEATURE_CACHE_PATH,
+                          resume: bool = False) -> dict:
     """
     Classify all segmented audio files and write results to CSV.
 
+    Rows are streamed to disk in flushed batches and checkpointed after each
+    species folder, so an interrupted run loses at most one folder.
+
     Args:
         input_dir: Root directory containing species subfolders with segments.
-        output_csv: Path to the output CSV file.
+        output_csv: Path to the output file (.csv, or .parquet for typed
+                    columnar output).
+        feature_cache: SQLite feature store; only new or modified segments
+                       are decoded. None disables caching.
+        resume: Skip species folders already completed in an existing output
+                (per its checkpoint) and append the rest.
 
     Returns:
         dict of summary statistics.
@@ -134,37 +77,47 @@ def classify_all_segments(input_dir: Path, output_csv: Path,
     species_dirs = sorted([d for d in input_dir.iterdir() if d.is_dir()])
 
     counts = {"bird": 0, "noise": 0, "silence": 0, "errors": 0}
-    rows = []
+    cache = FeatureCache(feature_cache) if feature_cache is not None else None
+    writer = ClassificationWriter(
+        output_csv, resume=resume,
+        params={"input_dir": str(input_dir), "silence_rms": silence_rms,
+                "noise_flatness": noise_flatness, "noise_zcr": noise_zcr},
+    )
+    if writer.completed:
+        print(f"  Resuming: {len(writer.completed)} species folder(s) already done")
 
     for species_dir in species_dirs:
         species_name = species_dir.name
+        if species_name in writer.completed:
+            for label, n in writer.completed[species_name].items():
+                counts[label] += n
+            counts["errors"] += writer.completed_errors.get(species_name, 0)
+            if VERBOSE:
+                print(f"  {species_name:40s} | (done, skipped)")
+            continue
+
         audio_files = sorted(
             [f for f in species_dir.iterdir()
              if f.suffix.lower() in (".wav", ".mp3", ".flac", ".ogg")]
         )
 
         species_counts = {"bird": 0, "noise": 0, "silence": 0}
+        species_errors = 0
 
-        for audio_file in audio_files:
-            features = extract_features(audio_file)
+        # Features for the whole folder are computed in vectorized batches
+        for audio_file, features in iter_features(audio_files, cache=cache):
             if features is None:
-                counts["errors"] += 1
+                species_errors += 1
                 continue
 
             label = classify_segment(features, silence_rms, noise_flatness, noise_zcr)
             species_counts[label] += 1
             counts[label] += 1
 
-            rows.append({
-                "species_folder": species_name,
-                "filename": audio_file.name,
-                "filepath": str(audio_file),
-                "rms": f"{features['rms']:.6f}",
-                "spectral_flatness": f"{features['spectral_flatness']:.6f}",
-                "zcr": f"{features['zcr']:.6f}",
-                "duration_s": f"{features['duration_s']:.2f}",
-                "classification": label,
-            })
+            writer.write(classification_row(species_name, audio_file, features, label))
+
+        writer.complete_folder(species_name, species_counts, errors=species_errors)
+        counts["errors"] += species_errors
 
         if VERBOSE:
             total = sum(species_counts.values())
@@ -174,15 +127,12 @@ def classify_all_segments(input_dir: Path, output_csv: Path,
                   f"silence={species_counts['silence']:3d}  "
                   f"(total={total})")
 
-    # Write CSV
-    fieldnames = ["species_folder", "filename", "filepath",
-                  "rms", "spectral_flatness", "zcr",
-                  "duration_s", "classification"]
+    writer.close()
 
-    with open(output_csv, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
+    if cache is not None:
+        counts["cache_hits"] = cache.hits
+        counts["cache_misses"] = cache.misses
+        cache.close()
 
     elapsed = time.time() - start_time
     total_segments = counts["bird"] + counts["noise"] + counts["silence"]
@@ -194,6 +144,8 @@ def classify_all_segments(input_dir: Path, output_csv: Path,
     print(f"  Noise:           {counts['noise']:5d} ({100*counts['noise']/max(total_segments,1):.1f}%)")
     print(f"  Silence:         {counts['silence']:5d} ({100*counts['silence']/max(total_segments,1):.1f}%)")
     print(f"  Errors:          {counts['errors']}")
+    if cache is not None:
+        print(f"  Feature cache:   {cache.summary()}")
     print(f"  Results saved:   {output_csv}")
     print(f"  Time elapsed:    {elapsed:.1f}s")
     print(f"{'=' * 60}")
@@ -201,30 +153,61 @@ def classify_all_segments(input_dir: Path, output_csv: Path,
     return counts
 
 
-def main():
+def resolve_output_path(output_csv: Path, output_format: str = None) -> Path:
+    """
+    The output file to write: a .csv or .parquet suffix on output_csv wins;
+    otherwise .<output_format> (csv by default) is appended.
+    """
+    suffix = output_csv.suffix.lower()
+    if suffix in (".csv", ".parquet"):
+        if output_format is not None and suffix != f".{output_format}":
+            print(f"  [WARN] --output_format {output_format} ignored: "
+                  f"{output_csv.name} is {suffix[1:]}")
+        return output_csv
+    return output_csv.with_name(f"{output_csv.name}.{output_format or 'csv'}")
+
+
+def main(argv: list = None):
     parser = argparse.ArgumentParser(
         description="Classify audio segments as bird/noise/silence using signal features."
     )
     parser.add_argument("--input_dir", type=str, default=str(SEGMENTS_DIR),
                         help="Path to segmented audio directory")
     parser.add_argument("--output_csv", type=str,
-                        default=str(RESULTS_DIR / "segment_classifications.csv"),
-                        help="Path to output CSV file")
+                        default=str(RESULTS_DIR / "segment_classifications"),
+                        help="Path to output file; a .csv or .parquet suffix "
+                             "picks the format (default: "
+                             "results/segment_classifications.<output_format>)")
+    parser.add_argument("--output_format", type=str, default=None,
+                        choices=["csv", "parquet"],
+                        help="Format when --output_csv has no .csv/.parquet "
+                             "suffix: csv (default), or parquet (typed "
+                             "features, categorical labels; needs pyarrow)")
     parser.add_argument("--silence_rms", type=float, default=SILENCE_RMS_THRESHOLD,
                         help=f"RMS threshold for silence (default: {SILENCE_RMS_THRESHOLD})")
     parser.add_argument("--noise_flatness", type=float, default=NOISE_FLATNESS_THRESHOLD,
                         help=f"Spectral flatness threshold for noise (default: {NOISE_FLATNESS_THRESHOLD})")
     parser.add_argument("--noise_zcr", type=float, default=NOISE_ZCR_THRESHOLD,
                         help=f"ZCR threshold for noise (default: {NOISE_ZCR_THRESHOLD})")
-    args = parser.parse_args()
+    parser.add_argument("--feature_cache", type=str, default=str(FEATURE_CACHE_PATH),
+                        help="SQLite feature store reused across runs")
+    parser.add_argument("--no_cache", action="store_true",
+                        help="Recompute features for every segment")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip species already completed in an existing "
+                             "output and continue from its checkpoint")
+    args = parser.parse_args(argv)
 
     ensure_dirs()
+    output_csv = resolve_output_path(Path(args.output_csv), args.output_format)
     classify_all_segments(
         input_dir=Path(args.input_dir),
-        output_csv=Path(args.output_csv),
+        output_csv=output_csv,
         silence_rms=args.silence_rms,
         noise_flatness=args.noise_flatness,
         noise_zcr=args.noise_zcr,
+        feature_cache=None if args.no_cache else Path(args.feature_cache),
+        resume=args.resume,
     )
 
 
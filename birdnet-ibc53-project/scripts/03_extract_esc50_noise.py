@@ -21,14 +21,15 @@ import sys
 import time
 from pathlib import Path
 
-import pandas as pd
-
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 from configs.config import (
     ESC50_DIR, ESC50_AUDIO_DIR, ESC50_META_CSV,
     PROCESSED_DIR, ESC50_NOISE_CATEGORIES, NOISE_FOLDER_NAME,
     VERBOSE, ensure_dirs,
 )
+from scripts._lazy import lazy_import
+
+pd = lazy_import("pandas")
 
 
 def extract_esc50_noise(esc50_dir: Path, output_dir: Path,
@@ -123,7 +124,7 @@ def extract_esc50_noise(esc50_dir: Path, output_dir: Path,
     return stats
 
 
-def main():
+def main(argv: list = None):
     parser = argparse.ArgumentParser(
         description="Extract environmental noise categories from ESC-50 dataset."
     )
@@ -132,7 +133,7 @@ def main():
     parser.add_argument("--output_dir", type=str,
                         default=str(PROCESSED_DIR / NOISE_FOLDER_NAME),
                         help="Path to output noise folder")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     ensure_dirs()
     extract_esc50_noise(
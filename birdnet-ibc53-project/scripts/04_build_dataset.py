@@ -13,9 +13,20 @@ Creates TWO dataset variants:
 
 Also creates few-shot subsets for Experiment 3.
 
+With --link-mode hardlink/symlink/reflink every variant (with-noise,
+no-noise, fewshot_N) points at a single physical copy of each segment
+instead of duplicating the audio per variant.
+
+Each variant is described by a manifest (data/manifests/<variant>.csv) of
+(path, source, label, origin) records. Folders are synced to their
+manifest rather than rebuilt, so re-running after a threshold change only
+adds or removes the segments whose label flipped.
+
 Usage:
     python scripts/04_build_dataset.py
     python scripts/04_build_dataset.py --classifications_csv results/segment_classifications.csv
+    python scripts/04_build_dataset.py --build_fewshot --link-mode hardlink
+    python scripts/04_build_dataset.py --build_fewshot --seed 7 --manifest_only
 
 Pipeline Position: FOURTH step — runs after 02 and 03.
 Output: BirdNET-format folder structure ready for training.
@@ -23,6 +34,7 @@ Output: BirdNET-format folder structure ready for training.
 
 import argparse
 import csv
+import os
 import random
 import shutil
 import sys
@@ -33,18 +45,183 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 from configs.config import (
     SEGMENTS_DIR, PROCESSED_DIR, PROCESSED_NO_NOISE_DIR,
-    RESULTS_DIR, DATA_DIR, SPECIES_NAMES, NOISE_FOLDER_NAME,
+    RESULTS_DIR, DATA_DIR, MANIFESTS_DIR, SPECIES_NAMES, NOISE_FOLDER_NAME,
     MYSTERY_FOLDER_NAME, VERBOSE, ensure_dirs,
 )
+from scripts._classify_lib import (
+    load_classifications_table, resolve_classifications_path,
+)
+
+
+LINK_MODES = ["copy", "hardlink", "symlink", "reflink"]
+
+MANIFEST_FIELDNAMES = ["path", "source", "label", "origin"]
+
+FICLONE = 0x40049409  # Linux ioctl: share extents between two files (btrfs/XFS)
+
+
+def materialize_file(src: Path, dst: Path, link_mode: str = "copy",
+                     stats: dict = None):
+    """
+    Place src at dst as a copy, hard link, symlink or reflink.
+
+    Hard links and reflinks fall back to a plain copy when the filesystem
+    refuses them (e.g. across devices); fallbacks are counted in
+    stats["fallback_copies"]. Symlinks always point at the resolved
+    original, so variants built from another variant never chain links.
+    """
+    if link_mode == "hardlink":
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    elif link_mode == "symlink":
+        os.symlink(os.path.realpath(src), dst)
+        return
+    elif link_mode == "reflink":
+        if _reflink(src, dst):
+            return
+
+    shutil.copy2(str(src), str(dst))
+    if link_mode != "copy" and stats is not None:
+        stats["fallback_copies"] = stats.get("fallback_copies", 0) + 1
+
+
+def _reflink(src: Path, dst: Path) -> bool:
+    """Copy-on-write clone via FICLONE; False if unsupported."""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError:
+        Path(dst).unlink(missing_ok=True)
+        return False
+    shutil.copystat(str(src), str(dst))
+    return True
+
+
+def _is_current(src: Path, dst: Path, link_mode: str) -> bool:
+    """True if dst already holds src in the form link_mode would produce."""
+    if not os.path.lexists(dst):
+        return False
+    if link_mode == "symlink":
+        return dst.is_symlink() and os.readlink(dst) == os.path.realpath(src)
+    if dst.is_symlink():
+        return False
+    try:
+        src_stat, dst_stat = os.stat(src), os.stat(dst)
+    except OSError:
+        return False
+    same_inode = (src_stat.st_dev, src_stat.st_ino) == (dst_stat.st_dev, dst_stat.st_ino)
+    if link_mode == "hardlink" and src_stat.st_dev == dst_stat.st_dev:
+        return same_inode
+    if link_mode == "copy" and same_inode:
+        return False
+    # Copies, reflinks and cross-device hardlink fallbacks keep the source
+    # mtime (copy2/copystat), so size + mtime identifies an unchanged file.
+    return (src_stat.st_size == dst_stat.st_size
+            and src_stat.st_mtime_ns == dst_stat.st_mtime_ns)
+
+
+def manifest_record(label: str, name: str, source: Path, origin: str) -> dict:
+    """One dataset entry: <label>/<name> is materialized from source."""
+    return {
+        "path": f"{label}/{name}",
+        "source": str(source),
+        "label": label,
+        "origin": origin,
+    }
+
+
+def write_manifest(records: list, manifest_path: Path):
+    """Write a dataset manifest CSV (path, source, label, origin)."""
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(manifest_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(records)
+
+
+def load_manifest(manifest_path: Path) -> list:
+    """Read a manifest written by write_manifest()."""
+    with open(manifest_path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def materialize_manifest(records: list, root: Path, link_mode: str = "copy",
+                         stats: dict = None) -> dict:
+    """
+    Make the tree under root match a manifest, touching only what differs.
+
+    Files not in the manifest are removed, missing or stale entries are
+    (re)placed with materialize_file(), and entries that are already up to
+    date are left alone. An entry whose source is its own destination (ESC-50
+    clips staged into processed/noise by script 03) is kept in place.
+
+    Returns:
+        Dict with counts of added, replaced, kept and removed files.
+    """
+    desired = {r["path"]: Path(r["source"]) for r in records}
+    counts = {"added": 0, "replaced": 0, "kept": 0, "removed": 0}
+
+    if root.is_dir():
+        for p in sorted(root.rglob("*")):
+            if p.is_dir() and not p.is_symlink():
+                continue
+            if p.relative_to(root).as_posix() not in desired:
+                p.unlink()
+                counts["removed"] += 1
+        subdirs = [d for d in root.rglob("*") if d.is_dir() and not d.is_symlink()]
+        for d in sorted(subdirs, reverse=True):
+            if not any(d.iterdir()):
+                d.rmdir()
+
+    for rel_path, src in desired.items():
+        dst = root / rel_path
+        if (os.path.abspath(src) == os.path.abspath(dst)
+                or _is_current(src, dst, link_mode)):
+            counts["kept"] += 1
+            continue
+        if os.path.lexists(dst):
+            dst.unlink()
+            counts["replaced"] += 1
+        else:
+            counts["added"] += 1
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        materialize_file(src, dst, link_mode, stats)
+
+    return counts
+
+
+def build_variant(name: str, records: list, root: Path, link_mode: str,
+                  manifests_dir: Path, link_stats: dict,
+                  manifest_only: bool = False) -> dict:
+    """Write the manifest for one dataset variant and materialize it."""
+    manifest_path = manifests_dir / f"{name}.csv"
+    write_manifest(records, manifest_path)
+    if manifest_only:
+        print(f"    {name}: manifest only ({len(records)} entries) -> {manifest_path}")
+        return {}
+    counts = materialize_manifest(records, root, link_mode, link_stats)
+    print(f"    {name}: +{counts['added']} added, {counts['replaced']} replaced, "
+          f"{counts['kept']} kept, -{counts['removed']} removed")
+    return counts
 
 
 def load_classifications(csv_path: Path) -> list:
-    """Load segment classifications from CSV produced by script 02."""
-    rows = []
-    with open(csv_path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            rows.append(row)
+    """
+    Load segment classifications produced by script 02 (CSV or Parquet).
+
+    Only the columns needed to assemble the dataset are read.
+    """
+    table = load_classifications_table(
+        csv_path, columns=["species_folder", "filepath", "classification"]
+    )
+    rows = table.astype(str).to_dict("records")
     print(f"  Loaded {len(rows)} segment classifications from {csv_path.name}")
     return rows
 
@@ -53,10 +230,23 @@ def build_dataset(classifications_csv: Path,
                   segments_dir: Path,
                   output_with_noise: Path,
                   output_no_noise: Path,
-                  esc50_noise_dir: Path = None) -> dict:
+                  esc50_noise_dir: Path = None,
+                  link_mode: str = "copy",
+                  manifests_dir: Path = MANIFESTS_DIR,
+                  manifest_only: bool = False) -> dict:
     """
     Build BirdNET-compatible dataset from classified segments.
 
+    link_mode ("copy", "hardlink", "symlink", "reflink") controls how
+    segments are placed; the no-noise variant links to the same physical
+    files as the with-noise variant.
+
+    Each variant is first described by a manifest of (path, source, label,
+    origin) records written to manifests_dir, then materialized by diffing
+    against the existing folder: after a threshold change only segments
+    whose label flipped are added or removed. With manifest_only=True the
+    folders are left untouched.
+
     Dataset structure (output_with_noise):
         processed/
             Pellorneum ruficeps/
@@ -79,6 +269,8 @@ def build_dataset(classifications_csv: Path,
     print(f"Classifications: {classifications_csv}")
     print(f"With noise:      {output_with_noise}")
     print(f"Without noise:   {output_no_noise}")
+    print(f"Link mode:       {link_mode}")
+    print(f"Manifests:       {manifests_dir}")
     print("=" * 60)
 
     start_time = time.time()
@@ -117,88 +309,85 @@ def build_dataset(classifications_csv: Path,
             elif label == "noise":
                 noise_segments.append(filepath)
 
-    # --- Build WITH-NOISE dataset ---
-    print(f"\n  Building WITH-NOISE dataset...")
-    if output_with_noise.exists():
-        shutil.rmtree(output_with_noise)
-
+    # --- WITH-NOISE manifest ---
+    with_noise_records = []
     stats_with_noise = {"species_segments": 0, "noise_segments": 0, "species_count": 0}
+    link_stats = {"fallback_copies": 0}
 
-    # Copy bird segments
+    # Bird segments
     for species_name in SPECIES_NAMES:
         src_files = species_bird_segments.get(species_name, [])
+        origin = "segment"
         if not src_files:
             # Fallback: check for the folder directly in segments_dir
             seg_folder = segments_dir / species_name
             if seg_folder.is_dir():
                 src_files = sorted(seg_folder.glob("*.wav"))
+                origin = "segments_dir"
 
         if src_files:
-            dest_dir = output_with_noise / species_name
-            dest_dir.mkdir(parents=True, exist_ok=True)
             for f in src_files:
                 if f.is_file():
-                    shutil.copy2(str(f), str(dest_dir / f.name))
+                    with_noise_records.append(
+                        manifest_record(species_name, f.name, f, origin))
                     stats_with_noise["species_segments"] += 1
             stats_with_noise["species_count"] += 1
 
             if VERBOSE:
                 print(f"    {species_name:40s} | {len(src_files):4d} bird segments")
 
-    # Build noise folder (3 sources combined)
+    # Noise folder (3 sources combined)
     noise_dir = output_with_noise / NOISE_FOLDER_NAME
-    noise_dir.mkdir(parents=True, exist_ok=True)
 
     # Source 1: Pipeline-extracted noise from species folders
     for f in noise_segments:
         if f.is_file():
-            dest_name = f"species_noise_{f.name}"
-            shutil.copy2(str(f), str(noise_dir / dest_name))
-            stats_with_noise["noise_segments"] += 1
+            with_noise_records.append(manifest_record(
+                NOISE_FOLDER_NAME, f"species_noise_{f.name}", f, "species_noise"))
 
     # Source 2: Mystery mystery noise
     for f in mystery_noise_segments:
         if f.is_file():
-            dest_name = f"mystery_{f.name}"
-            shutil.copy2(str(f), str(noise_dir / dest_name))
-            stats_with_noise["noise_segments"] += 1
+            with_noise_records.append(manifest_record(
+                NOISE_FOLDER_NAME, f"mystery_{f.name}", f, "mystery_noise"))
 
-    # Source 3: ESC-50 noise (already extracted by script 03)
+    # Source 3: ESC-50 noise (already extracted by script 03). With the
+    # default paths these clips live in the output noise folder itself and
+    # are recorded in place.
     if esc50_noise_dir is None:
-        esc50_noise_dir = output_with_noise / NOISE_FOLDER_NAME
-        # Check if ESC-50 files were previously extracted to a staging dir
-        staging_noise = PROCESSED_DIR / NOISE_FOLDER_NAME
-        if staging_noise.is_dir() and staging_noise != noise_dir:
-            esc50_noise_dir = staging_noise
-
-    # Look for ESC-50 files in the staging noise directory
-    esc50_staging = DATA_DIR / "processed" / NOISE_FOLDER_NAME
-    if esc50_staging.is_dir() and esc50_staging != noise_dir:
-        for f in esc50_staging.glob("esc50_*.wav"):
-            shutil.copy2(str(f), str(noise_dir / f.name))
-            stats_with_noise["noise_segments"] += 1
+        esc50_noise_dir = PROCESSED_DIR / NOISE_FOLDER_NAME
+    n_esc50 = 0
+    if esc50_noise_dir.is_dir():
+        for f in sorted(esc50_noise_dir.glob("esc50_*.wav")):
+            with_noise_records.append(
+                manifest_record(NOISE_FOLDER_NAME, f.name, f, "esc50"))
+            n_esc50 += 1
+
+    stats_with_noise["noise_segments"] = sum(
+        1 for r in with_noise_records if r["label"] == NOISE_FOLDER_NAME)
+
+    # --- NO-NOISE manifest: same species entries, no noise folder ---
+    no_noise_records = [r for r in with_noise_records
+                        if r["label"] != NOISE_FOLDER_NAME]
+    stats_no_noise = {
+        "species_segments": len(no_noise_records),
+        "species_count": len({r["label"] for r in no_noise_records}),
+    }
+
+    print(f"\n  Materializing datasets (manifests -> {manifests_dir})...")
+    stats_with_noise["materialize"] = build_variant(
+        "with_noise", with_noise_records, output_with_noise, link_mode,
+        manifests_dir, link_stats, manifest_only)
+    stats_no_noise["materialize"] = build_variant(
+        "no_noise", no_noise_records, output_no_noise, link_mode,
+        manifests_dir, link_stats, manifest_only)
 
     print(f"\n    Noise folder: {stats_with_noise['noise_segments']} total segments")
     print(f"      - Pipeline noise from species: {len(noise_segments)}")
     print(f"      - Mystery mystery noise:       {len(mystery_noise_segments)}")
+    print(f"      - ESC-50 noise:                {n_esc50}")
     print(f"      - Mystery mystery birds (set aside): {len(mystery_bird_segments)}")
 
-    # --- Build NO-NOISE dataset ---
-    print(f"\n  Building NO-NOISE dataset...")
-    if output_no_noise.exists():
-        shutil.rmtree(output_no_noise)
-
-    stats_no_noise = {"species_segments": 0, "species_count": 0}
-
-    for species_name in SPECIES_NAMES:
-        src_dir = output_with_noise / species_name
-        if src_dir.is_dir():
-            dest_dir = output_no_noise / species_name
-            shutil.copytree(str(src_dir), str(dest_dir))
-            n_files = len(list(dest_dir.glob("*.wav")))
-            stats_no_noise["species_segments"] += n_files
-            stats_no_noise["species_count"] += 1
-
     elapsed = time.time() - start_time
 
     print(f"\n{'=' * 60}")
@@ -213,78 +402,95 @@ def build_dataset(classifications_csv: Path,
     print(f"    Species:   {stats_no_noise['species_count']}")
     print(f"    Bird segs: {stats_no_noise['species_segments']}")
     print(f"    Path:      {output_no_noise}")
+    if link_mode != "copy":
+        print(f"  Link mode: {link_mode} "
+              f"({link_stats['fallback_copies']} fell back to copies)")
     print(f"  Time elapsed: {elapsed:.1f}s")
     print(f"{'=' * 60}")
 
     return {
         "with_noise": stats_with_noise,
         "no_noise": stats_no_noise,
+        "link": link_stats,
     }
 
 
-def build_fewshot_subsets(source_dir: Path, output_base: Path,
+def fewshot_variant_name(n_samples: int, seed: int = 42) -> str:
+    """Folder / manifest name of a few-shot subset (seed 42 keeps the old name)."""
+    if seed == 42:
+        return f"fewshot_{n_samples}"
+    return f"fewshot_{n_samples}_seed{seed}"
+
+
+def build_fewshot_subsets(source_manifest: Path, output_base: Path,
                           sample_sizes: list = None,
-                          seed: int = 42) -> dict:
+                          seed: int = 42,
+                          link_mode: str = "copy",
+                          manifests_dir: Path = MANIFESTS_DIR,
+                          manifest_only: bool = False) -> dict:
     """
     Create few-shot subsets for Experiment 3 (data size sensitivity).
 
     For each sample_size, randomly sample that many segments per species
-    from the full dataset, plus include all noise files.
+    from the WITH-NOISE manifest, plus include all noise files. Subsets are
+    drawn from the manifest rather than the materialized folder, so they
+    can be built before (or without) the full dataset on disk.
 
     Args:
-        source_dir: Path to the full WITH-NOISE dataset.
+        source_manifest: Manifest CSV of the full WITH-NOISE dataset.
         output_base: Base directory for few-shot datasets.
         sample_sizes: List of per-species sample counts (e.g., [10, 25, 50]).
         seed: Random seed for reproducibility.
+        link_mode: How files are placed (see materialize_file).
+        manifests_dir: Where the per-subset manifests are written.
+        manifest_only: Write manifests without materializing the folders.
     """
     if sample_sizes is None:
         sample_sizes = [10, 25, 50]
 
-    print(f"\n  Building few-shot subsets: {sample_sizes}")
+    records_by_label = defaultdict(list)
+    for r in load_manifest(source_manifest):
+        records_by_label[r["label"]].append(r)
+
+    print(f"\n  Building few-shot subsets: {sample_sizes} (seed {seed})")
     random.seed(seed)
     stats = {}
+    link_stats = {"fallback_copies": 0}
 
     for n_samples in sample_sizes:
-        subset_dir = output_base / f"fewshot_{n_samples}"
-        if subset_dir.exists():
-            shutil.rmtree(subset_dir)
-        subset_dir.mkdir(parents=True, exist_ok=True)
-
-        total_segments = 0
-
-        for species_dir in sorted(source_dir.iterdir()):
-            if not species_dir.is_dir():
-                continue
-
-            dest_dir = subset_dir / species_dir.name
-
-            if species_dir.name == NOISE_FOLDER_NAME:
-                # Copy ALL noise files (not subsampled)
-                shutil.copytree(str(species_dir), str(dest_dir))
-                total_segments += len(list(dest_dir.glob("*.wav")))
+        name = fewshot_variant_name(n_samples, seed)
+        subset_records = []
+
+        for label in sorted(records_by_label):
+            label_records = sorted(records_by_label[label],
+                                   key=lambda r: r["path"])
+            if label == NOISE_FOLDER_NAME:
+                # ALL noise files (not subsampled)
+                subset_records.extend(label_records)
             else:
                 # Subsample bird species
-                all_files = sorted(species_dir.glob("*.wav"))
-                selected = random.sample(all_files, min(n_samples, len(all_files)))
-
-                dest_dir.mkdir(parents=True, exist_ok=True)
-                for f in selected:
-                    shutil.copy2(str(f), str(dest_dir / f.name))
-                total_segments += len(selected)
-
-        stats[n_samples] = total_segments
-        print(f"    fewshot_{n_samples}: {total_segments} total segments -> {subset_dir}")
-
+                subset_records.extend(random.sample(
+                    label_records, min(n_samples, len(label_records))))
+
+        stats[n_samples] = len(subset_records)
+        subset_dir = output_base / name
+        print(f"    {name}: {len(subset_records)} total segments -> {subset_dir}")
+        build_variant(name, subset_records, subset_dir, link_mode,
+                      manifests_dir, link_stats, manifest_only)
+
+    if link_mode != "copy":
+        print(f"    Link mode: {link_mode} "
+              f"({link_stats['fallback_copies']} fell back to copies)")
     return stats
 
 
-def main():
+def main(argv: list = None):
     parser = argparse.ArgumentParser(
         description="Build BirdNET-compatible datasets from classified segments."
     )
     parser.add_argument("--classifications_csv", type=str,
                         default=str(RESULTS_DIR / "segment_classifications.csv"),
-                        help="Path to segment classifications CSV")
+                        help="Path to segment classifications CSV (or .parquet)")
     parser.add_argument("--segments_dir", type=str, default=str(SEGMENTS_DIR),
                         help="Path to segmented audio directory")
     parser.add_argument("--output_with_noise", type=str, default=str(PROCESSED_DIR),
@@ -293,21 +499,38 @@ def main():
                         help="Path for dataset without noise class")
     parser.add_argument("--build_fewshot", action="store_true",
                         help="Also build few-shot subsets for Experiment 3")
-    args = parser.parse_args()
+    parser.add_argument("--link-mode", dest="link_mode", type=str, default="copy",
+                        choices=LINK_MODES,
+                        help="How segments are placed in each dataset variant "
+                             "(default: copy)")
+    parser.add_argument("--seed", type=int, default=42,
+                        help="Random seed for few-shot sampling (default: 42)")
+    parser.add_argument("--manifests_dir", type=str, default=str(MANIFESTS_DIR),
+                        help="Where dataset manifests are written")
+    parser.add_argument("--manifest_only", action="store_true",
+                        help="Write manifests only; do not touch dataset folders")
+    args = parser.parse_args(argv)
 
     ensure_dirs()
 
     build_dataset(
-        classifications_csv=Path(args.classifications_csv),
+        classifications_csv=resolve_classifications_path(Path(args.classifications_csv)),
         segments_dir=Path(args.segments_dir),
         output_with_noise=Path(args.output_with_noise),
         output_no_noise=Path(args.output_no_noise),
+        link_mode=args.link_mode,
+        manifests_dir=Path(args.manifests_dir),
+        manifest_only=args.manifest_only,
     )
 
     if args.build_fewshot:
         build_fewshot_subsets(
-            source_dir=Path(args.output_with_noise),
+            source_manifest=Path(args.manifests_dir) / "with_noise.csv",
             output_base=DATA_DIR / "fewshot_subsets",
+            seed=args.seed,
+            link_mode=args.link_mode,
+            manifests_dir=Path(args.manifests_dir),
+            manifest_only=args.manifest_only,
         )
 
 
@@ -12,12 +12,32 @@ Each experiment:
   2. Evaluates on the IBC53 test set
   3. Saves detection results as CSV
 
+Experiments are independent, so --max_parallel runs several at once, each
+BirdNET process capped at --threads_per_job CPU threads and logging to
+logs/<experiment>.log.
+
+Evaluation runs in-process by default (--engine inprocess): test files are
+decoded once, their windows batched across files and scored by a pool of
+TFLite interpreters, and each experiment writes a single
+results/<experiment>/detections.csv. --engine birdnet shells out to
+birdnet_analyzer.analyze instead (per-file CSVs). --experiment evaluate
+skips training and scores the baseline and every classifier in models/
+from a single decode pass over the test audio.
+
+BirdNET output is streamed live and tee'd into the log with elapsed-time
+stamps; epoch, metric and per-file lines are also written to
+logs/<experiment>.progress.jsonl. Commands that exceed --timeout or print
+nothing for --stall_timeout seconds are killed.
+
 Usage:
     python scripts/05_train_and_evaluate.py --experiment baseline
     python scripts/05_train_and_evaluate.py --experiment exp1
     python scripts/05_train_and_evaluate.py --experiment exp2
     python scripts/05_train_and_evaluate.py --experiment exp3
     python scripts/05_train_and_evaluate.py --experiment all
+    python scripts/05_train_and_evaluate.py --experiment all --max_parallel 3 --threads_per_job 8
+    python scripts/05_train_and_evaluate.py --experiment baseline --engine birdnet
+    python scripts/05_train_and_evaluate.py --experiment evaluate
 
 Pipeline Position: FIFTH step — runs after 04_build_dataset.py
 Requires: birdnet-analyzer[train] installed
@@ -25,55 +45,262 @@ Output: Trained .tflite classifiers + detection CSV results
 """
 
 import argparse
+import json
+import os
+import re
 import subprocess
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 from configs.config import (
     IBC53_RAW_DIR, PROCESSED_DIR, PROCESSED_NO_NOISE_DIR,
     DATA_DIR, MODELS_DIR, RESULTS_DIR, MIN_CONFIDENCE,
-    VERBOSE, ensure_dirs,
+    EXPERIMENTS, LOG_DIR, VERBOSE, ensure_dirs,
 )
+from scripts._detections import BIRDNET_RESULTS_PATTERN, EXPERIMENT_DETECTIONS_FILE
+
+
+THREAD_ENV_VARS = [
+    "OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+    "TF_NUM_INTRAOP_THREADS",
+]
+
+
+def job_env(threads: int = None) -> dict:
+    """Environment for a BirdNET subprocess limited to `threads` CPU threads."""
+    env = os.environ.copy()
+    if threads:
+        for var in THREAD_ENV_VARS:
+            env[var] = str(threads)
+        env["TF_NUM_INTEROP_THREADS"] = "1"
+    return env
+
+
+COMMAND_TIMEOUT_S = 3600   # 1 hour max per BirdNET command
+STALL_TIMEOUT_S = 1800     # kill a command silent for this long
 
+EPOCH_RE = re.compile(r"Epoch (\d+)/(\d+)")
+METRIC_RE = re.compile(r"\b(\w*loss|\w*acc\w*|\w*auprc|\w*auroc|\w*prec\w*|lr): "
+                       r"([-+\d.eE]+)")
+FINISHED_RE = re.compile(r"Finished (.+?) in ([\d.]+) seconds")
 
-def run_command(cmd: list, description: str) -> bool:
-    """Run a shell command and print output."""
+
+def parse_progress_line(line: str) -> dict:
+    """
+    Extract a progress record from one line of BirdNET output.
+
+    Recognises Keras epoch headers ("Epoch 3/50"), metric lines
+    ("loss: 0.12 - val_loss: 0.20") and per-file analysis lines
+    ("Finished x.wav in 0.50 seconds"). Returns None for other lines.
+    """
+    m = EPOCH_RE.search(line)
+    if m:
+        return {"event": "epoch", "epoch": int(m.group(1)),
+                "epochs": int(m.group(2))}
+    metrics = METRIC_RE.findall(line)
+    if metrics:
+        record = {"event": "metrics"}
+        for key, value in metrics:
+            try:
+                record[key] = float(value)
+            except ValueError:
+                continue
+        return record if len(record) > 1 else None
+    m = FINISHED_RE.search(line)
+    if m:
+        return {"event": "file", "file": m.group(1),
+                "seconds": float(m.group(2))}
+    return None
+
+
+def run_command(cmd: list, description: str, log_path: Path = None,
+                threads: int = None, echo: bool = True,
+                timeout: float = COMMAND_TIMEOUT_S,
+                stall_timeout: float = STALL_TIMEOUT_S) -> bool:
+    """
+    Run a shell command, streaming its output line by line.
+
+    Each line is printed as it arrives (unless echo=False, used for
+    concurrent jobs) and appended to log_path with an elapsed-time stamp.
+    Epoch, metric and per-file lines are also recorded as JSON lines in
+    <log>.progress.jsonl. The command is killed after `timeout` seconds,
+    or after `stall_timeout` seconds without output (0 disables either).
+    """
     print(f"\n  [{description}]")
     print(f"  Command: {' '.join(cmd)}")
     print("-" * 50)
 
+    log = progress = None
+    if log_path is not None:
+        log = open(log_path, "a")
+        log.write(f"\n[{description}]\nCommand: {' '.join(cmd)}\n")
+        log.flush()
+        progress = open(log_path.with_suffix(".progress.jsonl"), "a")
+
+    start = time.time()
+    last_output = [start]
+    n_files = [0]
+
+    def pump(stream):
+        # BirdNET prints progress to stderr; both streams are merged
+        for line in stream:
+            now = time.time()
+            last_output[0] = now
+            elapsed = now - start
+            line = line.rstrip()
+            if echo:
+                print(line, flush=True)
+            if log is not None:
+                log.write(f"[{elapsed:8.1f}s] {line}\n")
+                log.flush()
+            record = parse_progress_line(line)
+            if record is None:
+                continue
+            if record["event"] == "file":
+                n_files[0] += 1
+                record["files_done"] = n_files[0]
+            record = {"t": round(elapsed, 2), "step": description, **record}
+            if progress is not None:
+                progress.write(json.dumps(record) + "\n")
+                progress.flush()
+            if not echo and record["event"] == "epoch":
+                print(f"  [{description}] epoch {record['epoch']}/"
+                      f"{record['epochs']} ({elapsed / 60:.1f} min)", flush=True)
+
     try:
-        result = subprocess.run(
+        proc = subprocess.Popen(
             cmd,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True,
-            timeout=3600,  # 1 hour max
+            bufsize=1,
+            env=job_env(threads),
         )
-        if result.stdout:
-            print(result.stdout)
-        if result.stderr:
-            # BirdNET prints progress to stderr
-            print(result.stderr)
-
-        if result.returncode != 0:
-            print(f"  [ERROR] Command failed with return code {result.returncode}")
-            return False
-        return True
-
-    except subprocess.TimeoutExpired:
-        print(f"  [ERROR] Command timed out after 1 hour")
-        return False
     except FileNotFoundError:
         print(f"  [ERROR] Command not found. Is birdnet-analyzer installed?")
         print(f"  Run: pip install birdnet-analyzer[train]")
+        for f in (log, progress):
+            if f is not None:
+                f.close()
+        return False
+
+    reader = threading.Thread(target=pump, args=(proc.stdout,), daemon=True)
+    reader.start()
+
+    failure = None
+    while proc.poll() is None:
+        reader.join(timeout=1.0)
+        now = time.time()
+        if timeout and now - start > timeout:
+            failure = f"timed out after {timeout:g}s"
+        elif stall_timeout and now - last_output[0] > stall_timeout:
+            failure = f"stalled: no output for {stall_timeout:g}s"
+        if failure:
+            proc.kill()
+            break
+    proc.wait()
+    reader.join()
+    proc.stdout.close()
+
+    elapsed = time.time() - start
+    if log is not None:
+        log.write(f"[{elapsed:8.1f}s] exit code {proc.returncode}\n")
+    for f in (log, progress):
+        if f is not None:
+            f.close()
+
+    if failure:
+        print(f"  [ERROR] {description}: command {failure}")
+        return False
+    if proc.returncode != 0:
+        print(f"  [ERROR] {description}: command failed with return code "
+              f"{proc.returncode}")
         return False
+    return True
+
 
+DETECTIONS_FILE = EXPERIMENT_DETECTIONS_FILE
 
-def run_baseline(test_dir: Path, results_dir: Path) -> bool:
+
+def clear_stale_results(output_dir: Path, engine: str):
+    """
+    Remove result files the other engine left in output_dir.
+
+    The in-process engine writes one detections.csv; birdnet_analyzer
+    writes <species>/*.BirdNET.results.csv. The analysis scripts read only
+    one layout per folder, so files from an earlier run with the other
+    engine would shadow (or be shadowed by) the new results.
+    """
+    if engine == "inprocess":
+        stale = list(output_dir.rglob(BIRDNET_RESULTS_PATTERN))
+    else:
+        stale = [output_dir / DETECTIONS_FILE]
+    removed = 0
+    for path in stale:
+        if path.is_file():
+            path.unlink()
+            removed += 1
+    if removed:
+        print(f"  Removed {removed} stale result file(s) from {output_dir}")
+
+
+def run_inprocess_eval(model_path: Path, test_dir: Path, output_dir: Path,
+                       description: str, labels_path: Path = None,
+                       log_path: Path = None, threads: int = None,
+                       **_run_opts) -> bool:
+    """
+    Evaluate a classifier in-process and write output_dir/detections.csv.
+
+    Replaces a `birdnet_analyzer.analyze` subprocess: no interpreter or
+    TensorFlow start-up per experiment, and one detections table instead
+    of one CSV per test file. The table uses BirdNET-Analyzer's column
+    names, so 06_analyze_results.py reads it unchanged.
+    """
+    from scripts._inference_lib import (
+        run_inference, list_test_files, write_detections,
+    )
+
+    print(f"\n  [{description}]")
+    print(f"  Model: {model_path}")
+    print("-" * 50)
+
+    start = time.time()
+    files = list_test_files(test_dir)
+    if not files:
+        print(f"  [ERROR] No audio files found in {test_dir}")
+        return False
+
+    try:
+        table = run_inference(model_path, files, labels_path=labels_path,
+                              sigmoid=True, min_conf=MIN_CONFIDENCE,
+                              threads=threads or 1)
+    except Exception as e:
+        print(f"  [ERROR] {description}: {e}")
+        return False
+
+    clear_stale_results(output_dir, "inprocess")
+    output_path = output_dir / DETECTIONS_FILE
+    write_detections(table, output_path)
+    elapsed = time.time() - start
+    summary = (f"Finished {len(files)} files in {elapsed:.2f} seconds: "
+               f"{len(table)} detections -> {output_path}")
+    print(f"  {summary}")
+    if log_path is not None:
+        with open(log_path, "a") as log:
+            log.write(f"\n[{description}]\n[{elapsed:8.1f}s] {summary}\n")
+    return True
+
+
+def run_baseline(test_dir: Path, results_dir: Path,
+                 engine: str = "inprocess", **run_opts) -> bool:
     """
     Baseline experiment: Run pre-trained BirdNET on IBC53 with no fine-tuning.
+
+    run_opts are passed to run_command (log_path, threads, echo, timeouts).
     """
     print("=" * 60)
     print("EXPERIMENT: Baseline (Pre-trained BirdNET)")
@@ -82,6 +309,17 @@ def run_baseline(test_dir: Path, results_dir: Path) -> bool:
     output_dir = results_dir / "baseline"
     output_dir.mkdir(parents=True, exist_ok=True)
 
+    if engine == "inprocess":
+        from scripts._inference_lib import find_base_model
+        base = find_base_model()
+        if base is not None:
+            model_path, labels_path = base
+            return run_inprocess_eval(model_path, test_dir, output_dir,
+                                      "Baseline evaluation",
+                                      labels_path=labels_path, **run_opts)
+        print("  [WARN] BirdNET base model not found; "
+              "falling back to birdnet_analyzer.analyze")
+
     cmd = [
         sys.executable, "-m", "birdnet_analyzer.analyze",
         str(test_dir),
@@ -89,15 +327,37 @@ def run_baseline(test_dir: Path, results_dir: Path) -> bool:
         "--min_conf", str(MIN_CONFIDENCE),
         "--rtype", "csv",
     ]
+    if run_opts.get("threads"):
+        cmd += ["--threads", str(run_opts["threads"])]
 
-    return run_command(cmd, "Baseline evaluation")
+    clear_stale_results(output_dir, "birdnet")
+    return run_command(cmd, "Baseline evaluation", **run_opts)
+
+
+def find_classifier(model_dir: Path, classifier_name: str) -> Path:
+    """
+    Path of the trained classifier in model_dir, or None if there is none.
+
+    BirdNET saves as CustomClassifier.tflite by default, so any .tflite
+    in model_dir is accepted when <classifier_name>.tflite is missing.
+    """
+    classifier_path = model_dir / f"{classifier_name}.tflite"
+    if classifier_path.is_file():
+        return classifier_path
+    alt_paths = sorted(model_dir.rglob("*.tflite")) if model_dir.is_dir() else []
+    if alt_paths:
+        print(f"  Classifier found at: {alt_paths[0]}")
+        return alt_paths[0]
+    return None
 
 
 def run_train_and_evaluate(train_dir: Path, test_dir: Path,
                             model_dir: Path, results_dir: Path,
                             classifier_name: str,
                             experiment_name: str,
-                            autotune: bool = False) -> bool:
+                            autotune: bool = False,
+                            engine: str = "inprocess",
+                            **run_opts) -> bool:
     """
     Train a custom BirdNET classifier and evaluate it.
 
@@ -109,6 +369,8 @@ def run_train_and_evaluate(train_dir: Path, test_dir: Path,
         classifier_name: Name for the .tflite classifier file.
         experiment_name: Display name for this experiment.
         autotune: Whether to use keras-tuner for hyperparameter tuning.
+        engine: 'inprocess' (BirdClassifier) or 'birdnet' (analyze subprocess).
+        run_opts: Passed to run_command (log_path, threads, echo, timeouts).
     """
     print("=" * 60)
     print(f"EXPERIMENT: {experiment_name}")
@@ -129,26 +391,26 @@ def run_train_and_evaluate(train_dir: Path, test_dir: Path,
     if autotune:
         train_cmd.append("--autotune")
 
-    success = run_command(train_cmd, f"Training {classifier_name}")
+    success = run_command(train_cmd, f"Training {classifier_name}", **run_opts)
     if not success:
         print(f"  [ERROR] Training failed for {experiment_name}")
         return False
 
     # Verify classifier was created
-    # BirdNET saves as CustomClassifier.tflite by default
-    classifier_path = model_dir / f"{classifier_name}.tflite"
-    if not classifier_path.is_file():
-        # Check alternative names
-        alt_paths = list(model_dir.rglob("*.tflite"))
-        if alt_paths:
-            classifier_path = alt_paths[0]
-            print(f"  Classifier found at: {classifier_path}")
-        else:
-            print(f"  [ERROR] No .tflite classifier found in {model_dir}")
-            print(f"  Contents of {model_dir}: {list(model_dir.iterdir())}")
-            return False
+    classifier_path = find_classifier(model_dir, classifier_name)
+    if classifier_path is None:
+        print(f"  [ERROR] No .tflite classifier found in {model_dir}")
+        print(f"  Contents of {model_dir}: {list(model_dir.iterdir())}")
+        return False
 
     # --- Step 2: Evaluate ---
+    if engine == "inprocess":
+        success = run_inprocess_eval(classifier_path, test_dir, exp_results_dir,
+                                     f"Evaluating {classifier_name}", **run_opts)
+        if not success:
+            print(f"  [WARN] Evaluation failed for {experiment_name}")
+        return True
+
     eval_cmd = [
         sys.executable, "-m", "birdnet_analyzer.analyze",
         str(test_dir),
@@ -157,102 +419,335 @@ def run_train_and_evaluate(train_dir: Path, test_dir: Path,
         "--min_conf", str(MIN_CONFIDENCE),
         "--rtype", "csv",
     ]
+    if run_opts.get("threads"):
+        eval_cmd += ["--threads", str(run_opts["threads"])]
 
-    success = run_command(eval_cmd, f"Evaluating {classifier_name}")
+    clear_stale_results(exp_results_dir, "birdnet")
+    success = run_command(eval_cmd, f"Evaluating {classifier_name}", **run_opts)
     if not success:
         print(f"  [WARN] Evaluation failed for {experiment_name}")
 
     return True
 
 
-def run_experiment(experiment: str, test_dir: Path = None,
-                   autotune: bool = False):
+def experiment_classifiers(models_dir: Path = MODELS_DIR) -> list:
     """
-    Run one or all experiments.
+    (model_dir, classifier_name) for every fine-tuned experiment in the
+    EXPERIMENTS config, whether or not it has been trained yet.
 
-    Args:
-        experiment: One of 'baseline', 'exp1', 'exp2', 'exp3', 'all'.
-        test_dir: Path to test audio (defaults to IBC53_RAW_DIR).
-        autotune: Whether to use hyperparameter tuning.
+    Model folders are named after the config keys, as in plan_experiments()
+    (few-shot runs add _<n_samples>). Reads nothing from disk.
     """
-    if test_dir is None:
-        test_dir = IBC53_RAW_DIR
+    pairs = []
+    for key, exp in EXPERIMENTS.items():
+        if exp.get("classifier"):
+            pairs.append((Path(models_dir) / key, exp["classifier"]))
+        for n_samples in exp.get("sample_sizes", []):
+            pairs.append((Path(models_dir) / f"{key}_{n_samples}",
+                          f"{exp['classifier_prefix']}_{n_samples}"))
+    return pairs
+
+
+def collect_classifiers(models_dir: Path = MODELS_DIR,
+                        include_baseline: bool = True) -> dict:
+    """
+    Every classifier available for evaluation, keyed by results folder.
 
-    start_time = time.time()
-    results = {}
+    Experiment models map to their classifier name (Exp1_NoNoise, ...);
+    any other .tflite under models_dir is keyed by its file stem. The
+    pre-trained BirdNET model is added as "baseline" when installed.
+
+    Returns:
+        {name: {"model_path": ..., "labels_path": ...}} for
+        run_inference_multi().
+    """
+    from scripts._inference_lib import find_base_model
+
+    models = {}
+    if include_baseline:
+        base = find_base_model()
+        if base is not None:
+            models["baseline"] = {"model_path": base[0], "labels_path": base[1]}
+        else:
+            print("  [WARN] BirdNET base model not found; skipping baseline")
+
+    claimed = set()
+    for model_dir, classifier_name in experiment_classifiers(models_dir):
+        path = find_classifier(model_dir, classifier_name)
+        if path is not None:
+            models[classifier_name] = {"model_path": path}
+            claimed.add(path.resolve())
+
+    for path in sorted(Path(models_dir).rglob("*.tflite")):
+        if path.resolve() not in claimed and path.stem not in models:
+            models[path.stem] = {"model_path": path}
+    return models
+
+
+def run_evaluate_all(test_dir: Path, results_dir: Path = RESULTS_DIR,
+                     models_dir: Path = MODELS_DIR, threads: int = None) -> dict:
+    """
+    Evaluate every available classifier in a single decode pass.
+
+    Each test file is decoded and windowed once and every window batch is
+    scored by all models, so an extra experiment costs only its inference
+    time. Writes results/<name>/detections.csv per model.
+
+    Returns:
+        {name: True} for each model evaluated (empty if none were found).
+    """
+    from scripts._inference_lib import (
+        run_inference_multi, list_test_files, write_detections,
+    )
+    from scripts._audio_cache import prune_audio_cache
+
+    print("=" * 60)
+    print("EVALUATION: All classifiers, single pass")
+    print("=" * 60)
+
+    models = collect_classifiers(models_dir)
+    if not models:
+        print(f"  [ERROR] No classifiers found in {models_dir}")
+        return {}
+    files = list_test_files(test_dir)
+    if not files:
+        print(f"  [ERROR] No audio files found in {test_dir}")
+        return {}
+    for name, spec in models.items():
+        print(f"  {name:<20s} {spec['model_path']}")
+
+    start = time.time()
+    tables = run_inference_multi(models, files, min_conf=MIN_CONFIDENCE,
+                                 threads=threads or 1)
+    for name, table in tables.items():
+        clear_stale_results(results_dir / name, "inprocess")
+        output_path = results_dir / name / DETECTIONS_FILE
+        write_detections(table, output_path)
+        print(f"  {name}: {len(table)} detections -> {output_path}")
+
+    elapsed = time.time() - start
+    print(f"\n  Finished {len(files)} files x {len(models)} models "
+          f"in {elapsed:.2f} seconds")
+    prune_audio_cache()
+    return {name: True for name in tables}
+
+
+def plan_experiments(experiment: str, test_dir: Path,
+                     autotune: bool = False, engine: str = "inprocess") -> list:
+    """
+    List the independent jobs for one or all experiments.
+
+    Returns:
+        List of (name, function, kwargs) tuples, in the serial run order.
+    """
+    jobs = []
 
     if experiment in ("baseline", "all"):
-        results["baseline"] = run_baseline(test_dir, RESULTS_DIR)
+        jobs.append(("baseline", run_baseline,
+                     {"test_dir": test_dir, "results_dir": RESULTS_DIR,
+                      "engine": engine}))
 
     if experiment in ("exp1", "all"):
-        results["exp1"] = run_train_and_evaluate(
-            train_dir=PROCESSED_NO_NOISE_DIR,
-            test_dir=test_dir,
-            model_dir=MODELS_DIR / "exp1_no_noise",
-            results_dir=RESULTS_DIR,
-            classifier_name="Exp1_NoNoise",
-            experiment_name="Exp 1: Fine-tune WITHOUT Noise Class",
-            autotune=autotune,
-        )
+        jobs.append(("exp1", run_train_and_evaluate, {
+            "train_dir": PROCESSED_NO_NOISE_DIR,
+            "test_dir": test_dir,
+            "model_dir": MODELS_DIR / "exp1_no_noise",
+            "results_dir": RESULTS_DIR,
+            "classifier_name": "Exp1_NoNoise",
+            "experiment_name": "Exp 1: Fine-tune WITHOUT Noise Class",
+            "autotune": autotune,
+            "engine": engine,
+        }))
 
     if experiment in ("exp2", "all"):
-        results["exp2"] = run_train_and_evaluate(
-            train_dir=PROCESSED_DIR,
-            test_dir=test_dir,
-            model_dir=MODELS_DIR / "exp2_with_noise",
-            results_dir=RESULTS_DIR,
-            classifier_name="Exp2_WithNoise",
-            experiment_name="Exp 2: Fine-tune WITH Noise Class (KEY)",
-            autotune=autotune,
-        )
+        jobs.append(("exp2", run_train_and_evaluate, {
+            "train_dir": PROCESSED_DIR,
+            "test_dir": test_dir,
+            "model_dir": MODELS_DIR / "exp2_with_noise",
+            "results_dir": RESULTS_DIR,
+            "classifier_name": "Exp2_WithNoise",
+            "experiment_name": "Exp 2: Fine-tune WITH Noise Class (KEY)",
+            "autotune": autotune,
+            "engine": engine,
+        }))
 
     if experiment in ("exp3", "all"):
         fewshot_base = DATA_DIR / "fewshot_subsets"
         for n_samples in [10, 25, 50]:
             fewshot_dir = fewshot_base / f"fewshot_{n_samples}"
             if fewshot_dir.is_dir():
-                results[f"exp3_{n_samples}"] = run_train_and_evaluate(
-                    train_dir=fewshot_dir,
-                    test_dir=test_dir,
-                    model_dir=MODELS_DIR / f"exp3_fewshot_{n_samples}",
-                    results_dir=RESULTS_DIR,
-                    classifier_name=f"Exp3_FewShot_{n_samples}",
-                    experiment_name=f"Exp 3: Few-Shot ({n_samples} samples/species)",
-                    autotune=autotune,
-                )
+                jobs.append((f"exp3_{n_samples}", run_train_and_evaluate, {
+                    "train_dir": fewshot_dir,
+                    "test_dir": test_dir,
+                    "model_dir": MODELS_DIR / f"exp3_fewshot_{n_samples}",
+                    "results_dir": RESULTS_DIR,
+                    "classifier_name": f"Exp3_FewShot_{n_samples}",
+                    "experiment_name": f"Exp 3: Few-Shot ({n_samples} samples/species)",
+                    "autotune": autotune,
+                    "engine": engine,
+                }))
             else:
                 print(f"  [WARN] Few-shot subset not found: {fewshot_dir}")
                 print(f"  Run: python scripts/04_build_dataset.py --build_fewshot")
 
+    return jobs
+
+
+def _run_job(name: str, func, kwargs: dict, log_dir: Path,
+             run_opts: dict) -> dict:
+    """Run one planned job with its own log file; never raises."""
+    log_path = log_dir / f"{name}.log"
+    log_path.write_text("")
+    log_path.with_suffix(".progress.jsonl").write_text("")
+    start = time.time()
+    try:
+        ok = func(**kwargs, log_path=log_path, **run_opts)
+    except Exception as e:
+        print(f"  [ERROR] {name}: {e}")
+        ok = False
+    return {"name": name, "ok": ok, "elapsed": time.time() - start,
+            "log": log_path}
+
+
+def print_summary_table(summary: list):
+    """Print one row per experiment: status, wall time and log file."""
+    print(f"\n  {'Experiment':<14s} {'Status':<8s} {'Time':>10s}  Log")
+    print(f"  {'-' * 56}")
+    for row in summary:
+        status = "OK" if row["ok"] else "FAILED"
+        print(f"  {row['name']:<14s} {status:<8s} "
+              f"{row['elapsed'] / 60:>8.1f}m  {row['log']}")
+
+
+def run_experiment(experiment: str, test_dir: Path = None,
+                   autotune: bool = False, max_parallel: int = 1,
+                   threads_per_job: int = None, log_dir: Path = LOG_DIR,
+                   timeout: float = COMMAND_TIMEOUT_S,
+                   stall_timeout: float = STALL_TIMEOUT_S,
+                   engine: str = "inprocess"):
+    """
+    Run one or all experiments.
+
+    Experiments are independent (each has its own training set, model
+    directory and results directory), so up to max_parallel of them run
+    at once. Each BirdNET subprocess is limited to threads_per_job CPU
+    threads (default: CPU count / max_parallel when running in parallel)
+    and streams its output to <log_dir>/<experiment>.log, with parsed
+    epoch/progress records in <experiment>.progress.jsonl.
+
+    Args:
+        experiment: One of 'baseline', 'exp1', 'exp2', 'exp3', 'all', or
+            'evaluate' (no training; score every classifier in models/ in
+            one pass over the test audio).
+        test_dir: Path to test audio (defaults to IBC53_RAW_DIR).
+        autotune: Whether to use hyperparameter tuning.
+        max_parallel: Number of experiments run concurrently.
+        threads_per_job: CPU threads per BirdNET subprocess.
+        log_dir: Directory for per-experiment log files.
+        timeout: Seconds before a single BirdNET command is killed.
+        stall_timeout: Seconds without output before a command is killed.
+        engine: 'inprocess' evaluates with BirdClassifier in this process;
+            'birdnet' runs birdnet_analyzer.analyze subprocesses.
+    """
+    if test_dir is None:
+        test_dir = IBC53_RAW_DIR
+    if experiment == "evaluate":
+        return run_evaluate_all(test_dir, threads=threads_per_job)
+    if threads_per_job is None and max_parallel > 1:
+        threads_per_job = max(1, (os.cpu_count() or 1) // max_parallel)
+
+    start_time = time.time()
+    jobs = plan_experiments(experiment, test_dir, autotune, engine)
+    log_dir.mkdir(parents=True, exist_ok=True)
+
+    # Concurrent jobs keep BirdNET output in their log files only
+    run_opts = {
+        "threads": threads_per_job,
+        "echo": max_parallel <= 1,
+        "timeout": timeout,
+        "stall_timeout": stall_timeout,
+    }
+    if max_parallel > 1:
+        print(f"\n  Scheduling {len(jobs)} experiments: {max_parallel} at a time, "
+              f"{threads_per_job} threads each")
+
+    summary = []
+    with ThreadPoolExecutor(max_workers=max(1, max_parallel)) as executor:
+        futures = [
+            executor.submit(_run_job, name, func, kwargs, log_dir, run_opts)
+            for name, func, kwargs in jobs
+        ]
+        for future in as_completed(futures):
+            row = future.result()
+            summary.append(row)
+            if max_parallel > 1:
+                status = "done" if row["ok"] else "FAILED"
+                print(f"  [{row['name']}] {status} in {row['elapsed'] / 60:.1f} min")
+
+    order = [name for name, _, _ in jobs]
+    summary.sort(key=lambda row: order.index(row["name"]))
+    results = {row["name"]: row["ok"] for row in summary}
+    if engine == "inprocess":
+        # Only once every job is done: pruning must not race their decodes
+        from scripts._audio_cache import prune_audio_cache
+        prune_audio_cache()
+
     elapsed = time.time() - start_time
 
     print(f"\n{'=' * 60}")
     print(f"ALL EXPERIMENTS COMPLETE")
-    print(f"  Results: {results}")
+    print_summary_table(summary)
+    print(f"\n  Results: {results}")
     print(f"  Time elapsed: {elapsed:.1f}s ({elapsed/60:.1f} min)")
     print(f"  Results directory: {RESULTS_DIR}")
     print(f"  Models directory:  {MODELS_DIR}")
+    print(f"  Logs directory:    {log_dir}")
     print(f"{'=' * 60}")
 
+    return results
+
 
-def main():
+def main(argv: list = None):
     parser = argparse.ArgumentParser(
         description="Train BirdNET custom classifiers and evaluate on IBC53."
     )
     parser.add_argument("--experiment", type=str, default="all",
-                        choices=["baseline", "exp1", "exp2", "exp3", "all"],
-                        help="Which experiment to run (default: all)")
+                        choices=["baseline", "exp1", "exp2", "exp3", "all",
+                                 "evaluate"],
+                        help="Which experiment to run (default: all); "
+                             "'evaluate' scores every trained classifier "
+                             "in one pass without training")
     parser.add_argument("--test_dir", type=str, default=str(IBC53_RAW_DIR),
                         help="Path to test audio directory")
     parser.add_argument("--autotune", action="store_true",
                         help="Use keras-tuner for hyperparameter optimization")
-    args = parser.parse_args()
+    parser.add_argument("--max_parallel", type=int, default=1,
+                        help="Experiments to run concurrently (default: 1)")
+    parser.add_argument("--threads_per_job", type=int, default=None,
+                        help="CPU threads per experiment "
+                             "(default: CPU count / max_parallel)")
+    parser.add_argument("--timeout", type=float, default=COMMAND_TIMEOUT_S,
+                        help="Kill a BirdNET command after this many seconds "
+                             f"(default: {COMMAND_TIMEOUT_S}, 0 = no limit)")
+    parser.add_argument("--stall_timeout", type=float, default=STALL_TIMEOUT_S,
+                        help="Kill a BirdNET command silent for this many seconds "
+                             f"(default: {STALL_TIMEOUT_S}, 0 = never)")
+    parser.add_argument("--engine", type=str, default="inprocess",
+                        choices=["inprocess", "birdnet"],
+                        help="Evaluation engine: in-process BirdClassifier "
+                             "(default) or birdnet_analyzer.analyze subprocess")
+    args = parser.parse_args(argv)
 
     ensure_dirs()
     run_experiment(
         experiment=args.experiment,
         test_dir=Path(args.test_dir),
         autotune=args.autotune,
+        max_parallel=args.max_parallel,
+        threads_per_job=args.threads_per_job,
+        timeout=args.timeout,
+        stall_timeout=args.stall_timeout,
+        engine=args.engine,
     )
 
 
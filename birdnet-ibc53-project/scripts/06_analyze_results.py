@@ -3,6 +3,7 @@ Script 6: Results Analysis & Comparison
 ==========================================
 Analyzes BirdNET detection results across all experiments and generates:
   - Comparative metrics table (FPR, accuracy, noise misclassification, confidence)
+  - Noise-as-bird false positive rates per noise source and confidence threshold
   - Per-species accuracy breakdown
   - Confusion matrices
   - Confidence score distributions
@@ -16,24 +17,28 @@ Pipeline Position: FINAL step — runs after all experiments complete.
 Output: PNG charts + summary CSV + printed comparison table.
 """
 
+from __future__ import annotations
+
 import argparse
 import csv
+import re
 import sys
 import time
 from collections import defaultdict
 from pathlib import Path
 
-import matplotlib
-matplotlib.use("Agg")  # Non-interactive backend
-import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 from configs.config import (
-    RESULTS_DIR, SPECIES_NAMES, SPECIES_COMMON_NAMES,
-    NOISE_FOLDER_NAME, MIN_CONFIDENCE, VERBOSE, ensure_dirs,
+    RESULTS_DIR, SPECIES_NAMES, SPECIES_COMMON_NAMES, ESC50_NOISE_CATEGORIES,
+    NOISE_FOLDER_NAME, MYSTERY_FOLDER_NAME, MIN_CONFIDENCE, VERBOSE, ensure_dirs,
 )
+from scripts._detections import find_detection_csvs, load_experiment_detections
+from scripts._lazy import lazy_import, lazy_pyplot
+
+pd = lazy_import("pandas")
+plt = lazy_pyplot("Agg")  # Non-interactive backend, loaded only when plotting
 
 
 # ============================================================
@@ -46,6 +51,7 @@ def find_result_csvs(results_dir: Path) -> dict:
 
     BirdNET-Analyzer writes results as CSV files with columns:
     filepath, start, end, scientific_name, common_name, confidence
+    Each experiment uses one layout only (see find_detection_csvs).
     """
     experiments = {}
 
@@ -53,7 +59,7 @@ def find_result_csvs(results_dir: Path) -> dict:
         if not subdir.is_dir():
             continue
 
-        csvs = list(subdir.rglob("*.csv"))
+        csvs = find_detection_csvs(subdir)
         if csvs:
             experiments[subdir.name] = csvs
             if VERBOSE:
@@ -62,50 +68,6 @@ def find_result_csvs(results_dir: Path) -> dict:
     return experiments
 
 
-def load_detections(csv_files: list) -> pd.DataFrame:
-    """
-    Load BirdNET detection results from one or more CSV files.
-
-    Returns DataFrame with columns:
-        filepath, start, end, scientific_name, common_name, confidence, source_file
-    """
-    all_rows = []
-
-    for csv_path in csv_files:
-        try:
-            df = pd.read_csv(csv_path)
-            df["source_file"] = csv_path.name
-            all_rows.append(df)
-        except Exception as e:
-            print(f"  [WARN] Failed to read {csv_path}: {e}")
-
-    if not all_rows:
-        return pd.DataFrame()
-
-    combined = pd.concat(all_rows, ignore_index=True)
-
-    # Standardize column names (BirdNET output varies slightly)
-    col_map = {}
-    for col in combined.columns:
-        lower = col.lower().strip()
-        if "scientific" in lower or lower == "species":
-            col_map[col] = "scientific_name"
-        elif "common" in lower:
-            col_map[col] = "common_name"
-        elif "confidence" in lower or "score" in lower:
-            col_map[col] = "confidence"
-        elif "start" in lower:
-            col_map[col] = "start"
-        elif "end" in lower:
-            col_map[col] = "end"
-        elif "file" in lower and "source" not in lower:
-            col_map[col] = "filepath"
-
-    combined.rename(columns=col_map, inplace=True)
-
-    return combined
-
-
 # ============================================================
 # Metrics Computation
 # ============================================================
@@ -156,29 +118,180 @@ def compute_metrics(detections: pd.DataFrame,
     return metrics
 
 
-def estimate_false_positive_rate(detections: pd.DataFrame,
-                                  noise_keywords: list = None) -> dict:
-    """
-    Estimate false positive rate by analyzing detections on known noise segments.
+# ============================================================
+# Noise False Positives
+# ============================================================
 
-    This looks at detections where the source audio filename suggests noise
-    (e.g., files from the noise/ folder or mystery folder).
+# Labels that are not a bird: this project's noise class plus BirdNET's
+# own non-event classes (compared lower-case)
+NON_EVENT_LABELS = {
+    NOISE_FOLDER_NAME.lower(), "other", "background", "silence",
+    "noise", "environmental", "engine", "fireworks", "gun", "power tools",
+    "siren", "human vocal", "human non-vocal", "human whistle",
+}
+
+# Confidence thresholds at which noise false positives are counted
+FP_THRESHOLDS = (0.1, 0.25, 0.5, 0.75, 0.9)
+FP_SUMMARY_THRESHOLD = 0.5
+
+SPECIES_SOURCE = "species"
+UNKNOWN_SOURCE = "unknown"
+MYSTERY_SOURCE = "mystery"
+# Sources that are not noise. The Mystery mystery folder holds bird
+# recordings of unknown species; it is still reported, but as a reference
+# row that never enters the noise totals.
+NON_NOISE_SOURCES = (SPECIES_SOURCE, UNKNOWN_SOURCE, MYSTERY_SOURCE)
+REPORTED_NON_NOISE_SOURCES = (MYSTERY_SOURCE,)
+_SPECIES_SET = set(SPECIES_NAMES)
+
+# Noise file names written by scripts 03 and 04 (esc50_<category>_<file>,
+# mystery_<file>, species_noise_<file>); longest category first so
+# "water_drops" is not read as "water"
+_NOISE_FILE_PATTERN = re.compile(
+    r"^(?:esc50_(?P<esc50>"
+    + "|".join(re.escape(c) for c in sorted(ESC50_NOISE_CATEGORIES, key=len, reverse=True))
+    + r")_|(?P<mystery>mystery_)|(?P<species_noise>species_noise_))"
+)
+
+
+def classify_source(path: str) -> str:
     """
-    if noise_keywords is None:
-        noise_keywords = ["noise", "mystery", "esc50", "rain", "wind",
-                          "water", "insect", "thunder", "fire"]
+    Where a recording comes from, from its path.
 
-    fp_metrics = {"noise_detections": 0, "noise_as_bird": 0}
+    Returns "esc50_<category>", "mystery_noise", "species_noise",
+    "noise_other" (other files in the noise folder), "mystery" (the
+    Mystery mystery folder), "species", or "unknown".
+    """
+    p = Path(path.replace("\\", "/"))
+    match = _NOISE_FILE_PATTERN.match(p.name)
+    if match:
+        if match.group("esc50"):
+            return f"esc50_{match.group('esc50')}"
+        return "mystery_noise" if match.group("mystery") else "species_noise"
+
+    folders = set(p.parts[:-1])
+    if NOISE_FOLDER_NAME in folders:
+        return "noise_other"
+    if MYSTERY_FOLDER_NAME in folders:
+        return MYSTERY_SOURCE
+    if folders & _SPECIES_SET:
+        return SPECIES_SOURCE
+    return UNKNOWN_SOURCE
+
+
+def recording_codes(detections: pd.DataFrame) -> tuple:
+    """
+    (codes, paths): an integer recording id per detection and the path of
+    each id. Rows without a filepath fall back to the result CSV's path.
+    """
+    filepath = detections["filepath"].astype("category").cat
+    source_file = detections["source_file"].astype("category").cat
+    codes = filepath.codes.to_numpy().astype(np.int64)
+    missing = codes < 0
+    codes[missing] = len(filepath.categories) + source_file.codes.to_numpy()[missing]
+    paths = [str(p) for p in filepath.categories] + [str(p) for p in source_file.categories]
+    return codes, paths
 
-    if "filepath" in detections.columns:
-        # Check if any detections come from noise-like files
-        for kw in noise_keywords:
-            mask = detections["filepath"].str.lower().str.contains(kw, na=False)
-            fp_metrics["noise_detections"] += int(mask.sum())
 
+def estimate_false_positive_rate(detections: pd.DataFrame,
+                                 thresholds: tuple = FP_THRESHOLDS) -> dict:
+    """
+    Noise-as-bird false positives on recordings known to be noise.
+
+    Every detection is attributed to one source (classify_source), so no
+    detection is counted twice. Rates are per 3 s window: a noise window
+    is a false positive at threshold t when any bird label in it scores
+    >= t. Only windows with at least one detection are in the results,
+    so the rates are relative to windows BirdNET reported on.
+
+    Only noise sources (esc50_*, mystery_noise, species_noise, noise_other)
+    feed the summary keys. The Mystery mystery folder (bird recordings of
+    unknown species) gets its own fp_by_source entry with noise=False; its
+    "fp" counts are windows with a bird label >= t, not false positives.
+
+    Returns:
+        dict with scalar summary keys (noise_detections, noise_as_bird,
+        noise_windows, noise_fp_windows, noise_fp_rate at
+        FP_SUMMARY_THRESHOLD) and fp_by_source:
+        {source: {"noise": bool, "windows": n, "fp": {threshold: count}}}
+    """
+    fp_metrics = {"noise_detections": 0, "noise_as_bird": 0,
+                  "noise_windows": 0, "noise_fp_windows": 0,
+                  "noise_fp_rate": 0.0, "fp_by_source": {}}
+    if detections.empty or "scientific_name" not in detections.columns:
+        return fp_metrics
+
+    # Classify each distinct path once; detections carry integer codes
+    rec_codes, paths = recording_codes(detections)
+    path_sources = np.array([classify_source(p) for p in paths], dtype=object)
+    source_names, path_source_codes = np.unique(path_sources, return_inverse=True)
+    noise_source = ~np.isin(source_names, NON_NOISE_SOURCES)
+    reported_source = noise_source | np.isin(source_names, REPORTED_NON_NOISE_SOURCES)
+    source_codes = path_source_codes[rec_codes]
+    is_noise = noise_source[source_codes]
+    is_reported = reported_source[source_codes]
+    if not is_reported.any():
+        return fp_metrics
+
+    labels = detections["scientific_name"].astype("category").cat
+    label_is_bird = np.array([str(c).strip().lower() not in NON_EVENT_LABELS
+                              for c in labels.categories] + [False])
+    is_bird = label_is_bird[labels.codes.to_numpy()]  # code -1 (NaN) -> False
+    confidence = np.nan_to_num(detections["confidence"].to_numpy(dtype=np.float64))
+
+    reported = pd.DataFrame({
+        "source": source_codes[is_reported],
+        "recording": rec_codes[is_reported],
+        "start": detections["start"].to_numpy()[is_reported],
+        "end": detections["end"].to_numpy()[is_reported],
+        "bird_conf": np.where(is_bird, confidence, 0.0)[is_reported],
+    })
+    fp_metrics["noise_detections"] = int(is_noise.sum())
+    fp_metrics["noise_as_bird"] = int((is_bird & is_noise).sum())
+
+    # One row per window: its highest bird confidence (0 if none)
+    windows = reported.groupby(["source", "recording", "start", "end"],
+                               sort=False)["bird_conf"].max().reset_index()
+
+    all_thresholds = np.array(sorted(set(thresholds) | {FP_SUMMARY_THRESHOLD}))
+    for source_code, group in windows.groupby("source"):
+        conf = np.sort(group["bird_conf"].to_numpy())
+        fp_counts = len(conf) - np.searchsorted(conf, all_thresholds, side="left")
+        fp_metrics["fp_by_source"][str(source_names[source_code])] = {
+            "noise": bool(noise_source[source_code]),
+            "windows": len(conf),
+            "fp": {float(t): int(n) for t, n in zip(all_thresholds, fp_counts)},
+        }
+
+    noise_conf = windows.loc[noise_source[windows["source"].to_numpy()], "bird_conf"]
+    fp_metrics["noise_windows"] = len(noise_conf)
+    fp_metrics["noise_fp_windows"] = int((noise_conf >= FP_SUMMARY_THRESHOLD).sum())
+    if len(noise_conf):
+        fp_metrics["noise_fp_rate"] = fp_metrics["noise_fp_windows"] / len(noise_conf) * 100
     return fp_metrics
 
 
+def false_positive_rows(experiment: str, fp_metrics: dict) -> list:
+    """
+    Flatten fp_by_source into CSV rows (one per source and threshold).
+    Rows with noise_source=False (the Mystery folder) count bird windows,
+    not false positives.
+    """
+    rows = []
+    for source, stats in sorted(fp_metrics.get("fp_by_source", {}).items()):
+        for threshold, fp in stats["fp"].items():
+            rows.append({
+                "experiment": experiment,
+                "source": source,
+                "noise_source": stats["noise"],
+                "threshold": threshold,
+                "windows": stats["windows"],
+                "fp_windows": fp,
+                "fp_rate": fp / stats["windows"] * 100 if stats["windows"] else 0.0,
+            })
+    return rows
+
+
 # ============================================================
 # Visualization
 # ============================================================
@@ -323,8 +436,14 @@ def plot_per_species_comparison(experiment_data: dict, output_path: Path,
 # Main Analysis
 # ============================================================
 
-def run_analysis(results_dir: Path, output_dir: Path):
-    """Run complete analysis across all experiments."""
+def run_analysis(results_dir: Path, output_dir: Path, use_cache: bool = True):
+    """
+    Run complete analysis across all experiments.
+
+    Detections come from scripts/_detections.py; with use_cache each
+    experiment's CSVs are consolidated into <experiment>/detections.parquet
+    and later runs read that file while the CSVs are unchanged.
+    """
     print("=" * 60)
     print("RESULTS ANALYSIS")
     print(f"Results dir: {results_dir}")
@@ -346,13 +465,15 @@ def run_analysis(results_dir: Path, output_dir: Path):
     # Load all detections
     experiment_data = {}
     metrics_table = []
+    fp_rows = []
 
-    for exp_name, csv_files in experiment_csvs.items():
+    for exp_name in experiment_csvs:
         if exp_name == "analysis":
             continue  # Skip our own output folder
 
         print(f"\n  Analyzing: {exp_name}")
-        detections = load_detections(csv_files)
+        detections = load_experiment_detections(results_dir / exp_name,
+                                                use_cache=use_cache)
         experiment_data[exp_name] = detections
 
         metrics = compute_metrics(detections)
@@ -360,6 +481,7 @@ def run_analysis(results_dir: Path, output_dir: Path):
         fp_metrics = estimate_false_positive_rate(detections)
         metrics.update(fp_metrics)
         metrics_table.append(metrics)
+        fp_rows.extend(false_positive_rows(exp_name, fp_metrics))
 
     # --- Print comparison table ---
     print(f"\n{'=' * 80}")
@@ -392,6 +514,18 @@ def run_analysis(results_dir: Path, output_dir: Path):
         df_metrics.to_csv(metrics_csv, index=False)
         print(f"\n  Metrics saved: {metrics_csv}")
 
+    # --- Noise false positives per source and threshold ---
+    if fp_rows:
+        print(f"\n  Noise-as-bird false positives (windows with a bird label "
+              f">= {FP_SUMMARY_THRESHOLD}):")
+        for m in metrics_table:
+            if m.get("noise_windows"):
+                print(f"    {m['experiment']:<25} {m['noise_fp_windows']:>6}/"
+                      f"{m['noise_windows']:<6} ({m['noise_fp_rate']:.1f}%)")
+        fp_csv = output_dir / "noise_false_positives.csv"
+        pd.DataFrame(fp_rows).to_csv(fp_csv, index=False, float_format="%.4g")
+        print(f"  Noise FP table saved: {fp_csv}")
+
     # --- Generate plots ---
     print(f"\n  Generating visualizations...")
 
@@ -420,7 +554,7 @@ def run_analysis(results_dir: Path, output_dir: Path):
     print(f"{'=' * 60}")
 
 
-def main():
+def main(argv: list = None):
     parser = argparse.ArgumentParser(
         description="Analyze and compare BirdNET experiment results."
     )
@@ -429,12 +563,16 @@ def main():
     parser.add_argument("--output_dir", type=str,
                         default=str(RESULTS_DIR / "analysis"),
                         help="Path to analysis output directory")
-    args = parser.parse_args()
+    parser.add_argument("--no_cache", action="store_true",
+                        help="Re-read every result CSV instead of the consolidated "
+                             "detections.parquet per experiment")
+    args = parser.parse_args(argv)
 
     ensure_dirs()
     run_analysis(
         results_dir=Path(args.results_dir),
         output_dir=Path(args.output_dir),
+        use_cache=not args.no_cache,
     )
 
 
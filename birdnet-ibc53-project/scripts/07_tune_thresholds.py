@@ -10,11 +10,20 @@ This script:
   4. Tests different threshold combinations and shows classification stats
   5. Exports a tuning report CSV
 
+With --full, steps 1-2 cover every segment: the feature matrix is read
+column-wise from Stage 2 output (or extracted from all segments, reusing
+the feature cache), and the sweep also reports bird/noise/silence
+proportions per species for every threshold triple.
+
 Tuning these thresholds is part of the RESEARCH CONTRIBUTION for Paper 1.
 
 Usage:
     python scripts/07_tune_thresholds.py
     python scripts/07_tune_thresholds.py --n_samples 200 --input_dir data/segments
+    python scripts/07_tune_thresholds.py --no_cache
+    python scripts/07_tune_thresholds.py --classifications results/segment_classifications.parquet
+    python scripts/07_tune_thresholds.py --grid_size 50   # 50x50x50 threshold sweep
+    python scripts/07_tune_thresholds.py --full           # every segment + per-species sweep
 """
 
 import argparse
@@ -23,24 +32,30 @@ import sys
 import time
 from pathlib import Path
 
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
 import numpy as np
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 from configs.config import (
-    SEGMENTS_DIR, RESULTS_DIR, SAMPLE_RATE,
+    SEGMENTS_DIR, RESULTS_DIR, SAMPLE_RATE, FEATURE_CACHE_PATH,
     SILENCE_RMS_THRESHOLD, NOISE_FLATNESS_THRESHOLD,
     NOISE_ZCR_THRESHOLD, ensure_dirs,
 )
-from scripts.s02_classify_segments_lib import extract_features, classify_segment
+from scripts.s02_classify_segments_lib import iter_features
+from scripts._classify_lib import (
+    load_classifications_table, resolve_classifications_path,
+)
+from scripts._feature_cache import FeatureCache
+from scripts._lazy import lazy_import, lazy_pyplot
+
+pd = lazy_import("pandas")
+plt = lazy_pyplot("Agg")
 
 
 def collect_samples(input_dir: Path, n_samples: int = 200,
                      seed: int = 42) -> list:
     """
-    Randomly sample audio segments from the segmented directory.
+    Randomly sample audio segments from the segmented directory
+    (every segment when n_samples <= 0).
 
     Returns list of (filepath, species_folder) tuples.
     """
@@ -53,7 +68,7 @@ def collect_samples(input_dir: Path, n_samples: int = 200,
         for f in species_dir.glob("*.wav"):
             all_files.append((f, species_dir.name))
 
-    if len(all_files) <= n_samples:
+    if n_samples <= 0 or len(all_files) <= n_samples:
         sample = all_files
     else:
         sample = random.sample(all_files, n_samples)
@@ -62,28 +77,33 @@ def collect_samples(input_dir: Path, n_samples: int = 200,
     return sample
 
 
-def extract_all_features(samples: list) -> list:
-    """Extract features for all sampled segments."""
+def extract_all_features(samples: list, cache: FeatureCache = None) -> list:
+    """Extract features for all sampled segments (reusing cached ones)."""
     results = []
-    for filepath, species_folder in samples:
-        features = extract_features(filepath)
+    paths = [filepath for filepath, _ in samples]
+    for (filepath, species_folder), (_, features) in zip(
+            samples, iter_features(paths, cache=cache)):
         if features:
             features["filepath"] = str(filepath)
             features["species_folder"] = species_folder
             features["filename"] = filepath.name
             results.append(features)
     print(f"  Extracted features for {len(results)}/{len(samples)} segments")
+    if cache is not None:
+        print(f"  Feature cache: {cache.summary()}")
     return results
 
 
-def plot_feature_distributions(features_list: list, output_dir: Path):
+def plot_feature_distributions(features: dict, output_dir: Path):
     """
     Plot histograms and scatter plots of the three features.
     These plots help you visually identify natural threshold boundaries.
     """
-    rms_vals = [f["rms"] for f in features_list]
-    flat_vals = [f["spectral_flatness"] for f in features_list]
-    zcr_vals = [f["zcr"] for f in features_list]
+    rms_vals = features["rms"]
+    flat_vals = features["spectral_flatness"]
+    zcr_vals = features["zcr"]
+    # Large populations get smaller, fainter markers
+    size, alpha = (10, 0.4) if len(rms_vals) <= 5000 else (1, 0.1)
 
     fig, axes = plt.subplots(2, 3, figsize=(15, 10))
 
@@ -107,21 +127,21 @@ def plot_feature_distributions(features_list: list, output_dir: Path):
     axes[0, 2].legend()
 
     # Row 2: Scatter plots (feature pairs)
-    axes[1, 0].scatter(rms_vals, flat_vals, alpha=0.4, s=10, c="#3498db")
+    axes[1, 0].scatter(rms_vals, flat_vals, alpha=alpha, s=size, c="#3498db")
     axes[1, 0].axhline(y=NOISE_FLATNESS_THRESHOLD, color="red", linestyle="--", alpha=0.5)
     axes[1, 0].axvline(x=SILENCE_RMS_THRESHOLD, color="orange", linestyle="--", alpha=0.5)
     axes[1, 0].set_xlabel("RMS Energy")
     axes[1, 0].set_ylabel("Spectral Flatness")
     axes[1, 0].set_title("RMS vs Flatness")
 
-    axes[1, 1].scatter(rms_vals, zcr_vals, alpha=0.4, s=10, c="#2ecc71")
+    axes[1, 1].scatter(rms_vals, zcr_vals, alpha=alpha, s=size, c="#2ecc71")
     axes[1, 1].axhline(y=NOISE_ZCR_THRESHOLD, color="red", linestyle="--", alpha=0.5)
     axes[1, 1].axvline(x=SILENCE_RMS_THRESHOLD, color="orange", linestyle="--", alpha=0.5)
     axes[1, 1].set_xlabel("RMS Energy")
     axes[1, 1].set_ylabel("ZCR")
     axes[1, 1].set_title("RMS vs ZCR")
 
-    axes[1, 2].scatter(flat_vals, zcr_vals, alpha=0.4, s=10, c="#e74c3c")
+    axes[1, 2].scatter(flat_vals, zcr_vals, alpha=alpha, s=size, c="#e74c3c")
     axes[1, 2].axhline(y=NOISE_ZCR_THRESHOLD, color="red", linestyle="--", alpha=0.5)
     axes[1, 2].axvline(x=NOISE_FLATNESS_THRESHOLD, color="orange", linestyle="--", alpha=0.5)
     axes[1, 2].set_xlabel("Spectral Flatness")
@@ -138,63 +158,237 @@ def plot_feature_distributions(features_list: list, output_dir: Path):
     print(f"  Feature plots saved: {output_path}")
 
 
-def grid_search_thresholds(features_list: list, output_dir: Path):
+# Default sweep (the original 5x5x5 grid); --grid_size N spans the same
+# ranges with N evenly spaced values per threshold
+SILENCE_RMS_GRID = [0.005, 0.01, 0.015, 0.02, 0.03]
+NOISE_FLATNESS_GRID = [0.3, 0.4, 0.5, 0.6, 0.7]
+NOISE_ZCR_GRID = [0.05, 0.08, 0.1, 0.12, 0.15]
+
+GRID_FIELDNAMES = ["silence_rms", "noise_flatness", "noise_zcr",
+                   "bird", "noise", "silence", "bird_pct", "noise_pct", "silence_pct"]
+
+
+def threshold_grid(grid_size: int = None) -> tuple:
+    """(silence_rms, noise_flatness, noise_zcr) value arrays for the sweep."""
+    grids = (SILENCE_RMS_GRID, NOISE_FLATNESS_GRID, NOISE_ZCR_GRID)
+    if grid_size:
+        return tuple(np.linspace(min(g), max(g), grid_size) for g in grids)
+    return tuple(np.asarray(g, dtype=np.float64) for g in grids)
+
+
+def feature_matrix(features_list: list) -> dict:
+    """
+    Column arrays (rms, spectral_flatness, zcr as float64, species_folder
+    as str) from a list of feature dicts.
+    """
+    n = len(features_list)
+    matrix = {
+        key: np.fromiter((f[key] for f in features_list), dtype=np.float64, count=n)
+        for key in ("rms", "spectral_flatness", "zcr")
+    }
+    matrix["species_folder"] = np.array(
+        [str(f.get("species_folder", "")) for f in features_list], dtype=object)
+    return matrix
+
+
+def load_feature_matrix(classifications_path: Path, n_samples: int = 0,
+                        seed: int = 42) -> dict:
+    """
+    feature_matrix() for every segment in Stage 2 output (CSV or Parquet),
+    read column-wise without building per-row dicts. n_samples > 0 draws
+    a random subset instead.
+    """
+    table = load_classifications_table(
+        classifications_path,
+        columns=["species_folder", "rms", "spectral_flatness", "zcr"],
+    )
+    if 0 < n_samples < len(table):
+        table = table.sample(n=n_samples, random_state=seed)
+    matrix = {key: table[key].to_numpy(dtype=np.float64)
+              for key in ("rms", "spectral_flatness", "zcr")}
+    matrix["species_folder"] = table["species_folder"].astype(str).to_numpy(dtype=object)
+    print(f"  Loaded features for {len(table)} segments "
+          f"from {classifications_path.name}")
+    return matrix
+
+
+def grouped_label_counts(rms: np.ndarray, flatness: np.ndarray, zcr: np.ndarray,
+                         rms_grid: np.ndarray, flat_grid: np.ndarray,
+                         zcr_grid: np.ndarray, groups: np.ndarray = None,
+                         n_groups: int = 1) -> tuple:
+    """
+    Label counts of classify_segment() for every threshold triple at once,
+    separately for each group (e.g. species folder).
+
+    Each segment is binned by how many grid thresholds it passes on each
+    axis (rms >= s, flatness > f, zcr > z); a histogram of those bin
+    indices, suffix-summed along every threshold axis, gives the noise
+    count of each triple. Silence depends on the RMS threshold alone. Cost
+    is O(N log G + n_groups * G^3) instead of O(N * G^3) classify_segment()
+    calls.
+
+    Grids must be sorted ascending; groups holds codes in [0, n_groups).
+
+    Returns:
+        (bird, noise, silence) int64 arrays of shape
+        (n_groups, len(rms_grid), len(flat_grid), len(zcr_grid)).
+    """
+    n_s, n_f, n_z = len(rms_grid), len(flat_grid), len(zcr_grid)
+    if groups is None:
+        groups = np.zeros(len(rms), dtype=np.intp)
+    # Number of thresholds on each axis this segment passes
+    si = np.searchsorted(rms_grid, rms, side="right")       # rms >= s
+    fi = np.searchsorted(flat_grid, flatness, side="left")  # flatness > f
+    zi = np.searchsorted(zcr_grid, zcr, side="left")        # zcr > z
+
+    shape = (n_groups, n_s + 1, n_f + 1, n_z + 1)
+    hist = np.bincount(np.ravel_multi_index((groups, si, fi, zi), shape),
+                       minlength=int(np.prod(shape))).reshape(shape)
+
+    # noise[g, k, j, l] = #segments of group g with si > k, fi > j, zi > l
+    passed = hist[:, ::-1, ::-1, ::-1].cumsum(1).cumsum(2).cumsum(3)[:, ::-1, ::-1, ::-1]
+    noise = passed[:, 1:, 1:, 1:]
+    sizes = hist.sum(axis=(1, 2, 3))
+
+    # silence[g, k] = #segments of group g with si <= k
+    silence_2d = hist.sum(axis=(2, 3)).cumsum(1)[:, :-1]
+    silence = np.broadcast_to(silence_2d[:, :, None, None], noise.shape)
+    bird = sizes[:, None, None, None] - noise - silence
+    return bird, noise, np.ascontiguousarray(silence)
+
+
+def grid_label_counts(rms: np.ndarray, flatness: np.ndarray, zcr: np.ndarray,
+                      rms_grid: np.ndarray, flat_grid: np.ndarray,
+                      zcr_grid: np.ndarray) -> tuple:
+    """
+    grouped_label_counts() over all segments as one group.
+
+    Returns:
+        (bird, noise, silence) int64 arrays of shape
+        (len(rms_grid), len(flat_grid), len(zcr_grid)).
+    """
+    return tuple(c[0] for c in grouped_label_counts(
+        rms, flatness, zcr, rms_grid, flat_grid, zcr_grid))
+
+
+def grid_search_thresholds(features: dict, output_dir: Path,
+                           grid_size: int = None):
     """
     Test a grid of threshold combinations and report classification
     distributions for each. Helps identify the best balance.
     """
-    silence_rms_range = [0.005, 0.01, 0.015, 0.02, 0.03]
-    flatness_range = [0.3, 0.4, 0.5, 0.6, 0.7]
-    zcr_range = [0.05, 0.08, 0.1, 0.12, 0.15]
-
-    results = []
-    total = len(silence_rms_range) * len(flatness_range) * len(zcr_range)
+    rms_grid, flat_grid, zcr_grid = threshold_grid(grid_size)
+    total = len(rms_grid) * len(flat_grid) * len(zcr_grid)
     print(f"\n  Testing {total} threshold combinations...")
 
-    for s_rms in silence_rms_range:
-        for n_flat in flatness_range:
-            for n_zcr in zcr_range:
-                counts = {"bird": 0, "noise": 0, "silence": 0}
-                for feat in features_list:
-                    label = classify_segment(feat, s_rms, n_flat, n_zcr)
-                    counts[label] += 1
-
-                total_segs = sum(counts.values())
-                results.append({
-                    "silence_rms": s_rms,
-                    "noise_flatness": n_flat,
-                    "noise_zcr": n_zcr,
-                    "bird": counts["bird"],
-                    "noise": counts["noise"],
-                    "silence": counts["silence"],
-                    "bird_pct": f"{100*counts['bird']/total_segs:.1f}",
-                    "noise_pct": f"{100*counts['noise']/total_segs:.1f}",
-                    "silence_pct": f"{100*counts['silence']/total_segs:.1f}",
-                })
+    t0 = time.perf_counter()
+    n_segments = len(features["rms"])
+    bird, noise, silence = grid_label_counts(
+        features["rms"], features["spectral_flatness"], features["zcr"],
+        rms_grid, flat_grid, zcr_grid)
+    print(f"  Counted {n_segments} segments x {total} combinations "
+          f"in {time.perf_counter() - t0:.2f}s")
+
+    s_rms, n_flat, n_zcr = (g.ravel() for g in
+                            np.meshgrid(rms_grid, flat_grid, zcr_grid, indexing="ij"))
+    bird, noise, silence = bird.ravel(), noise.ravel(), silence.ravel()
+    total_segs = max(n_segments, 1)
+    bird_pct = 100 * bird / total_segs
+    noise_pct = 100 * noise / total_segs
+    silence_pct = 100 * silence / total_segs
 
     # Save grid search results
     import csv as csv_mod
     output_csv = output_dir / "threshold_grid_search.csv"
-    fieldnames = ["silence_rms", "noise_flatness", "noise_zcr",
-                  "bird", "noise", "silence", "bird_pct", "noise_pct", "silence_pct"]
-
     with open(output_csv, "w", newline="") as f:
-        writer = csv_mod.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(results)
+        writer = csv_mod.writer(f)
+        writer.writerow(GRID_FIELDNAMES)
+        writer.writerows(
+            (f"{r:g}", f"{fl:g}", f"{z:g}", b, n, si,
+             f"{bp:.1f}", f"{np_:.1f}", f"{sp:.1f}")
+            for r, fl, z, b, n, si, bp, np_, sp in zip(
+                s_rms, n_flat, n_zcr, bird.tolist(), noise.tolist(),
+                silence.tolist(), bird_pct, noise_pct, silence_pct)
+        )
 
     print(f"  Grid search results saved: {output_csv}")
 
     # Print top 10 most balanced results (noise between 5-20%)
-    balanced = [r for r in results if 5.0 <= float(r["noise_pct"]) <= 20.0]
-    balanced.sort(key=lambda r: abs(float(r["noise_pct"]) - 12.0))
+    noise_pct = np.round(noise_pct, 1)
+    balanced = np.flatnonzero((noise_pct >= 5.0) & (noise_pct <= 20.0))
+    balanced = balanced[np.argsort(np.abs(noise_pct[balanced] - 12.0), kind="stable")]
 
     print(f"\n  TOP 10 BALANCED THRESHOLD COMBINATIONS:")
     print(f"  {'RMS':>6} {'Flat':>6} {'ZCR':>6} | {'Bird%':>6} {'Noise%':>7} {'Silence%':>9}")
     print(f"  {'-'*50}")
-    for r in balanced[:10]:
-        print(f"  {r['silence_rms']:>6.3f} {r['noise_flatness']:>6.2f} {r['noise_zcr']:>6.3f} | "
-              f"{r['bird_pct']:>6}% {r['noise_pct']:>6}% {r['silence_pct']:>8}%")
+    for i in balanced[:10]:
+        print(f"  {s_rms[i]:>6.3f} {n_flat[i]:>6.2f} {n_zcr[i]:>6.3f} | "
+              f"{bird_pct[i]:>6.1f}% {noise_pct[i]:>6.1f}% {silence_pct[i]:>8.1f}%")
+
+
+# Per-species rows are species x triples, so this sweep defaults to a
+# coarser grid than the overall one (10^3 triples, ~50k rows for 54 species)
+SPECIES_GRID_SIZE = 10
+
+SPECIES_SWEEP_FIELDNAMES = ["species_folder", "silence_rms", "noise_flatness",
+                            "noise_zcr", "segments", "bird_pct", "noise_pct",
+                            "silence_pct"]
+
+
+def species_sweep_report(features: dict, output_dir: Path,
+                         grid_size: int = SPECIES_GRID_SIZE) -> Path:
+    """
+    Per-species bird/noise/silence proportions for every threshold triple.
+
+    Writes threshold_sweep_by_species.csv (one row per species and triple)
+    and prints each species' split at the current config thresholds.
+    """
+    species, codes = np.unique(features["species_folder"].astype(str),
+                               return_inverse=True)
+    rms_grid, flat_grid, zcr_grid = threshold_grid(grid_size)
+
+    t0 = time.perf_counter()
+    bird, noise, silence = grouped_label_counts(
+        features["rms"], features["spectral_flatness"], features["zcr"],
+        rms_grid, flat_grid, zcr_grid, groups=codes, n_groups=len(species))
+    sizes = np.bincount(codes, minlength=len(species))
+    print(f"\n  Per-species sweep: {len(species)} species x "
+          f"{bird[0].size} combinations in {time.perf_counter() - t0:.2f}s")
+
+    n_triples = bird[0].size
+    grid = [g.ravel() for g in np.meshgrid(rms_grid, flat_grid, zcr_grid, indexing="ij")]
+    denom = np.repeat(np.maximum(sizes, 1), n_triples).astype(np.float64)
+    columns = {
+        "species_folder": np.repeat(species, n_triples),
+        "silence_rms": np.tile(grid[0], len(species)),
+        "noise_flatness": np.tile(grid[1], len(species)),
+        "noise_zcr": np.tile(grid[2], len(species)),
+        "segments": np.repeat(sizes, n_triples),
+        "bird_pct": np.round(100 * bird.ravel() / denom, 2),
+        "noise_pct": np.round(100 * noise.ravel() / denom, 2),
+        "silence_pct": np.round(100 * silence.ravel() / denom, 2),
+    }
+
+    output_csv = output_dir / "threshold_sweep_by_species.csv"
+    pd.DataFrame(columns, columns=SPECIES_SWEEP_FIELDNAMES).to_csv(
+        output_csv, index=False, float_format="%.6g")
+    print(f"  Per-species sweep saved: {output_csv}")
+
+    # Current config thresholds, evaluated exactly
+    b, n, si = grouped_label_counts(
+        features["rms"], features["spectral_flatness"], features["zcr"],
+        np.array([SILENCE_RMS_THRESHOLD]), np.array([NOISE_FLATNESS_THRESHOLD]),
+        np.array([NOISE_ZCR_THRESHOLD]), groups=codes, n_groups=len(species))
+    print(f"\n  PER-SPECIES SPLIT AT CURRENT THRESHOLDS "
+          f"(rms={SILENCE_RMS_THRESHOLD}, flat={NOISE_FLATNESS_THRESHOLD}, "
+          f"zcr={NOISE_ZCR_THRESHOLD}):")
+    print(f"  {'Species':<32} {'Segs':>7} | {'Bird%':>6} {'Noise%':>7} {'Silence%':>9}")
+    print(f"  {'-'*68}")
+    for g, name in enumerate(species):
+        total = max(sizes[g], 1)
+        print(f"  {name[:32]:<32} {sizes[g]:>7d} | {100 * b[g].item() / total:>5.1f}% "
+              f"{100 * n[g].item() / total:>6.1f}% {100 * si[g].item() / total:>8.1f}%")
+    return output_csv
 
 
 def main():
@@ -208,6 +402,25 @@ def main():
     parser.add_argument("--output_dir", type=str,
                         default=str(RESULTS_DIR / "tuning"),
                         help="Output directory for tuning results")
+    parser.add_argument("--feature_cache", type=str, default=str(FEATURE_CACHE_PATH),
+                        help="SQLite feature store shared with Stage 2")
+    parser.add_argument("--no_cache", action="store_true",
+                        help="Recompute features for every sampled segment")
+    parser.add_argument("--classifications", type=str, default=None,
+                        help="Reuse features from Stage 2 output (.csv or "
+                             ".parquet) instead of decoding segments")
+    parser.add_argument("--grid_size", type=int, default=None,
+                        help="Values per threshold in the sweep, e.g. 50 for a "
+                             "50x50x50 grid (default: the 5x5x5 reference grid)")
+    parser.add_argument("--full", action="store_true",
+                        help="Tune on every segment instead of a random sample "
+                             "(reads Stage 2 output when available) and write "
+                             "the per-species sweep")
+    parser.add_argument("--by_species", action="store_true",
+                        help="Also write per-species proportions per threshold triple")
+    parser.add_argument("--species_grid_size", type=int, default=SPECIES_GRID_SIZE,
+                        help="Values per threshold in the per-species sweep "
+                             f"(default: {SPECIES_GRID_SIZE})")
     args = parser.parse_args()
 
     ensure_dirs()
@@ -218,21 +431,41 @@ def main():
     print("THRESHOLD TUNING UTILITY")
     print("=" * 60)
 
-    # Step 1: Sample segments
-    samples = collect_samples(Path(args.input_dir), args.n_samples)
+    n_samples = 0 if args.full else args.n_samples
+    classifications = args.classifications
+    if args.full and not classifications:
+        default = resolve_classifications_path(RESULTS_DIR / "segment_classifications.csv")
+        if default.is_file():
+            classifications = str(default)
+
+    t0 = time.perf_counter()
+    if classifications:
+        # Steps 1+2: Precomputed features from Stage 2 output
+        features = load_feature_matrix(Path(classifications), n_samples)
+    else:
+        # Step 1: Sample segments (all of them with --full)
+        samples = collect_samples(Path(args.input_dir), n_samples)
 
-    # Step 2: Extract features
-    features_list = extract_all_features(samples)
+        # Step 2: Extract features
+        cache = None if args.no_cache else FeatureCache(Path(args.feature_cache))
+        features = feature_matrix(extract_all_features(samples, cache))
+        if cache is not None:
+            cache.close()
+    print(f"  Feature matrix ready in {time.perf_counter() - t0:.1f}s")
 
-    if not features_list:
+    if len(features["rms"]) == 0:
         print("[ERROR] No features extracted. Check your segments directory.")
         return
 
     # Step 3: Plot feature distributions
-    plot_feature_distributions(features_list, output_dir)
+    plot_feature_distributions(features, output_dir)
 
     # Step 4: Grid search thresholds
-    grid_search_thresholds(features_list, output_dir)
+    grid_search_thresholds(features, output_dir, args.grid_size)
+
+    # Step 5: Per-species proportions for every threshold triple
+    if args.full or args.by_species:
+        species_sweep_report(features, output_dir, args.species_grid_size)
 
     print(f"\n  NEXT STEP: Listen to ~50 segments and compare with classifications.")
     print(f"  Then update thresholds in configs/config.py")
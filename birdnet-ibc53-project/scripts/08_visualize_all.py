@@ -20,21 +20,24 @@ Usage:
     python scripts/08_visualize_all.py --output_dir results/figures
 """
 
+from __future__ import annotations
+
 import argparse
 import sys
 from collections import defaultdict
 from pathlib import Path
 
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-import matplotlib.ticker as mticker
 import numpy as np
-import pandas as pd
-from matplotlib.colors import LinearSegmentedColormap
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 from configs.config import RESULTS_DIR, SPECIES_NAMES, SPECIES_COMMON_NAMES
+from scripts._detections import load_experiment_detections
+from scripts._lazy import lazy_import, lazy_pyplot
+
+pd = lazy_import("pandas")
+plt = lazy_pyplot("Agg")
+mticker = lazy_import("matplotlib.ticker")
+mcolors = lazy_import("matplotlib.colors")
 
 # ============================================================
 # Constants
@@ -62,63 +65,32 @@ COLORS = {
     "Exp3_FewShot_50": "#2ecc71",
 }
 
-MYSTERY_FOLDER = "Mystery mystery"
-
 # ============================================================
 # Data Loading
 # ============================================================
 
-def load_experiment(exp_dir: Path) -> pd.DataFrame:
+def load_experiment(exp_dir: Path, use_cache: bool = True) -> pd.DataFrame:
     """
-    Load all BirdNET result CSVs for one experiment.
-    Adds 'true_species' column from the parent folder name.
-    Skips Mystery folder and non-species files.
+    Load all BirdNET detections for one experiment (scripts/_detections.py).
+    'true_species' comes from the species folder; Mystery and non-species
+    folders are dropped. The scientific name column is 'predicted_species'.
     """
-    rows = []
-    for species_dir in sorted(exp_dir.iterdir()):
-        if not species_dir.is_dir():
-            continue
-        if species_dir.name == MYSTERY_FOLDER:
-            continue
-        if species_dir.name not in SPECIES_NAMES:
-            continue
-
-        true_species = species_dir.name
-        for csv_file in species_dir.glob("*.csv"):
-            try:
-                df = pd.read_csv(csv_file)
-                df["true_species"] = true_species
-                df["source_file"] = csv_file.stem
-                rows.append(df)
-            except Exception:
-                continue
-
-    if not rows:
+    df = load_experiment_detections(exp_dir, use_cache=use_cache)
+    df = df[df["true_species"].isin(SPECIES_NAMES)]
+    if df.empty:
         return pd.DataFrame()
+    df = df.rename(columns={"scientific_name": "predicted_species"})
+    return encode_species(df.reset_index(drop=True))
 
-    combined = pd.concat(rows, ignore_index=True)
-
-    # Standardize column names
-    col_map = {}
-    for col in combined.columns:
-        lower = col.lower().strip()
-        if "scientific" in lower:
-            col_map[col] = "predicted_species"
-        elif "confidence" in lower:
-            col_map[col] = "confidence"
-    combined.rename(columns=col_map, inplace=True)
-
-    return combined
 
-
-def load_all_experiments(results_dir: Path) -> dict:
+def load_all_experiments(results_dir: Path, use_cache: bool = True) -> dict:
     """Load all experiments into a dict of DataFrames."""
     data = {}
     for exp_key in DISPLAY_ORDER:
         exp_path = results_dir / exp_key
         if exp_path.is_dir():
             print(f"  Loading {exp_key}...")
-            df = load_experiment(exp_path)
+            df = load_experiment(exp_path, use_cache=use_cache)
             if not df.empty:
                 data[exp_key] = df
                 print(f"    {len(df)} detections, {df['true_species'].nunique()} species")
@@ -128,52 +100,93 @@ def load_all_experiments(results_dir: Path) -> dict:
 # ============================================================
 # Metrics Computation
 # ============================================================
+#
+# Species are encoded once per experiment as integer codes into
+# SPECIES_NAMES (-1 = not a known species), so every metric below is a
+# bincount over int arrays instead of a per-species mask or a row loop.
+
+def encode_species(df: pd.DataFrame) -> pd.DataFrame:
+    """Add 'true_code' / 'pred_code' columns (index into SPECIES_NAMES, -1 if unknown)."""
+    for col, code_col in (("true_species", "true_code"),
+                          ("predicted_species", "pred_code")):
+        if col in df.columns:
+            codes = pd.Categorical(df[col], categories=SPECIES_NAMES).codes
+        else:
+            codes = np.full(len(df), -1)
+        df[code_col] = codes.astype(np.int16)
+    return df
+
+
+def compute_metrics(df: pd.DataFrame) -> dict:
+    """
+    All accuracy metrics for one experiment from a single pass over its codes.
+
+    Returns:
+        dict with keys:
+          confusion:   (n_species, n_species) int64 counts, true x predicted,
+                       both known species
+          totals:      detections per true species (any prediction)
+          correct:     correctly predicted detections per true species
+          per_species: {species: (correct, total, accuracy_pct)}
+          overall:     overall accuracy % over known-species detections
+    """
+    if "true_code" not in df.columns:
+        encode_species(df)
+    n = len(SPECIES_NAMES)
+    true_codes = df["true_code"].to_numpy(dtype=np.int64)
+    pred_codes = df["pred_code"].to_numpy(dtype=np.int64)
+
+    known_true = true_codes >= 0
+    totals = np.bincount(true_codes[known_true], minlength=n)
+
+    both = known_true & (pred_codes >= 0)
+    confusion = np.bincount(true_codes[both] * n + pred_codes[both],
+                            minlength=n * n).reshape(n, n)
+    correct = np.diag(confusion).copy()
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        acc = np.where(totals > 0, correct / totals * 100, 0.0)
+    per_species = {sp: (int(correct[i]), int(totals[i]), float(acc[i]))
+                   for i, sp in enumerate(SPECIES_NAMES)}
+
+    n_known = int(totals.sum())
+    overall = float(correct.sum() / n_known * 100) if n_known else 0.0
+
+    return {
+        "confusion": confusion,
+        "totals": totals,
+        "correct": correct,
+        "per_species": per_species,
+        "overall": overall,
+    }
+
+
+def compute_all_metrics(exp_data: dict) -> dict:
+    """compute_metrics() for every loaded experiment, keyed like exp_data."""
+    return {exp_key: compute_metrics(df) for exp_key, df in exp_data.items()}
+
 
 def compute_per_species_accuracy(df: pd.DataFrame) -> dict:
     """Compute accuracy per species. Returns {species: (correct, total, accuracy)}."""
-    results = {}
-    for species in SPECIES_NAMES:
-        mask = df["true_species"] == species
-        subset = df[mask]
-        if len(subset) == 0:
-            results[species] = (0, 0, 0.0)
-            continue
-        correct = (subset["predicted_species"] == species).sum()
-        total = len(subset)
-        results[species] = (int(correct), int(total), correct / total * 100)
-    return results
+    return compute_metrics(df)["per_species"]
 
 
 def compute_overall_accuracy(df: pd.DataFrame) -> float:
     """Compute overall accuracy across all species detections."""
-    species_mask = df["true_species"].isin(SPECIES_NAMES)
-    subset = df[species_mask]
-    if len(subset) == 0:
-        return 0.0
-    correct = (subset["predicted_species"] == subset["true_species"]).sum()
-    return correct / len(subset) * 100
+    return compute_metrics(df)["overall"]
 
 
 def build_confusion_matrix(df: pd.DataFrame) -> pd.DataFrame:
     """Build confusion matrix (true x predicted) for known species."""
-    species = SPECIES_NAMES
-    matrix = pd.DataFrame(0, index=species, columns=species)
-
-    species_set = set(species)
-    for _, row in df.iterrows():
-        true = row["true_species"]
-        pred = row["predicted_species"]
-        if true in species_set and pred in species_set:
-            matrix.loc[true, pred] += 1
-
-    return matrix
+    return pd.DataFrame(compute_metrics(df)["confusion"],
+                        index=SPECIES_NAMES, columns=SPECIES_NAMES)
 
 
 # ============================================================
 # Chart 1: Accuracy Comparison Bar Chart
 # ============================================================
 
-def chart1_accuracy_comparison(exp_data: dict, output_dir: Path):
+def chart1_accuracy_comparison(exp_metrics: dict, output_dir: Path):
     """Bar chart comparing overall accuracy across all experiments."""
     fig, ax = plt.subplots(figsize=(10, 6))
 
@@ -182,9 +195,9 @@ def chart1_accuracy_comparison(exp_data: dict, output_dir: Path):
     colors = []
 
     for exp_key in DISPLAY_ORDER:
-        if exp_key not in exp_data:
+        if exp_key not in exp_metrics:
             continue
-        acc = compute_overall_accuracy(exp_data[exp_key])
+        acc = exp_metrics[exp_key]["overall"]
         names.append(EXPERIMENTS[exp_key])
         accuracies.append(acc)
         colors.append(COLORS[exp_key])
@@ -214,7 +227,7 @@ def chart1_accuracy_comparison(exp_data: dict, output_dir: Path):
 # Chart 2: Data Scaling Curve
 # ============================================================
 
-def chart2_scaling_curve(exp_data: dict, output_dir: Path):
+def chart2_scaling_curve(exp_metrics: dict, output_dir: Path):
     """Line plot: training samples vs accuracy."""
     # Approximate samples per species for each experiment
     sample_points = {
@@ -229,9 +242,9 @@ def chart2_scaling_curve(exp_data: dict, output_dir: Path):
     labels = []
 
     for exp_key in ["Exp3_FewShot_10", "Exp3_FewShot_25", "Exp3_FewShot_50", "Exp2_WithNoise"]:
-        if exp_key not in exp_data:
+        if exp_key not in exp_metrics:
             continue
-        acc = compute_overall_accuracy(exp_data[exp_key])
+        acc = exp_metrics[exp_key]["overall"]
         x_vals.append(sample_points[exp_key])
         y_vals.append(acc)
         labels.append(EXPERIMENTS[exp_key])
@@ -308,20 +321,19 @@ def chart3_confidence_violins(exp_data: dict, output_dir: Path):
 # Chart 4: Per-Species Accuracy Heatmap
 # ============================================================
 
-def chart4_species_accuracy_heatmap(exp_data: dict, output_dir: Path):
+def chart4_species_accuracy_heatmap(exp_metrics: dict, output_dir: Path):
     """Heatmap: species (rows) x experiment (cols), color = accuracy %."""
     # Build accuracy matrix
-    exp_keys = [k for k in DISPLAY_ORDER if k in exp_data]
+    exp_keys = [k for k in DISPLAY_ORDER if k in exp_metrics]
     species_list = SPECIES_NAMES
 
     matrix = np.full((len(species_list), len(exp_keys)), np.nan)
 
     for col_idx, exp_key in enumerate(exp_keys):
-        per_sp = compute_per_species_accuracy(exp_data[exp_key])
-        for row_idx, sp in enumerate(species_list):
-            _, total, acc = per_sp[sp]
-            if total > 0:
-                matrix[row_idx, col_idx] = acc
+        totals = exp_metrics[exp_key]["totals"]
+        correct = exp_metrics[exp_key]["correct"]
+        seen = totals > 0
+        matrix[seen, col_idx] = correct[seen] / totals[seen] * 100
 
     # Sort species by Exp2 accuracy (or Exp1 if Exp2 missing)
     sort_col = exp_keys.index("Exp2_WithNoise") if "Exp2_WithNoise" in exp_keys else 0
@@ -337,7 +349,7 @@ def chart4_species_accuracy_heatmap(exp_data: dict, output_dir: Path):
 
     fig, ax = plt.subplots(figsize=(10, 12))
 
-    cmap = LinearSegmentedColormap.from_list("accuracy",
+    cmap = mcolors.LinearSegmentedColormap.from_list("accuracy",
                                               ["#d32f2f", "#ff9800", "#fdd835", "#8bc34a", "#2e7d32"])
 
     im = ax.imshow(matrix, cmap=cmap, aspect="auto", vmin=0, vmax=100)
@@ -375,14 +387,15 @@ def chart4_species_accuracy_heatmap(exp_data: dict, output_dir: Path):
 # Chart 5: Confusion Matrix (Exp2)
 # ============================================================
 
-def chart5_confusion_matrix(exp_data: dict, output_dir: Path):
+def chart5_confusion_matrix(exp_metrics: dict, output_dir: Path):
     """30x30 confusion matrix heatmap for the best model (Exp2)."""
     target_key = "Exp2_WithNoise"
-    if target_key not in exp_data:
+    if target_key not in exp_metrics:
         print("  [SKIP] Chart 5: Exp2_WithNoise not found")
         return
 
-    cm = build_confusion_matrix(exp_data[target_key])
+    cm = pd.DataFrame(exp_metrics[target_key]["confusion"],
+                      index=SPECIES_NAMES, columns=SPECIES_NAMES)
 
     # Normalize rows to percentages
     row_sums = cm.sum(axis=1)
@@ -439,14 +452,14 @@ def chart5_confusion_matrix(exp_data: dict, output_dir: Path):
 # Chart 6: Exp1 vs Exp2 Per-Species Delta
 # ============================================================
 
-def chart6_exp1_vs_exp2_delta(exp_data: dict, output_dir: Path):
+def chart6_exp1_vs_exp2_delta(exp_metrics: dict, output_dir: Path):
     """Horizontal bar chart showing per-species accuracy change from Exp1 to Exp2."""
-    if "Exp1_NoNoise" not in exp_data or "Exp2_WithNoise" not in exp_data:
+    if "Exp1_NoNoise" not in exp_metrics or "Exp2_WithNoise" not in exp_metrics:
         print("  [SKIP] Chart 6: Need both Exp1 and Exp2")
         return
 
-    acc1 = compute_per_species_accuracy(exp_data["Exp1_NoNoise"])
-    acc2 = compute_per_species_accuracy(exp_data["Exp2_WithNoise"])
+    acc1 = exp_metrics["Exp1_NoNoise"]["per_species"]
+    acc2 = exp_metrics["Exp2_WithNoise"]["per_species"]
 
     species_deltas = []
     for sp in SPECIES_NAMES:
@@ -563,6 +576,9 @@ def main():
     parser = argparse.ArgumentParser(description="Generate all experiment visualizations.")
     parser.add_argument("--results_dir", type=str, default=str(RESULTS_DIR))
     parser.add_argument("--output_dir", type=str, default=str(RESULTS_DIR / "figures"))
+    parser.add_argument("--no_cache", action="store_true",
+                        help="Re-read every result CSV instead of the consolidated "
+                             "detections.parquet per experiment")
     args = parser.parse_args()
 
     results_dir = Path(args.results_dir)
@@ -577,32 +593,34 @@ def main():
 
     # Load all experiments
     print("\nLoading experiment data...")
-    exp_data = load_all_experiments(results_dir)
+    exp_data = load_all_experiments(results_dir, use_cache=not args.no_cache)
 
     if not exp_data:
         print("[ERROR] No experiment data found!")
         return
 
-    print(f"\nLoaded {len(exp_data)} experiments. Generating charts...\n")
+    print(f"\nLoaded {len(exp_data)} experiments. Computing metrics...")
+    exp_metrics = compute_all_metrics(exp_data)
+    print("Generating charts...\n")
 
     # Generate all 7 charts
     print("--- Chart 1: Accuracy Comparison ---")
-    chart1_accuracy_comparison(exp_data, output_dir)
+    chart1_accuracy_comparison(exp_metrics, output_dir)
 
     print("--- Chart 2: Data Scaling Curve ---")
-    chart2_scaling_curve(exp_data, output_dir)
+    chart2_scaling_curve(exp_metrics, output_dir)
 
     print("--- Chart 3: Confidence Violins ---")
     chart3_confidence_violins(exp_data, output_dir)
 
     print("--- Chart 4: Species Accuracy Heatmap ---")
-    chart4_species_accuracy_heatmap(exp_data, output_dir)
+    chart4_species_accuracy_heatmap(exp_metrics, output_dir)
 
     print("--- Chart 5: Confusion Matrix (Exp2) ---")
-    chart5_confusion_matrix(exp_data, output_dir)
+    chart5_confusion_matrix(exp_metrics, output_dir)
 
     print("--- Chart 6: Exp1 vs Exp2 Delta ---")
-    chart6_exp1_vs_exp2_delta(exp_data, output_dir)
+    chart6_exp1_vs_exp2_delta(exp_metrics, output_dir)
 
     print("--- Chart 7: Confidence Box Plots ---")
     chart7_confidence_boxplots(exp_data, output_dir)
@@ -6,7 +6,8 @@ using the fine-tuned BirdNET model.
 
 How it works:
   1. Continuously records audio from your microphone at 48kHz mono
-  2. Buffers into 3-second segments (BirdNET's window)
+  2. Buffers into 3-second segments (BirdNET's window) via a ring buffer;
+     inference wakes up as soon as each hop of new audio arrives
   3. Runs each segment through the .tflite model
   4. Displays top predictions with confidence scores
 
@@ -15,6 +16,8 @@ Usage:
     python scripts/09_live_recognition.py --model models/exp2_with_noise.tflite
     python scripts/09_live_recognition.py --threshold 0.3 --top_k 3
     python scripts/09_live_recognition.py --list-devices
+    python scripts/09_live_recognition.py --benchmark 500
+    python scripts/09_live_recognition.py --analyze recording.wav --max_batch 16
 
 Controls:
     Press Ctrl+C to stop.
@@ -22,87 +25,130 @@ Controls:
 
 import argparse
 import sys
+import threading
 import time
 from pathlib import Path
 
 import numpy as np
-import sounddevice as sd
-import tensorflow as tf
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-from configs.config import SPECIES_COMMON_NAMES, MODELS_DIR
+from configs.config import SAMPLE_RATE, MODELS_DIR, AUDIO_CACHE_DIR
+from scripts._audio_cache import load_audio
+from scripts._inference_lib import (
+    BirdClassifier, frame_windows, SEGMENT_DURATION, SEGMENT_SAMPLES,
+)
+from scripts._lazy import lazy_import
+
+sd = lazy_import("sounddevice")
 
 
 # ============================================================
 # Constants
 # ============================================================
-SAMPLE_RATE = 48000
-SEGMENT_DURATION = 3.0  # seconds
-SEGMENT_SAMPLES = int(SAMPLE_RATE * SEGMENT_DURATION)  # 144000
+RING_SECONDS = 30.0     # audio kept while inference catches up
 
 
 # ============================================================
-# Model
+# Audio capture
 # ============================================================
 
-class BirdClassifier:
-    """Wraps a fine-tuned BirdNET .tflite model for inference."""
-
-    def __init__(self, model_path: str):
-        self.interpreter = tf.lite.Interpreter(model_path=model_path)
-        self.interpreter.allocate_tensors()
-
-        self.input_details = self.interpreter.get_input_details()
-        self.output_details = self.interpreter.get_output_details()
-
-        # Load labels (same name as model, with _Labels.txt)
-        label_path = Path(model_path).with_name(
-            Path(model_path).stem + "_Labels.txt"
-        )
-        if not label_path.exists():
-            raise FileNotFoundError(f"Label file not found: {label_path}")
-
-        self.labels = label_path.read_text().strip().splitlines()
-        self.common_names = {
-            sp: SPECIES_COMMON_NAMES.get(sp, sp) for sp in self.labels
-        }
-
-    def predict(self, audio: np.ndarray) -> list:
+class AudioRingBuffer:
+    """
+    Thread-safe ring buffer between the audio callback and inference.
+
+    The callback appends samples with write(); the main thread blocks in
+    wait_windows() until at least one full window starting at the next hop
+    boundary is available, and takes every pending window (up to a batch
+    limit) in one call. Windows are addressed by absolute sample position, so
+    audio that arrives while inference runs is kept, not dropped. Only
+    when the consumer falls more than the buffer capacity behind are the
+    oldest samples overwritten; each such event is counted in `overruns`.
+    """
+
+    def __init__(self, capacity: int, window: int = SEGMENT_SAMPLES,
+                 hop: int = SEGMENT_SAMPLES):
+        if capacity < window:
+            raise ValueError(f"capacity ({capacity}) must hold one window ({window})")
+        self.capacity = capacity
+        self.window = window
+        self.hop = hop
+        self._buf = np.zeros(capacity, dtype=np.float32)
+        self._cond = threading.Condition()
+        self.written = 0        # total samples ever written
+        self.next_start = 0     # absolute start of the next window
+        self.overruns = 0
+        self.dropped_samples = 0
+
+    def write(self, samples: np.ndarray):
+        """Append samples (called from the audio callback thread)."""
+        n = len(samples)
+        with self._cond:
+            if n > self.capacity:
+                # Only the newest `capacity` samples can be kept
+                self.written += n - self.capacity
+                samples = samples[-self.capacity:]
+                n = self.capacity
+            pos = self.written % self.capacity
+            first = min(n, self.capacity - pos)
+            self._buf[pos:pos + first] = samples[:first]
+            self._buf[:n - first] = samples[first:]
+            self.written += n
+
+            oldest = self.written - self.capacity
+            if self.next_start < oldest:
+                # Consumer fell a whole buffer behind: skip to the oldest
+                # hop boundary that is still intact.
+                behind = oldest - self.next_start
+                skip = -(-behind // self.hop) * self.hop
+                self.next_start += skip
+                self.overruns += 1
+                self.dropped_samples += skip
+
+            if self.written >= self.next_start + self.window:
+                self._cond.notify()
+
+    def pending(self) -> int:
+        """Number of complete windows waiting to be read."""
+        with self._cond:
+            return self._pending()
+
+    def _pending(self) -> int:
+        ready = self.written - self.next_start - self.window
+        return 0 if ready < 0 else ready // self.hop + 1
+
+    def _read(self, start: int) -> np.ndarray:
+        pos = start % self.capacity
+        end = pos + self.window
+        if end <= self.capacity:
+            return self._buf[pos:end].copy()
+        return np.concatenate((self._buf[pos:], self._buf[:end - self.capacity]))
+
+    def wait_windows(self, max_windows: int = 1,
+                     timeout: float = None) -> np.ndarray:
         """
-        Run inference on a 3-second audio chunk.
+        Block until at least one window is complete, then return up to
+        max_windows pending windows as an array of shape (n, window).
 
-        Args:
-            audio: float32 array of shape (144000,) — 3s at 48kHz mono
-
-        Returns:
-            List of (scientific_name, common_name, confidence) sorted by confidence desc
+        Returns None on timeout so the caller can stay responsive to Ctrl+C.
         """
-        # Ensure correct shape and type
-        if len(audio) < SEGMENT_SAMPLES:
-            audio = np.pad(audio, (0, SEGMENT_SAMPLES - len(audio)))
-        elif len(audio) > SEGMENT_SAMPLES:
-            audio = audio[:SEGMENT_SAMPLES]
-
-        audio = audio.astype(np.float32).reshape(1, SEGMENT_SAMPLES)
-
-        # Run model
-        self.interpreter.resize_tensor_input(
-            self.input_details[0]["index"], audio.shape
-        )
-        self.interpreter.allocate_tensors()
-        self.interpreter.set_tensor(self.input_details[0]["index"], audio)
-        self.interpreter.invoke()
-
-        scores = self.interpreter.get_tensor(self.output_details[0]["index"])[0]
-
-        # Build results
-        results = []
-        for idx, score in enumerate(scores):
-            sp = self.labels[idx]
-            results.append((sp, self.common_names[sp], float(score)))
-
-        results.sort(key=lambda x: x[2], reverse=True)
-        return results
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._pending() > 0, timeout):
+                return None
+            n = min(self._pending(), max_windows)
+            batch = np.empty((n, self.window), dtype=np.float32)
+            for i in range(n):
+                batch[i] = self._read(self.next_start)
+                self.next_start += self.hop
+            return batch
+
+
+def audio_backend_error() -> str:
+    """None when sounddevice (and its PortAudio library) loads, else why not."""
+    try:
+        sd.query_devices  # first attribute access performs the import
+    except (ImportError, OSError) as e:
+        return f"{type(e).__name__}: {e}"
+    return None
 
 
 # ============================================================
@@ -150,8 +196,15 @@ def display_predictions(results: list, threshold: float, top_k: int,
 # ============================================================
 
 def run_live(model_path: str, threshold: float, top_k: int,
-             device: int = None, overlap: float = 0.0):
+             device: int = None, overlap: float = 0.0,
+             buffer_seconds: float = RING_SECONDS, max_batch: int = 8,
+             sigmoid: bool = False):
     """Run live bird sound recognition."""
+    error = audio_backend_error()
+    if error is not None:
+        print(f"[ERROR] Audio input unavailable ({error}); "
+              f"pip install sounddevice and the PortAudio library")
+        return
 
     print("=" * 55)
     print("  LIVE BIRD SOUND RECOGNITION")
@@ -174,40 +227,34 @@ def run_live(model_path: str, threshold: float, top_k: int,
 
     # Load model
     print("Loading model...", end=" ", flush=True)
-    classifier = BirdClassifier(model_path)
+    classifier = BirdClassifier(model_path, sigmoid=sigmoid)
     print(f"OK ({len(classifier.labels)} species)")
     print()
     print("Listening... (press Ctrl+C to stop)")
     print()
 
-    # Audio buffer
-    buffer = np.zeros(SEGMENT_SAMPLES, dtype=np.float32)
-    buffer_pos = 0
-    segment_num = 0
-    display_lines = 0
-
     # Calculate step size (how many new samples per segment)
     overlap_samples = int(overlap * SAMPLE_RATE)
     step_samples = SEGMENT_SAMPLES - overlap_samples
+    if step_samples <= 0:
+        print(f"[ERROR] Overlap must be shorter than {SEGMENT_DURATION}s")
+        return
+
+    ring = AudioRingBuffer(
+        capacity=max(int(buffer_seconds * SAMPLE_RATE), SEGMENT_SAMPLES + step_samples),
+        hop=step_samples,
+    )
+    segment_num = 0
+    device_overflows = 0
 
     def audio_callback(indata, frames, time_info, status):
         """Called by sounddevice for each audio block."""
-        nonlocal buffer, buffer_pos
-
-        if status:
-            pass  # Ignore overflow warnings in live mode
+        nonlocal device_overflows
+        if status.input_overflow:
+            device_overflows += 1
 
         # Take mono channel
-        mono = indata[:, 0].astype(np.float32)
-
-        # Fill buffer
-        remaining = SEGMENT_SAMPLES - buffer_pos
-        if len(mono) <= remaining:
-            buffer[buffer_pos:buffer_pos + len(mono)] = mono
-            buffer_pos += len(mono)
-        else:
-            buffer[buffer_pos:] = mono[:remaining]
-            buffer_pos = SEGMENT_SAMPLES  # Mark as full
+        ring.write(indata[:, 0])
 
     # Print initial placeholder lines
     print(f"--- Waiting for first {SEGMENT_DURATION}s of audio... ---")
@@ -220,34 +267,153 @@ def run_live(model_path: str, threshold: float, top_k: int,
                             callback=audio_callback,
                             blocksize=int(SAMPLE_RATE * 0.1)):  # 100ms blocks
             while True:
-                # Wait until buffer is full
-                if buffer_pos >= SEGMENT_SAMPLES:
+                # Woken as soon as a hop of new samples completes a window;
+                # if inference fell behind, the whole backlog comes at once
+                windows = ring.wait_windows(max_batch, timeout=0.5)
+                if windows is None:
+                    continue
+
+                # Run inference (one invoke for the backlog)
+                for results in classifier.predict_batch(windows, top_k):
                     segment_num += 1
-                    audio_chunk = buffer.copy()
-
-                    # Shift buffer for overlap
-                    if overlap_samples > 0:
-                        buffer[:overlap_samples] = buffer[step_samples:]
-                        buffer_pos = overlap_samples
-                    else:
-                        buffer_pos = 0
-
-                    # Run inference
-                    results = classifier.predict(audio_chunk)
 
                     # Display
                     display_lines = display_predictions(
                         results, threshold, top_k, segment_num, display_lines
                     )
-                else:
-                    time.sleep(0.05)  # Small sleep to avoid busy-waiting
 
     except KeyboardInterrupt:
         print(f"\n\nStopped after {segment_num} segments.")
+        print(f"  Buffer overruns: {ring.overruns} "
+              f"({ring.dropped_samples / SAMPLE_RATE:.1f}s skipped), "
+              f"device overflows: {device_overflows}")
+
+
+def analyze_file(classifier: BirdClassifier, audio_path: str,
+                 overlap: float = 0.0, batch_size: int = 16,
+                 threshold: float = 0.1, top_k: int = 5,
+                 audio_cache: Path = None) -> list:
+    """
+    Analyze a whole recording offline with batched inference.
+
+    The file is decoded directly unless audio_cache names a decoded-audio
+    cache directory; one-off recordings would otherwise pile up there.
+
+    Returns:
+        List of (start_s, end_s, scientific_name, common_name, confidence)
+        for every prediction >= threshold among each window's top_k.
+    """
+    # Cached recordings come back memory-mapped; windows are views into them
+    y = load_audio(audio_path, sr=SAMPLE_RATE, cache_dir=audio_cache)
+    hop = SEGMENT_SAMPLES - int(overlap * SAMPLE_RATE)
+    windows = frame_windows(np.asarray(y, dtype=np.float32), hop)
+
+    detections = []
+    for b in range(0, len(windows), batch_size):
+        batch = windows[b:b + batch_size]
+        for i, results in enumerate(classifier.predict_batch(batch, top_k)):
+            start_s = (b + i) * hop / SAMPLE_RATE
+            for sp, common, conf in results:
+                if conf >= threshold:
+                    detections.append(
+                        (start_s, start_s + SEGMENT_DURATION, sp, common, conf))
+    return detections
+
+
+def run_analyze(model_path: str, audio_path: str, overlap: float,
+                batch_size: int, threshold: float, top_k: int,
+                sigmoid: bool = False, audio_cache: Path = None):
+    """Print the detections for one recording (--analyze)."""
+    classifier = BirdClassifier(model_path, sigmoid=sigmoid)
+    t0 = time.perf_counter()
+    detections = analyze_file(classifier, audio_path, overlap, batch_size,
+                              threshold, top_k, audio_cache)
+    elapsed = time.perf_counter() - t0
+
+    print(f"\n{Path(audio_path).name}: {len(detections)} detections "
+          f"(>= {threshold:.0%}, batch {batch_size}, {elapsed:.2f}s)")
+    print("-" * 70)
+    for start_s, end_s, sp, common, conf in detections:
+        print(f"  {start_s:7.1f}-{end_s:7.1f}s  {common:<35s} {conf:.1%}")
+
+
+def run_benchmark(model_path: str, n_iter: int = 200, warmup: int = 10,
+                  top_k: int = 5, seed: int = 42, batch_size: int = 1,
+                  sigmoid: bool = False) -> dict:
+    """
+    Measure per-chunk inference latency of the warm classifier.
+
+    Feeds n_iter random 3-second chunks through predict() (after `warmup`
+    untimed calls) and reports p50/p95/p99 latency and the real-time
+    factor (latency / segment duration; < 1 keeps up with live audio).
+    With batch_size > 1, predict_batch() is also timed and its per-window
+    cost reported.
+    """
+    print("=" * 55)
+    print("  INFERENCE BENCHMARK")
+    print("=" * 55)
+    print(f"  Model:      {Path(model_path).name}")
+    print(f"  Iterations: {n_iter} (+{warmup} warmup)")
+
+    t0 = time.perf_counter()
+    classifier = BirdClassifier(model_path, sigmoid=sigmoid)
+    load_s = time.perf_counter() - t0
+
+    rng = np.random.default_rng(seed)
+    chunks = (rng.standard_normal((8, SEGMENT_SAMPLES)) * 0.05).astype(np.float32)
+
+    for i in range(warmup):
+        classifier.predict(chunks[i % len(chunks)], top_k)
+
+    latencies = np.empty(n_iter)
+    for i in range(n_iter):
+        t0 = time.perf_counter()
+        classifier.predict(chunks[i % len(chunks)], top_k)
+        latencies[i] = time.perf_counter() - t0
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    stats = {
+        "load_s": load_s,
+        "p50_ms": p50 * 1000,
+        "p95_ms": p95 * 1000,
+        "p99_ms": p99 * 1000,
+        "mean_ms": latencies.mean() * 1000,
+        "rtf": latencies.mean() / SEGMENT_DURATION,
+        "rtf_p99": p99 / SEGMENT_DURATION,
+    }
+
+    print(f"  Load time:  {load_s:.2f}s ({len(classifier.labels)} species)")
+    print("-" * 55)
+    print(f"  Latency p50: {stats['p50_ms']:8.2f} ms")
+    print(f"  Latency p95: {stats['p95_ms']:8.2f} ms")
+    print(f"  Latency p99: {stats['p99_ms']:8.2f} ms")
+    print(f"  Mean:        {stats['mean_ms']:8.2f} ms")
+    print(f"  Real-time factor: {stats['rtf']:.4f} "
+          f"(p99 {stats['rtf_p99']:.4f}, {1 / stats['rtf']:.0f}x real time)")
+
+    if batch_size > 1:
+        batch = np.resize(chunks, (batch_size, SEGMENT_SAMPLES))
+        classifier.predict_batch(batch, top_k)
+        n_batches = max(1, n_iter // batch_size)
+        t0 = time.perf_counter()
+        for _ in range(n_batches):
+            classifier.predict_batch(batch, top_k)
+        per_window = (time.perf_counter() - t0) / (n_batches * batch_size)
+        stats["batch_window_ms"] = per_window * 1000
+        print(f"  Batched ({batch_size}/invoke): {per_window * 1000:8.2f} ms/window "
+              f"({latencies.mean() / per_window:.1f}x vs single)")
+    print("=" * 55)
+    return stats
 
 
 def list_devices():
     """List available audio input devices."""
+    error = audio_backend_error()
+    if error is not None:
+        print(f"[ERROR] Audio input unavailable ({error}); "
+              f"pip install sounddevice and the PortAudio library")
+        return
+
     print("\nAvailable audio input devices:")
     print("-" * 60)
     devices = sd.query_devices()
@@ -285,10 +451,39 @@ def main():
         "--overlap", type=float, default=1.5,
         help="Overlap between segments in seconds (default: 1.5)"
     )
+    parser.add_argument(
+        "--buffer_seconds", type=float, default=RING_SECONDS,
+        help="Audio kept while inference catches up "
+             f"(default: {RING_SECONDS:.0f}s)"
+    )
     parser.add_argument(
         "--list-devices", action="store_true",
         help="List available audio input devices and exit"
     )
+    parser.add_argument(
+        "--sigmoid", action="store_true",
+        help="Apply BirdNET's sigmoid to raw model outputs (for classifiers "
+             "that emit logits)"
+    )
+    parser.add_argument(
+        "--max_batch", type=int, default=8,
+        help="Max windows per invoke when catching up / analyzing (default: 8)"
+    )
+    parser.add_argument(
+        "--analyze", type=str, default=None, metavar="WAV",
+        help="Analyze an audio file offline with batched inference and exit"
+    )
+    parser.add_argument(
+        "--audio_cache", type=str, default=None, metavar="DIR",
+        help="With --analyze: read/store the decoded file in this cache "
+             f"directory, e.g. {AUDIO_CACHE_DIR} (default: decode directly)"
+    )
+    parser.add_argument(
+        "--benchmark", type=int, nargs="?", const=200, default=None,
+        metavar="N",
+        help="Time N inferences (default: 200) and report latency "
+             "percentiles and real-time factor, then exit"
+    )
     args = parser.parse_args()
 
     if args.list_devices:
@@ -299,12 +494,26 @@ def main():
         print(f"[ERROR] Model not found: {args.model}")
         return
 
+    if args.analyze:
+        run_analyze(args.model, args.analyze, args.overlap, args.max_batch,
+                    args.threshold, args.top_k, args.sigmoid,
+                    Path(args.audio_cache) if args.audio_cache else None)
+        return
+
+    if args.benchmark is not None:
+        run_benchmark(args.model, n_iter=args.benchmark, top_k=args.top_k,
+                      batch_size=args.max_batch, sigmoid=args.sigmoid)
+        return
+
     run_live(
         model_path=args.model,
         threshold=args.threshold,
         top_k=args.top_k,
         device=args.device,
         overlap=args.overlap,
+        buffer_seconds=args.buffer_seconds,
+        max_batch=args.max_batch,
+        sigmoid=args.sigmoid,
     )
 
 
@@ -0,0 +1,247 @@
+"""
+Persistent cache of decoded, resampled audio.
+Importable by multiple scripts without circular dependencies.
+
+Each recording is decoded once with librosa and stored as a float32 mono
+.npy file named after the source file's content hash and the sample rate.
+Later loads memory-map that file, so stages can slice 3 s windows without
+touching the codec or resampler again. Writes go through a temporary file
+and an atomic rename, so concurrent worker processes can share the cache.
+
+Content hashes are remembered in digests.sqlite next to the entries, keyed
+by source path + mtime + size, so a warm run opens no source file at all;
+a file is only hashed again when it is new or modified.
+
+The cache does not evict on its own. AudioCache.prune() (run at the end of
+Stage 1 and Stage 5) forgets index rows for moved or edited recordings,
+deletes entries no indexed recording points at any more, and trims the
+least recently used entries down to AUDIO_CACHE_MAX_BYTES.
+"""
+
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from configs.config import SAMPLE_RATE, AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES
+from scripts._lazy import lazy_import
+
+librosa = lazy_import("librosa")
+
+HASH_CHUNK_BYTES = 1 << 20
+DIGEST_INDEX_FILE = "digests.sqlite"
+STALE_TMP_SECONDS = 3600  # leftover .tmp.npy older than this is from a dead writer
+
+
+def file_digest(audio_path) -> str:
+    """BLAKE2b hex digest (16 bytes) of a file's contents."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(audio_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class AudioCache:
+    """Memory-mapped store of decoded mono float32 audio, keyed by content."""
+
+    def __init__(self, cache_dir: Path = AUDIO_CACHE_DIR, sr: int = SAMPLE_RATE):
+        self.cache_dir = Path(cache_dir)
+        self.sr = sr
+        self.hits = 0
+        self.misses = 0
+        # abspath -> (mtime_ns, size, digest), loaded from the digest index
+        self._digests = None
+        self._conn = None
+        self._conn_pid = None
+        # Stage 5 decodes on a thread pool that shares this instance
+        self._lock = threading.Lock()
+
+    def _index(self) -> sqlite3.Connection:
+        """
+        Connection to the digest index, opened once per process (pool
+        workers must not share a connection inherited through fork).
+        Callers hold self._lock; threads share the connection.
+        """
+        if self._conn is None or self._conn_pid != os.getpid():
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.cache_dir / DIGEST_INDEX_FILE),
+                                         timeout=30.0, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS digests ("
+                " path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL,"
+                " size INTEGER NOT NULL, digest TEXT NOT NULL)"
+            )
+            self._conn.commit()
+            self._conn_pid = os.getpid()
+            # One scan per process; lookups are then dictionary hits
+            cursor = self._conn.execute("SELECT path, mtime_ns, size, digest FROM digests")
+            self._digests = {row[0]: row[1:] for row in cursor}
+        return self._conn
+
+    def _digest(self, audio_path) -> str:
+        st = os.stat(audio_path)
+        path = os.path.abspath(audio_path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            self._index()
+            row = self._digests.get(path)
+        if row is not None and row[:2] == stamp:
+            return row[2]
+
+        digest = file_digest(audio_path)
+        with self._lock:
+            conn = self._index()
+            self._digests[path] = stamp + (digest,)
+            conn.execute("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)",
+                         (path,) + stamp + (digest,))
+            conn.commit()
+        return digest
+
+    def entry_path(self, audio_path) -> Path:
+        """Where the decoded array for audio_path lives (may not exist yet)."""
+        digest = self._digest(audio_path)
+        return self.cache_dir / digest[:2] / f"{digest}_{self.sr}.npy"
+
+    def load(self, audio_path) -> np.ndarray:
+        """
+        Decoded audio as a read-only memory-mapped float32 array.
+
+        Decodes and stores the file on a miss; raises whatever librosa
+        raises for unreadable files (nothing is cached for them).
+        """
+        entry = self.entry_path(audio_path)
+        if entry.is_file():
+            try:
+                y = np.load(entry, mmap_mode="r")
+                self.hits += 1
+                try:
+                    os.utime(entry)  # mtime doubles as last use for prune()
+                except OSError:
+                    pass
+                return y
+            except (OSError, ValueError):
+                pass  # truncated or corrupt entry: decode again
+
+        self.misses += 1
+        y, _ = librosa.load(str(audio_path), sr=self.sr, mono=True)
+        y = np.ascontiguousarray(y, dtype=np.float32)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = entry.with_name(f"{entry.stem}.{os.getpid()}.{threading.get_ident()}.tmp.npy")
+        np.save(tmp, y)
+        os.replace(tmp, entry)
+        return np.load(entry, mmap_mode="r")
+
+    def prune(self, max_bytes: Optional[int] = AUDIO_CACHE_MAX_BYTES) -> dict:
+        """
+        Drop what no recording can hit any more, then trim to max_bytes.
+
+        Index rows whose source file is gone or has a different mtime/size
+        are deleted; .npy entries whose digest no remaining row references
+        are unlinked, as are temporary files left by crashed writers. If
+        the surviving entries still exceed max_bytes (None: no limit), the
+        least recently used ones are evicted. Run it when no other process
+        is writing to the cache.
+
+        Returns:
+            Dict with rows_dropped, orphans_removed, evicted and bytes_kept.
+        """
+        with self._lock:
+            conn = self._index()
+            rows = conn.execute("SELECT path, mtime_ns, size, digest FROM digests").fetchall()
+            stale = []
+            for path, mtime_ns, size, _ in rows:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    stale.append(path)
+                    continue
+                if (st.st_mtime_ns, st.st_size) != (mtime_ns, size):
+                    stale.append(path)
+            if stale:
+                conn.executemany("DELETE FROM digests WHERE path = ?",
+                                 [(p,) for p in stale])
+                conn.commit()
+            stale = set(stale)
+            self._digests = {row[0]: row[1:] for row in rows if row[0] not in stale}
+            live = {row[3] for row in rows if row[0] not in stale}
+
+        stats = {"rows_dropped": len(stale), "orphans_removed": 0,
+                 "evicted": 0, "bytes_kept": 0}
+        now = time.time()
+        kept = []  # (mtime, size, path)
+        for entry in self.cache_dir.glob("*/*.npy"):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            if entry.name.endswith(".tmp.npy"):
+                if now - st.st_mtime > STALE_TMP_SECONDS:
+                    entry.unlink(missing_ok=True)
+                    stats["orphans_removed"] += 1
+                continue
+            if entry.name.split("_", 1)[0] not in live:
+                entry.unlink(missing_ok=True)
+                stats["orphans_removed"] += 1
+                continue
+            kept.append((st.st_mtime, st.st_size, entry))
+
+        total = sum(size for _, size, _ in kept)
+        if max_bytes is not None and total > max_bytes:
+            for _, size, entry in sorted(kept, key=lambda k: k[0]):
+                if total <= max_bytes:
+                    break
+                entry.unlink(missing_ok=True)
+                total -= size
+                stats["evicted"] += 1
+        stats["bytes_kept"] = total
+        return stats
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = 100 * self.hits / total if total else 0.0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate)"
+
+
+_caches = {}
+
+
+def get_cache(cache_dir: Path = AUDIO_CACHE_DIR, sr: int = SAMPLE_RATE) -> AudioCache:
+    """This process's shared AudioCache for (cache_dir, sr)."""
+    key = (str(cache_dir), sr)
+    cache = _caches.get(key)
+    if cache is None:
+        cache = _caches[key] = AudioCache(cache_dir, sr)
+    return cache
+
+
+def prune_audio_cache(cache_dir: Path = AUDIO_CACHE_DIR, sr: int = SAMPLE_RATE,
+                      max_bytes: Optional[int] = AUDIO_CACHE_MAX_BYTES) -> dict:
+    """Prune the cache at cache_dir (see AudioCache.prune) and print a summary."""
+    stats = get_cache(cache_dir, sr).prune(max_bytes)
+    print(f"  Audio cache: dropped {stats['rows_dropped']} stale index rows, "
+          f"{stats['orphans_removed']} orphaned files, evicted {stats['evicted']}; "
+          f"{stats['bytes_kept'] / 1024 ** 3:.2f} GiB kept")
+    return stats
+
+
+def load_audio(audio_path, sr: int = SAMPLE_RATE,
+               cache_dir: Optional[Path] = AUDIO_CACHE_DIR) -> np.ndarray:
+    """
+    librosa.load(audio_path, sr=sr, mono=True)[0], served from the cache.
+
+    With cache_dir=None the file is decoded directly. One AudioCache is
+    kept per (cache_dir, sr) in each process, so pool workers reuse their
+    digest index connection across tasks.
+    """
+    if cache_dir is None:
+        y, _ = librosa.load(str(audio_path), sr=sr, mono=True)
+        return y
+    return get_cache(cache_dir, sr).load(audio_path)
@@ -3,11 +3,16 @@ Standalone feature extraction and classification functions.
 Importable by multiple scripts without circular dependencies.
 """
 
+from __future__ import annotations
+
+import csv
+import json
+import os
+import shutil
 import sys
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
 
-import librosa
 import numpy as np
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -15,6 +20,39 @@ from configs.config import (
     SAMPLE_RATE, SILENCE_RMS_THRESHOLD,
     NOISE_FLATNESS_THRESHOLD, NOISE_ZCR_THRESHOLD,
 )
+from scripts._lazy import lazy_import
+
+librosa = lazy_import("librosa")
+pd = lazy_import("pandas")
+scipy = lazy_import("scipy", submodules=("fft", "signal"))
+
+
+# Framing shared by spectral flatness and ZCR (librosa defaults)
+FRAME_LENGTH = 2048
+HOP_LENGTH = 512
+FEATURE_BATCH_SIZE = 64    # windows per vectorized batch (~150 MB of STFT)
+STREAM_FLUSH_ROWS = 1000   # rows buffered before a streamed flush to disk
+
+# Column order of results/segment_classifications.{csv,parquet}
+CLASSIFICATION_FIELDNAMES = [
+    "species_folder", "filename", "filepath",
+    "rms", "spectral_flatness", "zcr",
+    "duration_s", "classification",
+]
+FEATURE_COLUMNS = ["rms", "spectral_flatness", "zcr", "duration_s"]
+# Threshold features stay float64 so tuning compares the values Stage 2 used.
+# Bump CLASSIFICATIONS_VERSION when the stored dtypes change, so an older
+# checkpoint is not resumed into a file of a different schema.
+CLASSIFICATIONS_VERSION = 2
+FEATURE_DTYPES = {"rms": np.float64, "spectral_flatness": np.float64,
+                  "zcr": np.float64, "duration_s": np.float32}
+CATEGORICAL_COLUMNS = ["species_folder", "classification"]
+
+# Text formatting of the float columns in the CSV variant
+CSV_FLOAT_FORMATS = {
+    "rms": "{:.6f}", "spectral_flatness": "{:.6f}",
+    "zcr": "{:.6f}", "duration_s": "{:.2f}",
+}
 
 
 def extract_features(audio_path, sr: int = SAMPLE_RATE) -> Optional[dict]:
@@ -26,6 +64,14 @@ def extract_features(audio_path, sr: int = SAMPLE_RATE) -> Optional[dict]:
     except Exception as e:
         return None
 
+    return extract_features_from_array(y, sr)
+
+
+def extract_features_from_array(y: np.ndarray, sr: int = SAMPLE_RATE) -> dict:
+    """
+    Extract the same features as extract_features() from an in-memory
+    mono segment (e.g. a window sliced from an already-decoded recording).
+    """
     rms = float(np.sqrt(np.mean(y ** 2)))
     flatness_frames = librosa.feature.spectral_flatness(y=y)
     spectral_flatness = float(np.mean(flatness_frames))
@@ -40,12 +86,160 @@ def extract_features(audio_path, sr: int = SAMPLE_RATE) -> Optional[dict]:
     }
 
 
+def extract_features_batch(segments, sr: int = SAMPLE_RATE,
+                           batch_size: int = FEATURE_BATCH_SIZE) -> dict:
+    """
+    Vectorized extract_features_from_array() over many windows at once.
+
+    Spectral flatness and ZCR share one padded framing per batch; the STFT
+    runs as a single multi-threaded FFT and every reduction is along the
+    sample/frame axes. Results match the per-file path to float32 rounding.
+
+    Args:
+        segments: 2D array (n_segments, n_samples), or a list of 1D arrays
+                  (windows of different lengths are grouped internally).
+        sr: Sample rate of the windows.
+        batch_size: Windows per vectorized chunk (bounds peak memory).
+
+    Returns:
+        dict of 1D float arrays aligned with the input order, keyed like
+        extract_features(): rms, spectral_flatness, zcr, duration_s.
+    """
+    if isinstance(segments, np.ndarray) and segments.ndim == 2:
+        groups = {segments.shape[1]: (np.arange(len(segments)), segments)}
+        n_total = len(segments)
+    else:
+        by_length = {}
+        for idx, y in enumerate(segments):
+            by_length.setdefault(len(y), []).append(idx)
+        groups = {
+            length: (np.array(idxs), np.stack([segments[i] for i in idxs]))
+            for length, idxs in by_length.items()
+        }
+        n_total = len(segments)
+
+    out = {key: np.empty(n_total, dtype=np.float64)
+           for key in ("rms", "spectral_flatness", "zcr", "duration_s")}
+
+    for length, (idxs, stacked) in groups.items():
+        stacked = stacked.astype(np.float32, copy=False)
+        for start in range(0, len(stacked), batch_size):
+            chunk = stacked[start:start + batch_size]
+            rows = idxs[start:start + batch_size]
+            out["rms"][rows] = np.sqrt(np.mean(chunk ** 2, axis=1))
+            flatness, zcr = _flatness_and_zcr(chunk)
+            out["spectral_flatness"][rows] = flatness
+            out["zcr"][rows] = zcr
+            out["duration_s"][rows] = length / sr
+
+    return out
+
+
+def _flatness_and_zcr(chunk: np.ndarray) -> tuple:
+    """Mean spectral flatness and mean ZCR per row of a (n, samples) chunk."""
+    half = FRAME_LENGTH // 2
+    n_frames = 1 + chunk.shape[1] // HOP_LENGTH
+    starts = np.arange(n_frames) * HOP_LENGTH
+
+    # Spectral flatness: centered STFT (zero padding), power spectrum
+    padded = np.pad(chunk, ((0, 0), (half, half)), mode="constant")
+    frames = np.lib.stride_tricks.sliding_window_view(
+        padded, FRAME_LENGTH, axis=1)[:, starts]
+    window = scipy.signal.get_window("hann", FRAME_LENGTH, fftbins=True)
+    spec = scipy.fft.rfft(frames * window.astype(np.float32), axis=-1, workers=-1)
+    power = spec.real ** 2 + spec.imag ** 2
+    np.maximum(power, 1e-10, out=power)
+    arith_mean = power.mean(axis=-1)
+    np.log(power, out=power)
+    flatness = np.exp(power.mean(axis=-1)) / arith_mean
+
+    # ZCR: centered frames (edge padding); count sign changes per frame
+    # from a running total instead of materializing the frames
+    padded = np.pad(chunk, ((0, 0), (half, half)), mode="edge")
+    padded[np.abs(padded) <= 1e-10] = 0
+    sign = np.signbit(padded)
+    crossings = np.zeros((len(chunk), padded.shape[1]), dtype=np.int32)
+    np.cumsum(sign[:, 1:] != sign[:, :-1], axis=1, out=crossings[:, 1:])
+    per_frame = crossings[:, starts + FRAME_LENGTH - 1] - crossings[:, starts]
+
+    return flatness.mean(axis=1), (per_frame / FRAME_LENGTH).mean(axis=1)
+
+
+def iter_features(audio_paths: list, sr: int = SAMPLE_RATE,
+                  batch_size: int = FEATURE_BATCH_SIZE,
+                  cache=None) -> Iterator[tuple]:
+    """
+    Load segments and extract their features in vectorized batches.
+
+    Args:
+        audio_paths: Segment files, in the order results should come back.
+        sr: Sample rate to load at.
+        batch_size: Files loaded per vectorized batch.
+        cache: Optional FeatureCache (scripts/_feature_cache.py); unchanged
+               files are served from it and never decoded.
+
+    Yields:
+        (audio_path, features) in input order; features is None when the
+        file cannot be loaded (same contract as extract_features()).
+    """
+    for start in range(0, len(audio_paths), batch_size):
+        batch_paths = audio_paths[start:start + batch_size]
+        cached = [cache.get(p) if cache is not None else None for p in batch_paths]
+        loaded = []
+        for audio_path, hit in zip(batch_paths, cached):
+            if hit is not None:
+                loaded.append(None)
+                continue
+            try:
+                y, _ = librosa.load(str(audio_path), sr=sr, mono=True)
+                loaded.append(y)
+            except Exception as e:
+                print(f"  [ERROR] Failed to load {Path(audio_path).name}: {e}")
+                loaded.append(None)
+
+        ok = [y for y in loaded if y is not None]
+        batch = extract_features_batch(ok, sr, batch_size) if ok else {}
+        results = []
+        k = 0
+        for audio_path, hit, y in zip(batch_paths, cached, loaded):
+            if hit is not None:
+                results.append((audio_path, hit))
+            elif y is None:
+                results.append((audio_path, None))
+            else:
+                results.append((audio_path,
+                                {key: float(vals[k]) for key, vals in batch.items()}))
+                k += 1
+
+        if cache is not None:
+            cache.put_many([r for r, y in zip(results, loaded) if y is not None])
+        yield from results
+
+
 def classify_segment(features: dict,
                      silence_rms: float = SILENCE_RMS_THRESHOLD,
                      noise_flatness: float = NOISE_FLATNESS_THRESHOLD,
                      noise_zcr: float = NOISE_ZCR_THRESHOLD) -> str:
     """
-    Classify a segment as 'bird', 'noise', or 'silence'.
+    Classify a segment as 'bird', 'noise', or 'silence' based on features.
+
+    Decision Logic:
+        1. If RMS energy < silence_rms → 'silence'
+        2. If spectral_flatness > noise_flatness AND zcr > noise_zcr → 'noise'
+        3. Otherwise → 'bird'
+
+    Args:
+        features: dict from extract_features().
+        silence_rms: RMS threshold below which = silence.
+        noise_flatness: Spectral flatness threshold above which = noise-like.
+        noise_zcr: ZCR threshold above which (combined with flatness) = noise.
+
+    Returns:
+        Classification label: 'bird', 'noise', or 'silence'.
+
+    WARNING: The default thresholds are STARTING POINTS. You MUST tune
+    them by listening to ~50-100 segments. This tuning is part of the
+    research contribution.
     """
     if features["rms"] < silence_rms:
         return "silence"
@@ -53,3 +247,272 @@ def classify_segment(features: dict,
         return "noise"
     else:
         return "bird"
+
+
+def classification_row(species_folder: str, audio_path: Path,
+                       features: dict, label: str) -> dict:
+    """One segment as a classifications row (features kept as floats)."""
+    return {
+        "species_folder": species_folder,
+        "filename": audio_path.name,
+        "filepath": str(audio_path),
+        "rms": features["rms"],
+        "spectral_flatness": features["spectral_flatness"],
+        "zcr": features["zcr"],
+        "duration_s": features["duration_s"],
+        "classification": label,
+    }
+
+
+def write_classifications(rows: list, output_path: Path):
+    """Write classification rows; the format follows the file suffix."""
+    if Path(output_path).suffix.lower() == ".parquet":
+        write_classifications_parquet(rows, output_path)
+    else:
+        write_classifications_csv(rows, output_path)
+
+
+def write_classifications_csv(rows: list, output_csv: Path):
+    """Write classification rows (see classification_row) to CSV."""
+    output_csv.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_csv, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=CLASSIFICATION_FIELDNAMES)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({
+                k: CSV_FLOAT_FORMATS[k].format(v) if k in CSV_FLOAT_FORMATS else v
+                for k, v in row.items()
+            })
+
+
+def classifications_frame(rows: list) -> pd.DataFrame:
+    """Typed DataFrame: FEATURE_DTYPES features, categorical folder/label columns."""
+    df = pd.DataFrame(rows, columns=CLASSIFICATION_FIELDNAMES)
+    return _apply_classification_dtypes(df)
+
+
+def write_classifications_parquet(rows: list, output_path: Path):
+    """Write classification rows as a columnar Parquet file (needs pyarrow)."""
+    _require_pyarrow()
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    classifications_frame(rows).to_parquet(output_path, engine="pyarrow", index=False)
+
+
+class ClassificationWriter:
+    """
+    Streams classification rows to CSV or Parquet in flushed batches and
+    checkpoints after every completed species folder.
+
+    The checkpoint (<output>.checkpoint.json) records the finished folders,
+    their label counts and their error counts. With resume=True, rows from
+    finished folders are kept, anything written after the last checkpoint is
+    discarded, and `completed` / `completed_errors` tell the caller which
+    folders to skip and what they counted. A checkpoint written with
+    different run params (e.g. thresholds) is not resumed.
+
+    CSV output is appended in place (truncated back to the last checkpoint
+    on resume). Parquet cannot be appended, so each folder is streamed to
+    its own part file and the parts are merged into the output on close();
+    the parts are deleted once the merged file is in place. Resuming a
+    finished Parquet output copies it back in as the first part once new
+    rows arrive.
+    """
+
+    def __init__(self, output_path: Path, resume: bool = False,
+                 params: dict = None, flush_rows: int = STREAM_FLUSH_ROWS):
+        self.output_path = Path(output_path)
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        self.parquet = self.output_path.suffix.lower() == ".parquet"
+        self.checkpoint_path = self.output_path.with_name(
+            self.output_path.name + ".checkpoint.json")
+        self.parts_dir = self.output_path.with_name(self.output_path.name + ".parts")
+        self.flush_rows = flush_rows
+        self.rows_written = 0
+        self._buffer = []
+        self._new_rows = False
+
+        params = dict(params or {}, version=CLASSIFICATIONS_VERSION)
+        state = self._read_checkpoint() if resume else None
+        if state is not None and state.get("params", {}) != params:
+            print(f"  [WARN] {self.checkpoint_path.name} was written with "
+                  f"different parameters; starting over")
+            state = None
+        if state is None:
+            state = {"params": params, "completed": {}, "errors": {},
+                     "rows": 0, "bytes": 0, "finished": False}
+            self.checkpoint_path.unlink(missing_ok=True)
+            shutil.rmtree(self.parts_dir, ignore_errors=True)
+        self.state = state
+        self.completed = dict(state["completed"])
+        self.completed_errors = dict(state.get("errors", {}))
+
+        if self.parquet:
+            _require_pyarrow()
+            self._part_writer = None
+        else:
+            if state["bytes"] and self.output_path.is_file():
+                with open(self.output_path, "r+b") as f:
+                    f.truncate(state["bytes"])
+                mode = "a"
+            else:
+                mode = "w"
+            self._file = open(self.output_path, mode, newline="", encoding="utf-8")
+            self._csv = csv.DictWriter(self._file, fieldnames=CLASSIFICATION_FIELDNAMES)
+            if mode == "w":
+                self._csv.writeheader()
+
+    def _read_checkpoint(self) -> Optional[dict]:
+        if not self.checkpoint_path.is_file():
+            return None
+        if not self.parquet and not self.output_path.is_file():
+            return None
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def write(self, row: dict):
+        """Queue one row (see classification_row); flushes every flush_rows."""
+        self._buffer.append(row)
+        if len(self._buffer) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        """Push buffered rows to disk."""
+        if not self._buffer:
+            return
+        self._new_rows = True
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(classifications_frame(self._buffer),
+                                         preserve_index=False)
+            if self._part_writer is None:
+                self._open_parts()
+                part = self.parts_dir / f"part_{len(self.completed):05d}.parquet"
+                self._part_writer = pq.ParquetWriter(str(part), table.schema)
+            self._part_writer.write_table(table)
+        else:
+            for row in self._buffer:
+                self._csv.writerow({
+                    k: CSV_FLOAT_FORMATS[k].format(v) if k in CSV_FLOAT_FORMATS else v
+                    for k, v in row.items()
+                })
+            self._file.flush()
+        self.rows_written += len(self._buffer)
+        self._buffer = []
+
+    def complete_folder(self, folder: str, counts: dict, errors: int = 0):
+        """Flush, fsync and checkpoint a finished species folder."""
+        self.flush()
+        if self.parquet:
+            if self._part_writer is not None:
+                self._part_writer.close()
+                self._part_writer = None
+        else:
+            os.fsync(self._file.fileno())
+            self.state["bytes"] = self._file.tell()
+
+        self.completed[folder] = dict(counts)
+        self.completed_errors[folder] = int(errors)
+        self.state["completed"] = self.completed
+        self.state["errors"] = self.completed_errors
+        self.state["rows"] = self.state.get("rows", 0) + sum(counts.values())
+        self.state["finished"] = False
+        self._write_checkpoint()
+
+    def close(self):
+        """Finish the output (merging Parquet parts) and mark it finished."""
+        self.flush()
+        if self.parquet:
+            if self._part_writer is not None:
+                self._part_writer.close()
+                self._part_writer = None
+            if self._new_rows or not self.output_path.is_file():
+                self._merge_parts()
+        else:
+            self._file.close()
+
+        self.state["finished"] = True
+        self._write_checkpoint()
+
+    def _open_parts(self):
+        """Create the parts directory, seeded with an already merged output."""
+        self.parts_dir.mkdir(parents=True, exist_ok=True)
+        # The merged output holds every completed folder; merging drops the parts
+        if (self.completed and self.output_path.is_file()
+                and not any(self.parts_dir.glob("part_*.parquet"))):
+            shutil.copy2(self.output_path, self.parts_dir / "part_00000.parquet")
+
+    def _merge_parts(self):
+        import pyarrow.parquet as pq
+        parts = sorted(self.parts_dir.glob("part_*.parquet"))
+        tmp_path = self.output_path.with_name(self.output_path.name + ".tmp")
+        writer = None
+        for part in parts:
+            table = pq.read_table(str(part))
+            if writer is None:
+                writer = pq.ParquetWriter(str(tmp_path), table.schema)
+            writer.write_table(table)
+        if writer is None:
+            write_classifications_parquet([], tmp_path)
+        else:
+            writer.close()
+        os.replace(tmp_path, self.output_path)
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+
+    def _write_checkpoint(self):
+        tmp_path = self.checkpoint_path.with_name(self.checkpoint_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.checkpoint_path)
+
+
+def load_classifications_table(path: Path, columns: list = None) -> pd.DataFrame:
+    """
+    Load Stage 2 output (CSV or Parquet) with typed columns.
+
+    Args:
+        path: segment_classifications.csv or .parquet.
+        columns: Optional subset of columns to read (Parquet reads only these).
+    """
+    path = Path(path)
+    if path.suffix.lower() == ".parquet":
+        _require_pyarrow()
+        df = pd.read_parquet(path, engine="pyarrow", columns=columns)
+    else:
+        dtypes = dict(FEATURE_DTYPES)
+        dtypes.update({c: "category" for c in CATEGORICAL_COLUMNS})
+        dtypes.update({c: str for c in ("filename", "filepath")})
+        df = pd.read_csv(path, usecols=columns, dtype=dtypes)
+    return _apply_classification_dtypes(df)
+
+
+def resolve_classifications_path(path: Path) -> Path:
+    """Return path, or its .csv/.parquet sibling when only that one exists."""
+    path = Path(path)
+    if path.is_file():
+        return path
+    for suffix in (".parquet", ".csv"):
+        sibling = path.with_suffix(suffix)
+        if sibling.is_file():
+            return sibling
+    return path
+
+
+def _apply_classification_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    for col in FEATURE_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(FEATURE_DTYPES[col])
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError(
+            "Parquet output needs pyarrow. Run: pip install pyarrow "
+            "(or use a .csv output path)"
+        ) from None
@@ -0,0 +1,251 @@
+"""
+Shared loader for BirdNET detection CSVs.
+Importable by multiple scripts without circular dependencies.
+
+An experiment directory holds either BirdNET-Analyzer's per-recording
+result files (<species>/<file>.BirdNET.results.csv, often thousands) or one
+detections.csv from the in-process engine. When detections.csv exists only
+that file is read; the two layouts are never combined, so no detection is
+counted twice. load_experiment_detections() reads the files on a thread
+pool, normalizes the column names once, and stores the combined table as
+<experiment>/detections.parquet. The Parquet file is reused until any CSV
+is added, removed or modified (tracked by a manifest of relative paths,
+mtimes and sizes next to it), so later analysis runs open one file instead
+of thousands.
+
+Normalized columns (DETECTION_SCHEMA):
+    filepath, start, end, scientific_name, common_name, confidence,
+    source_file (CSV path relative to the experiment directory),
+    true_species (species folder the CSV sits in, or the parent folder
+    of filepath for experiment-level CSVs)
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from scripts._lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+# Bump when the normalization changes so stale consolidated files are rebuilt
+DETECTIONS_VERSION = 2
+
+DETECTION_SCHEMA = [
+    "filepath", "start", "end", "scientific_name", "common_name",
+    "confidence", "source_file", "true_species",
+]
+CATEGORICAL_COLUMNS = ["filepath", "scientific_name", "common_name",
+                       "source_file", "true_species"]
+
+# The two result layouts (see find_detection_csvs)
+EXPERIMENT_DETECTIONS_FILE = "detections.csv"
+BIRDNET_RESULTS_PATTERN = "*.BirdNET.results.csv"
+
+CONSOLIDATED_FILE = "detections.parquet"
+MANIFEST_FILE = "detections.parquet.manifest.json"
+DEFAULT_READ_WORKERS = min(16, (os.cpu_count() or 1) * 2)
+
+_warned_no_pyarrow = False
+
+
+# ============================================================
+# Schema
+# ============================================================
+
+def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Rename BirdNET's (slightly varying) output columns to DETECTION_SCHEMA names."""
+    col_map = {}
+    for col in df.columns:
+        lower = col.lower().strip()
+        if "scientific" in lower or lower == "species":
+            col_map[col] = "scientific_name"
+        elif "common" in lower:
+            col_map[col] = "common_name"
+        elif "confidence" in lower or "score" in lower:
+            col_map[col] = "confidence"
+        elif "start" in lower:
+            col_map[col] = "start"
+        elif "end" in lower:
+            col_map[col] = "end"
+        elif "file" in lower and "source" not in lower:
+            col_map[col] = "filepath"
+    return df.rename(columns=col_map)
+
+
+def find_detection_csvs(exp_dir: Path) -> list:
+    """
+    The result CSVs of one experiment, in exactly one layout.
+
+    [<exp_dir>/detections.csv] when the in-process engine wrote it,
+    otherwise every <exp_dir>/<species>/*.BirdNET.results.csv, sorted.
+    """
+    exp_dir = Path(exp_dir)
+    table = exp_dir / EXPERIMENT_DETECTIONS_FILE
+    if table.is_file():
+        return [table]
+    return sorted(p for p in exp_dir.glob(f"*/{BIRDNET_RESULTS_PATTERN}")
+                  if p.is_file())
+
+
+def csv_listing(exp_dir: Path, csv_files: list) -> list:
+    """[relative path, mtime_ns, size] for each CSV (the cache key)."""
+    listing = []
+    for csv_path in csv_files:
+        st = csv_path.stat()
+        listing.append([csv_path.relative_to(exp_dir).as_posix(),
+                        st.st_mtime_ns, st.st_size])
+    return listing
+
+
+# ============================================================
+# Reading
+# ============================================================
+
+def _read_one(csv_path: Path):
+    """One CSV with normalized column names, or None if unreadable or not detections."""
+    try:
+        df = normalize_columns(pd.read_csv(csv_path))
+    except Exception as e:
+        print(f"  [WARN] Failed to read {csv_path}: {e}")
+        return None
+    # e.g. BirdNET_analysis_params.csv
+    if "scientific_name" not in df.columns or "confidence" not in df.columns:
+        return None
+    return df
+
+
+def read_detection_csvs(csv_files: list, exp_dir: Path,
+                        workers: int = DEFAULT_READ_WORKERS) -> pd.DataFrame:
+    """Read and concatenate detection CSVs on a thread pool (DETECTION_SCHEMA columns)."""
+    exp_dir = Path(exp_dir)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        frames = list(pool.map(_read_one, csv_files))
+    kept = [(csv_path, df) for csv_path, df in zip(csv_files, frames)
+            if df is not None and not df.empty]
+
+    if not kept:
+        return _typed(pd.DataFrame(columns=DETECTION_SCHEMA))
+
+    # Per-file columns are added once after the concat, not per frame
+    combined = pd.concat([df for _, df in kept], ignore_index=True)
+    combined = combined.reindex(columns=DETECTION_SCHEMA)
+    rel = [csv_path.relative_to(exp_dir) for csv_path, _ in kept]
+    file_codes = np.repeat(np.arange(len(kept)), [len(df) for _, df in kept])
+    combined["source_file"] = pd.Categorical.from_codes(
+        file_codes, categories=[r.as_posix() for r in rel])
+    folders = np.array([r.parts[0] if len(r.parts) > 1 else None for r in rel],
+                       dtype=object)
+    combined["true_species"] = folders[file_codes]
+
+    # Experiment-level CSVs: ground truth is the folder of the recording
+    missing = combined["true_species"].isna() & combined["filepath"].notna()
+    if missing.any():
+        recordings = combined.loc[missing, "filepath"].astype(str).astype("category")
+        folders = np.array([Path(p).parent.name for p in recordings.cat.categories],
+                           dtype=object)
+        combined.loc[missing, "true_species"] = folders[recordings.cat.codes.to_numpy()]
+    return _typed(combined)
+
+
+def _typed(df: pd.DataFrame) -> pd.DataFrame:
+    """float start/end/confidence and categorical string columns."""
+    for col in ("start", "end", "confidence"):
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    for col in CATEGORICAL_COLUMNS:
+        df[col] = df[col].astype("category")
+    return df
+
+
+# ============================================================
+# Consolidated cache
+# ============================================================
+
+def _pyarrow_available() -> bool:
+    global _warned_no_pyarrow
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        if not _warned_no_pyarrow:
+            print("  [WARN] pyarrow not installed; detections are not cached "
+                  "(pip install pyarrow)")
+            _warned_no_pyarrow = True
+        return False
+
+
+def _read_manifest(exp_dir: Path):
+    try:
+        return json.loads((exp_dir / MANIFEST_FILE).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_consolidated(df: pd.DataFrame, exp_dir: Path, listing: list):
+    """Write the Parquet file and its manifest, each via an atomic rename."""
+    tmp = exp_dir / f"{CONSOLIDATED_FILE}.{os.getpid()}.tmp"
+    df.to_parquet(tmp, engine="pyarrow", index=False)
+    os.replace(tmp, exp_dir / CONSOLIDATED_FILE)
+
+    tmp = exp_dir / f"{MANIFEST_FILE}.{os.getpid()}.tmp"
+    tmp.write_text(json.dumps({"version": DETECTIONS_VERSION, "files": listing}))
+    os.replace(tmp, exp_dir / MANIFEST_FILE)
+
+
+def load_experiment_detections(exp_dir: Path, use_cache: bool = True,
+                               workers: int = DEFAULT_READ_WORKERS) -> pd.DataFrame:
+    """
+    All detections for one experiment directory (DETECTION_SCHEMA columns).
+
+    Serves <exp_dir>/detections.parquet when its manifest matches the
+    current CSVs; otherwise reads the CSVs and, with use_cache, rewrites it.
+    """
+    exp_dir = Path(exp_dir)
+    csv_files = find_detection_csvs(exp_dir)
+    listing = csv_listing(exp_dir, csv_files)
+    cached = exp_dir / CONSOLIDATED_FILE
+
+    can_cache = use_cache and _pyarrow_available()
+    if can_cache and cached.is_file():
+        manifest = _read_manifest(exp_dir)
+        if (manifest and manifest.get("version") == DETECTIONS_VERSION
+                and manifest.get("files") == listing):
+            try:
+                return pd.read_parquet(cached, engine="pyarrow")
+            except (OSError, ValueError):
+                pass  # truncated or corrupt: rebuild
+
+    df = read_detection_csvs(csv_files, exp_dir, workers)
+    if can_cache and csv_files:
+        try:
+            _write_consolidated(df, exp_dir, listing)
+        except OSError as e:
+            print(f"  [WARN] Could not cache detections for {exp_dir.name}: {e}")
+    return df
+
+
+def load_all_detections(results_dir: Path, experiments: list = None,
+                        use_cache: bool = True,
+                        workers: int = DEFAULT_READ_WORKERS) -> dict:
+    """
+    {experiment: detections} for each experiment directory under results_dir.
+
+    experiments restricts (and orders) the directories loaded; by default
+    every subdirectory with at least one CSV is used.
+    """
+    results_dir = Path(results_dir)
+    if experiments is None:
+        experiments = sorted(d.name for d in results_dir.iterdir() if d.is_dir())
+    data = {}
+    for exp_name in experiments:
+        exp_dir = results_dir / exp_name
+        if exp_dir.is_dir():
+            data[exp_name] = load_experiment_detections(exp_dir, use_cache, workers)
+    return data
@@ -0,0 +1,108 @@
+"""
+Persistent feature store for segment classification.
+Importable by multiple scripts without circular dependencies.
+
+Features are keyed by segment path + mtime + size, plus the extraction
+parameters, in a single SQLite file. A segment is only re-read when it is
+new, modified, or the parameters changed.
+"""
+
+import os
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from configs.config import SAMPLE_RATE
+from scripts._classify_lib import FRAME_LENGTH, HOP_LENGTH
+
+# Bump when the feature definitions change so stale rows stop matching
+FEATURE_VERSION = 1
+
+FEATURE_KEYS = ("rms", "spectral_flatness", "zcr", "duration_s")
+
+
+def feature_params_key(sr: int = SAMPLE_RATE) -> str:
+    """String identifying every parameter that affects the stored values."""
+    return (f"v={FEATURE_VERSION};sr={sr};"
+            f"frame={FRAME_LENGTH};hop={HOP_LENGTH}")
+
+
+class FeatureCache:
+    """SQLite-backed cache of extract_features() results."""
+
+    def __init__(self, db_path: Path, sr: int = SAMPLE_RATE):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.params = feature_params_key(sr)
+        self.hits = 0
+        self.misses = 0
+
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS features ("
+            " path TEXT NOT NULL, params TEXT NOT NULL,"
+            " mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL,"
+            " rms REAL, spectral_flatness REAL, zcr REAL, duration_s REAL,"
+            " PRIMARY KEY (path, params))"
+        )
+        self.conn.commit()
+
+        # One scan per run; lookups are then dictionary hits
+        cursor = self.conn.execute(
+            "SELECT path, mtime_ns, size, rms, spectral_flatness, zcr, duration_s "
+            "FROM features WHERE params = ?", (self.params,)
+        )
+        self._rows = {row[0]: row[1:] for row in cursor}
+
+    @staticmethod
+    def _stamp(audio_path) -> Optional[tuple]:
+        try:
+            st = os.stat(audio_path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def get(self, audio_path) -> Optional[dict]:
+        """Cached features for an unchanged file, else None (counts a miss)."""
+        row = self._rows.get(os.path.abspath(audio_path))
+        stamp = self._stamp(audio_path)
+        if row is not None and stamp is not None and row[:2] == stamp:
+            self.hits += 1
+            return dict(zip(FEATURE_KEYS, row[2:]))
+        self.misses += 1
+        return None
+
+    def put_many(self, items: list):
+        """Store [(audio_path, features), ...] in one transaction."""
+        records = []
+        for audio_path, features in items:
+            stamp = self._stamp(audio_path)
+            if stamp is None or features is None:
+                continue
+            key = os.path.abspath(audio_path)
+            values = tuple(features[k] for k in FEATURE_KEYS)
+            self._rows[key] = stamp + values
+            records.append((key, self.params) + stamp + values)
+
+        if records:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                records,
+            )
+            self.conn.commit()
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = 100 * self.hits / total if total else 0.0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate)"
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,416 @@
+"""
+Standalone BirdNET .tflite inference functions.
+Importable by multiple scripts without circular dependencies.
+
+BirdClassifier wraps one TFLite interpreter (used by live recognition and
+the in-process evaluation engine); run_inference() evaluates a directory
+of recordings in-process and returns one detections table in the
+BirdNET-Analyzer CSV schema that 06_analyze_results.py reads.
+run_inference_multi() scores several classifiers from a single decode
+pass.
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from configs.config import (
+    SAMPLE_RATE, SEGMENT_LENGTH, SEGMENT_SAMPLES, SPECIES_COMMON_NAMES,
+    MIN_CONFIDENCE, AUDIO_CACHE_DIR,
+)
+from scripts._audio_cache import load_audio
+from scripts._lazy import lazy_import
+
+pd = lazy_import("pandas")
+tf = lazy_import("tensorflow")
+
+
+SEGMENT_DURATION = SEGMENT_LENGTH
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg")
+INFERENCE_BATCH_SIZE = 16   # windows per interpreter invoke
+MIN_WINDOW_SECONDS = 1.0    # BirdNET drops trailing chunks shorter than this
+SIGMOID_SENSITIVITY = 1.0   # BirdNET-Analyzer default
+
+# Column names of BirdNET-Analyzer's CSV output
+DETECTION_COLUMNS = [
+    "Start (s)", "End (s)", "Scientific name", "Common name",
+    "Confidence", "File",
+]
+
+
+BASE_MODEL_DIR = Path("checkpoints") / "V2.4"   # inside the birdnet_analyzer package
+BASE_MODEL_FILE = "BirdNET_GLOBAL_6K_V2.4_Model_FP32.tflite"
+BASE_LABELS_FILE = "BirdNET_GLOBAL_6K_V2.4_Labels.txt"
+
+
+def find_base_model() -> tuple:
+    """
+    (model_path, labels_path) of the pre-trained BirdNET model shipped with
+    birdnet_analyzer, or None if the package or checkpoint is missing.
+    """
+    import importlib.util
+    spec = importlib.util.find_spec("birdnet_analyzer")
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    model_dir = Path(list(spec.submodule_search_locations)[0]) / BASE_MODEL_DIR
+    model_path = model_dir / BASE_MODEL_FILE
+    labels_path = model_dir / BASE_LABELS_FILE
+    if not (model_path.is_file() and labels_path.is_file()):
+        return None
+    return model_path, labels_path
+
+
+def flat_sigmoid(x: np.ndarray, sensitivity: float = SIGMOID_SENSITIVITY) -> np.ndarray:
+    """BirdNET's output activation: logits -> confidences in [0, 1]."""
+    return 1.0 / (1.0 + np.exp(-sensitivity * np.clip(x, -15, 15)))
+
+
+def split_label(label: str) -> tuple:
+    """
+    (scientific_name, common_name) for a label line.
+
+    BirdNET's own labels are "Scientific_Common"; custom classifiers trained
+    on this project's folders use the bare scientific name.
+    """
+    sci, sep, common = label.partition("_")
+    if not sep:
+        common = SPECIES_COMMON_NAMES.get(sci, sci)
+    return sci, common
+
+
+class BirdClassifier:
+    """
+    Wraps a fine-tuned BirdNET .tflite model for inference.
+
+    The input is fixed at (1, SEGMENT_SAMPLES) and tensors are allocated
+    once at construction; predict() writes each chunk straight into the
+    interpreter's input buffer instead of resizing and reallocating.
+    predict_batch() runs n windows in one invoke, reallocating only when
+    the batch size changes.
+
+    Args:
+        model_path: Path to the .tflite model.
+        labels_path: Label file (default: <model stem>_Labels.txt).
+        sigmoid: Apply BirdNET's flat sigmoid to the raw outputs (needed
+            for the base model and classifiers trained by birdnet_analyzer,
+            which emit logits).
+        num_threads: Interpreter threads (default: TFLite's choice).
+    """
+
+    def __init__(self, model_path: str, labels_path: str = None,
+                 sigmoid: bool = False, num_threads: int = None):
+        self.interpreter = tf.lite.Interpreter(model_path=str(model_path),
+                                               num_threads=num_threads)
+        self.sigmoid = sigmoid
+
+        self.input_details = self.interpreter.get_input_details()
+        self.output_details = self.interpreter.get_output_details()
+        self.input_index = self.input_details[0]["index"]
+        self.output_index = self.output_details[0]["index"]
+
+        self.batch_size = 0
+        self._set_batch_size(1)
+
+        # Load labels (same name as model, with _Labels.txt)
+        if labels_path is None:
+            labels_path = Path(model_path).with_name(
+                Path(model_path).stem + "_Labels.txt"
+            )
+        label_path = Path(labels_path)
+        if not label_path.exists():
+            raise FileNotFoundError(f"Label file not found: {label_path}")
+
+        self.labels = []
+        self.common_names = {}
+        for line in label_path.read_text().strip().splitlines():
+            sci, common = split_label(line.strip())
+            self.labels.append(sci)
+            self.common_names[sci] = common
+
+    def _set_batch_size(self, n: int):
+        """Resize the input to (n, SEGMENT_SAMPLES) if it isn't already."""
+        if n != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input_index, (n, SEGMENT_SAMPLES))
+            self.interpreter.allocate_tensors()
+            self.batch_size = n
+
+    def scores(self, audio: np.ndarray) -> np.ndarray:
+        """
+        Run inference on a 3-second audio chunk and return raw scores.
+
+        Shorter chunks are zero-padded, longer ones truncated.
+        """
+        return self.scores_batch(audio[np.newaxis, :SEGMENT_SAMPLES])[0]
+
+    def scores_batch(self, windows: np.ndarray) -> np.ndarray:
+        """
+        Run inference on n windows in a single invoke.
+
+        Args:
+            windows: array of shape (n, <=144000); short windows are zero-padded.
+
+        Returns:
+            float32 array of shape (n, n_labels).
+        """
+        n, width = windows.shape
+        width = min(width, SEGMENT_SAMPLES)
+        self._set_batch_size(n)
+        # interpreter.tensor() returns a view of the input buffer; it must
+        # not outlive this statement or invoke() refuses to run.
+        self.interpreter.tensor(self.input_index)()[:, :width] = windows[:, :width]
+        if width < SEGMENT_SAMPLES:
+            self.interpreter.tensor(self.input_index)()[:, width:] = 0.0
+        self.interpreter.invoke()
+        scores = self.interpreter.get_tensor(self.output_index)
+        return flat_sigmoid(scores) if self.sigmoid else scores
+
+    def predict(self, audio: np.ndarray, top_k: int = None) -> list:
+        """
+        Run inference on a 3-second audio chunk.
+
+        Args:
+            audio: float32 array of shape (144000,) — 3s at 48kHz mono
+            top_k: Only return the k best species (default: all).
+
+        Returns:
+            List of (scientific_name, common_name, confidence) sorted by confidence desc
+        """
+        return self.top_predictions(self.scores(audio), top_k)
+
+    def predict_batch(self, windows: np.ndarray, top_k: int = None) -> list:
+        """predict() for n windows of shape (n, 144000) in one invoke."""
+        return [self.top_predictions(row, top_k)
+                for row in self.scores_batch(windows)]
+
+    def top_predictions(self, scores: np.ndarray, top_k: int = None) -> list:
+        """(scientific_name, common_name, confidence) for the top_k scores."""
+        if top_k is None or top_k >= len(scores):
+            order = np.argsort(scores)[::-1]
+        else:
+            top = np.argpartition(scores, -top_k)[-top_k:]
+            order = top[np.argsort(scores[top])[::-1]]
+
+        results = []
+        for idx in order:
+            sp = self.labels[idx]
+            results.append((sp, self.common_names[sp], float(scores[idx])))
+        return results
+
+
+def frame_windows(y: np.ndarray, hop: int) -> np.ndarray:
+    """
+    Split a signal into overlapping SEGMENT_SAMPLES windows every `hop`
+    samples; the tail is zero-padded into a final window.
+
+    Returns a read-only view of shape (n, SEGMENT_SAMPLES) when no padding
+    is needed.
+    """
+    n_windows = max(1, -(-(len(y) - SEGMENT_SAMPLES) // hop) + 1)
+    needed = (n_windows - 1) * hop + SEGMENT_SAMPLES
+    if len(y) < needed:
+        y = np.pad(y, (0, needed - len(y)))
+    return np.lib.stride_tricks.sliding_window_view(y, SEGMENT_SAMPLES)[::hop]
+
+
+def file_windows(y: np.ndarray, hop: int,
+                 min_seconds: float = MIN_WINDOW_SECONDS) -> np.ndarray:
+    """frame_windows() minus a trailing window with < min_seconds of audio."""
+    windows = frame_windows(y, hop)
+    min_samples = int(min_seconds * SAMPLE_RATE)
+    if len(windows) > 1 and len(y) - (len(windows) - 1) * hop < min_samples:
+        windows = windows[:-1]
+    return windows
+
+
+def list_test_files(test_dir: Path) -> list:
+    """All audio files under test_dir (recursively), sorted."""
+    return sorted(
+        f for f in Path(test_dir).rglob("*")
+        if f.is_file() and f.suffix.lower() in AUDIO_EXTENSIONS
+    )
+
+
+def decode_audio(path: Path, sr: int = SAMPLE_RATE,
+                 cache_dir: Path = AUDIO_CACHE_DIR) -> np.ndarray:
+    """
+    Decode and resample one recording to float32 mono; None on failure.
+
+    With cache_dir set the result comes from the decoded-audio cache (a
+    read-only memory map) and is only decoded on a miss.
+    """
+    try:
+        y = load_audio(path, sr=sr, cache_dir=cache_dir)
+    except Exception as e:
+        print(f"  [WARN] Could not decode {path}: {e}")
+        return None
+    return y.astype(np.float32, copy=False)
+
+
+def iter_decoded(paths: list, workers: int = 2, prefetch: int = 4,
+                 cache_dir: Path = AUDIO_CACHE_DIR):
+    """
+    Yield (path, audio) in input order while later files decode in a
+    thread pool (at most `prefetch` files ahead).
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = deque()
+        it = iter(paths)
+        for path in it:
+            pending.append((path, pool.submit(decode_audio, path,
+                                              cache_dir=cache_dir)))
+            if len(pending) >= prefetch:
+                break
+        while pending:
+            path, future = pending.popleft()
+            nxt = next(it, None)
+            if nxt is not None:
+                pending.append((nxt, pool.submit(decode_audio, nxt,
+                                                 cache_dir=cache_dir)))
+            yield path, future.result()
+
+
+def iter_window_batches(decoded, hop: int, batch_size: int = INFERENCE_BATCH_SIZE):
+    """
+    Pack windows from consecutive files into fixed-size batches.
+
+    Yields (windows[n, SEGMENT_SAMPLES], files, starts_s) where files[i] and
+    starts_s[i] locate window i; a batch may span several recordings.
+    """
+    batch = np.empty((batch_size, SEGMENT_SAMPLES), dtype=np.float32)
+    files, starts, n = [], [], 0
+    for path, y in decoded:
+        if y is None or len(y) == 0:
+            continue
+        windows = file_windows(y, hop)
+        for i in range(len(windows)):
+            batch[n] = windows[i]
+            files.append(str(path))
+            starts.append(i * hop / SAMPLE_RATE)
+            n += 1
+            if n == batch_size:
+                yield batch, files, starts
+                batch = np.empty((batch_size, SEGMENT_SAMPLES), dtype=np.float32)
+                files, starts, n = [], [], 0
+    if n:
+        yield batch[:n], files, starts
+
+
+def _detection_rows(clf: BirdClassifier, scores: np.ndarray, files: list,
+                    starts: list, min_conf: float) -> list:
+    """One DETECTION_COLUMNS tuple per (window, species) score >= min_conf."""
+    rows, cols = np.nonzero(scores >= min_conf)
+    return [
+        (starts[r], starts[r] + SEGMENT_DURATION, clf.labels[c],
+         clf.common_names[clf.labels[c]], round(float(scores[r, c]), 4), files[r])
+        for r, c in zip(rows, cols)
+    ]
+
+
+def _detections_frame(detections: list) -> pd.DataFrame:
+    """Detection tuples -> DataFrame ordered by file, start, confidence desc."""
+    table = pd.DataFrame(detections, columns=DETECTION_COLUMNS)
+    return table.sort_values(["File", "Start (s)", "Confidence"],
+                             ascending=[True, True, False], kind="stable",
+                             ignore_index=True)
+
+
+def run_inference_multi(models: dict, audio_files: list, overlap: float = 0.0,
+                        min_conf: float = MIN_CONFIDENCE,
+                        batch_size: int = INFERENCE_BATCH_SIZE,
+                        threads: int = 1, decode_workers: int = 2,
+                        audio_cache: Path = AUDIO_CACHE_DIR) -> dict:
+    """
+    Evaluate several classifiers on the same recordings in one pass.
+
+    Each file is decoded and windowed once; every window batch is then
+    scored by every model. Batches are scored by `threads` worker threads,
+    each holding one interpreter per model.
+
+    Args:
+        models: {name: {"model_path": ..., "labels_path": ..., "sigmoid": ...}};
+            labels_path and sigmoid are optional (default: None, True).
+        audio_cache: Decoded-audio cache directory (None decodes every file).
+
+    Returns:
+        {name: DataFrame with DETECTION_COLUMNS}, ordered by file, start
+        time and descending confidence.
+    """
+    hop = SEGMENT_SAMPLES - int(overlap * SAMPLE_RATE)
+    local = threading.local()
+
+    def classifier(name):
+        cache = getattr(local, "classifiers", None)
+        if cache is None:
+            cache = local.classifiers = {}
+        if name not in cache:
+            spec = models[name]
+            cache[name] = BirdClassifier(
+                spec["model_path"], spec.get("labels_path"),
+                sigmoid=spec.get("sigmoid", True),
+                num_threads=1 if threads > 1 else None)
+        return cache[name]
+
+    def score(windows, files, starts):
+        rows = {}
+        for name in models:
+            clf = classifier(name)
+            rows[name] = _detection_rows(clf, clf.scores_batch(windows),
+                                         files, starts, min_conf)
+        return rows
+
+    detections = {name: [] for name in models}
+
+    def collect(future):
+        for name, rows in future.result().items():
+            detections[name].extend(rows)
+
+    decoded = iter_decoded(audio_files, workers=decode_workers,
+                           cache_dir=audio_cache)
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+        in_flight = deque()
+        for batch in iter_window_batches(decoded, hop, batch_size):
+            in_flight.append(pool.submit(score, *batch))
+            if len(in_flight) >= 2 * max(1, threads):
+                collect(in_flight.popleft())
+        while in_flight:
+            collect(in_flight.popleft())
+
+    return {name: _detections_frame(rows) for name, rows in detections.items()}
+
+
+def run_inference(model_path, audio_files: list, labels_path=None,
+                  sigmoid: bool = True, overlap: float = 0.0,
+                  min_conf: float = MIN_CONFIDENCE,
+                  batch_size: int = INFERENCE_BATCH_SIZE,
+                  threads: int = 1, decode_workers: int = 2,
+                  audio_cache: Path = AUDIO_CACHE_DIR) -> pd.DataFrame:
+    """
+    Evaluate one classifier on a list of recordings, in-process.
+
+    Files are decoded in a background thread pool, their windows packed
+    into batches across file boundaries, and batches scored by `threads`
+    worker threads with one interpreter each. Every (window, species)
+    score >= min_conf becomes one detection row.
+
+    Returns:
+        DataFrame with DETECTION_COLUMNS, ordered by file, start time and
+        descending confidence.
+    """
+    models = {"model": {"model_path": model_path, "labels_path": labels_path,
+                        "sigmoid": sigmoid}}
+    return run_inference_multi(models, audio_files, overlap, min_conf,
+                               batch_size, threads, decode_workers,
+                               audio_cache)["model"]
+
+
+def write_detections(table: pd.DataFrame, output_path: Path):
+    """Write a detections table as CSV (BirdNET-Analyzer column names)."""
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    table.to_csv(output_path, index=False)
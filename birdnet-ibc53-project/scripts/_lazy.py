@@ -0,0 +1,87 @@
+"""
+Deferred imports for heavy dependencies.
+Importable by multiple scripts without circular dependencies.
+
+    librosa = lazy_import("librosa")
+    plt = lazy_pyplot()
+
+binds a placeholder module that performs the real import on first
+attribute access, so `--help`, `--list-devices` and other cheap code paths
+never pay for librosa, pandas, matplotlib or TensorFlow. After loading,
+the real module's namespace is copied onto the placeholder, so later
+attribute lookups cost the same as on the real module.
+
+Modules that use a lazy module in annotations (e.g. `-> pd.DataFrame`)
+need `from __future__ import annotations`, or the annotation itself
+triggers the import.
+"""
+
+import importlib
+import threading
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Placeholder that imports `name` (plus submodules) when first used."""
+
+    def __init__(self, name: str, submodules: tuple = (), pre_import=None):
+        super().__init__(name)
+        self.__dict__["_lazy_submodules"] = tuple(submodules)
+        self.__dict__["_lazy_pre_import"] = pre_import
+        self.__dict__["_lazy_module"] = None
+        self.__dict__["_lazy_lock"] = threading.Lock()
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__["_lazy_module"]
+        if module is not None:
+            return module
+        with self.__dict__["_lazy_lock"]:
+            module = self.__dict__["_lazy_module"]
+            if module is None:
+                pre_import = self.__dict__["_lazy_pre_import"]
+                if pre_import is not None:
+                    pre_import()
+                module = importlib.import_module(self.__name__)
+                for sub in self.__dict__["_lazy_submodules"]:
+                    importlib.import_module(f"{self.__name__}.{sub}")
+                self.__dict__.update(module.__dict__)
+                self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attr: str):
+        # Only reached for names not (yet) copied from the real module
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_lazy_module"] is not None else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+def lazy_import(name: str, submodules: tuple = (), pre_import=None) -> LazyModule:
+    """
+    Module placeholder for `name`, imported on first attribute access.
+
+    Args:
+        name: Dotted module name, e.g. "librosa" or "matplotlib.ticker".
+        submodules: Submodules imported along with it, e.g. ("fft", "signal")
+            for `scipy.fft.rfft`-style access.
+        pre_import: Called once just before the import.
+    """
+    return LazyModule(name, submodules, pre_import)
+
+
+def _use_backend(backend: str):
+    importlib.import_module("matplotlib").use(backend)
+
+
+def lazy_pyplot(backend: str = "Agg") -> LazyModule:
+    """matplotlib.pyplot, selecting `backend` before pyplot is first imported."""
+    return lazy_import("matplotlib.pyplot", pre_import=lambda: _use_backend(backend))
+
+
+def is_loaded(module) -> bool:
+    """False for a LazyModule that has not been imported yet."""
+    return not isinstance(module, LazyModule) or module.__dict__["_lazy_module"] is not None
@@ -11,4 +11,6 @@ sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 from scripts import _classify_lib as _lib
 
 extract_features = _lib.extract_features
+extract_features_batch = _lib.extract_features_batch
+iter_features = _lib.iter_features
 classify_segment = _lib.classify_segment